@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from measure import run_measured
+from synthetic import SIZES, write_folder, write_scan
+
+# Metrics of every benchmark, printed at the end of the session
+measurements: list[dict] = []
+
+
+def pytest_addoption(parser: pytest.Parser):
+    parser.addoption(
+        "--bench-size",
+        action="append",
+        choices=list(SIZES),
+        help="Size of synthetic scans to benchmark, may be given several times "
+        "(default: realistic)",
+    )
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc):
+    if "size_name" in metafunc.fixturenames:
+        sizes = metafunc.config.getoption("bench_size") or ["realistic"]
+        metafunc.parametrize("size_name", sizes, scope="session")
+
+
+@pytest.fixture(scope="session")
+def scan_files(tmp_path_factory: pytest.TempPathFactory):
+    """Factory returning the path of a synthetic scan, written on first use"""
+    folder = tmp_path_factory.mktemp("scans")
+    written: dict[tuple, Path] = {}
+
+    def _scan(scan_type: str, layout_new: bool, size_name: str) -> Path:
+        key = (scan_type, layout_new, size_name)
+        if key not in written:
+            layout = "new" if layout_new else "old"
+            path = folder / f"{scan_type}_{layout}_{size_name}.nxs"
+            write_scan(path, scan_type, layout_new, SIZES[size_name])
+            written[key] = path
+        return written[key]
+
+    return _scan
+
+
+@pytest.fixture(scope="session")
+def scan_folder(tmp_path_factory: pytest.TempPathFactory):
+    """Factory returning a folder of synthetic scans, written on first use"""
+    written: dict[str, Path] = {}
+
+    def _folder(size_name: str) -> Path:
+        if size_name not in written:
+            folder = tmp_path_factory.mktemp(f"folder_{size_name}")
+            write_folder(folder, SIZES[size_name])
+            written[size_name] = folder
+        return written[size_name]
+
+    return _folder
+
+
+@pytest.fixture(scope="session")
+def import_rss() -> int:
+    """Peak RSS of an interpreter that has imported the converter, to be
+    subtracted from the peak RSS of a conversion"""
+    _, rss = run_measured(
+        [sys.executable, "-c", "import B07nxs2txt.converter, B07nxs2txt._writers"]
+    )
+    return rss
+
+
+@pytest.fixture
+def record(benchmark, request: pytest.FixtureRequest):
+    """Stores metrics in the benchmark JSON (``--benchmark-json``) and in the
+    summary printed at the end of the session"""
+
+    def _record(**metrics):
+        benchmark.extra_info.update(metrics)
+        measurements.append({"name": request.node.name, **metrics})
+
+    return _record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not measurements:
+        return
+    columns = ("latency_ms", "files_per_s", "mb_per_s", "peak_rss_mb", "rss_mb")
+    width = max(len(m["name"]) for m in measurements)
+    terminalreporter.section("conversion throughput and memory")
+    terminalreporter.line("name".ljust(width) + "".join(c.rjust(13) for c in columns))
+    for m in measurements:
+        values = "".join((f"{m[c]:.1f}" if c in m else "-").rjust(13) for c in columns)
+        terminalreporter.line(m["name"].ljust(width) + values)
+    terminalreporter.line(
+        "rss_mb is the peak RSS above that of importing the converter"
+    )
@@ -0,0 +1,35 @@
+"""Measuring the time and memory used by a command."""
+
+import subprocess
+import sys
+
+MB = 1 << 20
+
+# On Linux a process inherits the peak RSS of the one it was forked from, so
+# the command is started from a small interpreter rather than from pytest,
+# which reports its wall time and the peak RSS (in KiB) of the command's tree
+LAUNCHER = """\
+import os, sys, time
+start = time.perf_counter()
+pid = os.posix_spawnp(
+    sys.argv[1],
+    sys.argv[1:],
+    os.environ,
+    file_actions=[(os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0)],
+)
+_, status, usage = os.wait4(pid, 0)
+print(time.perf_counter() - start, usage.ru_maxrss)
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
+
+
+def run_measured(args: list[str]) -> tuple[float, int]:
+    """Runs a command, returning its wall time and the peak RSS in bytes of
+    the largest process in its tree"""
+    process = subprocess.run(
+        [sys.executable, "-c", LAUNCHER, *args], stdout=subprocess.PIPE, text=True
+    )
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args)
+    elapsed, maxrss = process.stdout.split()
+    return float(elapsed), int(maxrss) * 1024
@@ -0,0 +1,154 @@
+"""Synthetic GDA NeXus files in the old (``/entry1/instrument``) and new
+(``/entry/instrument`` + ``diamond_scan/scan_fields``) layouts.
+
+Run as a script to write a folder of them for manual profiling::
+
+    python benchmarks/synthetic.py /tmp/scans --size extreme
+"""
+
+import argparse
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+SCAN_TYPES = ("XPS", "NEXAFS", "NEXAFS_ANALYSER", "XY_DATA")
+CURRENTS = ("ca11b", "ca12b", "ca13b", "ca14b", "ca15b", "femto1")
+
+
+@dataclass(frozen=True)
+class Size:
+    """Dimensions of the synthetic scans"""
+
+    points: int  # scan points of NEXAFS and XY scans
+    energies: int  # analyser energy channels of XPS regions
+    regions: int  # XPS regions
+    sweeps: int  # XPS sweeps per region
+    extra_scannables: int  # unexported metadata groups, as in real files
+    folder_files: int  # files in a folder benchmark
+
+
+SIZES = {
+    "realistic": Size(
+        points=2_000,
+        energies=1_000,
+        regions=5,
+        sweeps=10,
+        extra_scannables=60,
+        folder_files=40,
+    ),
+    "extreme": Size(
+        points=1_000_000,
+        energies=100_000,
+        regions=4,
+        sweeps=100,
+        extra_scannables=300,
+        folder_files=1_000,
+    ),
+}
+
+
+def _write_scannable(instrument: h5py.Group, name: str, values, layout_new: bool):
+    # GDA writes extensible, hence chunked, datasets for scan data
+    instrument.require_group(name).create_dataset(
+        "value" if layout_new else name, data=values, chunks=True
+    )
+
+
+def write_scan(
+    path: str | os.PathLike,
+    scan_type: str,
+    layout_new: bool,
+    size: Size,
+    seed: int = 0,
+):
+    """Writes a synthetic scan of the given type, one of :data:`SCAN_TYPES`"""
+    rng = np.random.default_rng(seed)
+    with h5py.File(path, "w") as f:
+        entry = f.create_group("entry" if layout_new else "entry1")
+        instrument = entry.create_group("instrument")
+        fields: list[str] = []
+
+        for index in range(size.extra_scannables):
+            name = f"s{index}_pos"
+            _write_scannable(instrument, name, rng.random(1), layout_new)
+
+        if scan_type in ("NEXAFS", "NEXAFS_ANALYSER", "XY_DATA"):
+            axis = "sm21b_x" if scan_type == "XY_DATA" else "pgm_energy"
+            values = np.linspace(280.0, 320.0, size.points)
+            _write_scannable(instrument, axis, values, layout_new)
+            for current in CURRENTS:
+                signal = rng.normal(1e-9, 1e-11, size.points)
+                _write_scannable(instrument, current, signal, layout_new)
+            fields += [axis, *CURRENTS]
+
+        if scan_type == "NEXAFS_ANALYSER":
+            region = "Auger"
+            region_list = np.array([region.encode("utf-8")])
+            instrument.create_group("analyser").create_dataset(
+                "region_list",
+                data=region_list[np.newaxis, :] if layout_new else region_list,
+            )
+            counts = rng.poisson(1000, size.points).astype(np.float64)
+            _write_scannable(instrument, region, counts, layout_new)
+            fields.append("analyser")
+
+        if scan_type == "XPS":
+            regions = [f"Region{index}" for index in range(size.regions)]
+            region_list = np.array([name.encode("utf-8") for name in regions])
+            instrument.create_group("analyser").create_dataset(
+                "region_list",
+                data=region_list[np.newaxis, :] if layout_new else region_list,
+            )
+            energies = np.linspace(1200.0, 0.0, size.energies)
+            for name in regions:
+                region = instrument.create_group(name)
+                region.create_dataset(
+                    "binding_energy",
+                    data=energies[np.newaxis, :] if layout_new else energies,
+                )
+                total = np.zeros(size.energies)
+                for sweep in range(size.sweeps):
+                    counts = rng.poisson(100, size.energies).astype(np.float64)
+                    total += counts
+                    region.create_dataset(
+                        f"spectrum_{sweep + 1}", data=counts[np.newaxis, :]
+                    )
+                region.create_dataset("spectrum", data=total[np.newaxis, :])
+            fields.append("analyser")
+
+        if layout_new:
+            entry.create_group("diamond_scan").create_dataset(
+                "scan_fields", data=[name.encode("utf-8") for name in fields]
+            )
+
+
+def write_folder(folder: str | os.PathLike, size: Size) -> list[Path]:
+    """Writes ``size.folder_files`` scans cycling through every scan type and
+    both layouts, as found in a visit folder"""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    # Folders hold many small scans, so only the scan count is taken from size
+    small = SIZES["realistic"]
+    paths = []
+    for index in range(size.folder_files):
+        path = folder / f"b07-{index + 1}.nxs"
+        scan_type = SCAN_TYPES[index % len(SCAN_TYPES)]
+        layout_new = (index // len(SCAN_TYPES)) % 2 == 0
+        write_scan(path, scan_type, layout_new, small, seed=index)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", help="Folder to write the scans to")
+    parser.add_argument("--size", choices=list(SIZES), default="realistic")
+    parsed_args = parser.parse_args()
+    write_folder(parsed_args.folder, SIZES[parsed_args.size])
+
+
+if __name__ == "__main__":
+    main()
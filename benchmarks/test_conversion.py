@@ -0,0 +1,89 @@
+"""Conversion benchmarks, run with ``pytest benchmarks`` (add
+``--bench-size extreme`` for large scans, ``--benchmark-json`` to keep the
+results for ``pytest-benchmark compare``)."""
+
+import os
+import sys
+import time
+
+import pytest
+
+from B07nxs2txt._parallel import default_jobs
+from B07nxs2txt._utils import ConversionOptions
+from B07nxs2txt.converter import convert_file
+from measure import MB, run_measured
+from synthetic import SCAN_TYPES
+
+
+@pytest.mark.parametrize("layout_new", [True, False], ids=["new", "old"])
+@pytest.mark.parametrize("scan_type", SCAN_TYPES)
+def test_convert_file(
+    benchmark,
+    record,
+    scan_files,
+    import_rss,
+    tmp_path,
+    scan_type,
+    layout_new,
+    size_name,
+):
+    """Latency and peak memory of converting one file, which exercises the
+    exporter for its scan type"""
+    path = str(scan_files(scan_type, layout_new, size_name))
+    options = ConversionOptions(output_dir=str(tmp_path))
+    latencies = []
+
+    def convert():
+        start = time.perf_counter()
+        result = convert_file(path, options)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    result = benchmark(convert)
+    assert result.error is None and result.outputs
+
+    # Memory is measured in a fresh process so that runs do not affect it
+    _, rss = run_measured(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from B07nxs2txt._utils import ConversionOptions\n"
+            "from B07nxs2txt.converter import convert_file\n"
+            "convert_file(sys.argv[1], ConversionOptions(output_dir=sys.argv[2]))",
+            path,
+            str(tmp_path),
+        ]
+    )
+    latency = sum(latencies) / len(latencies)
+    record(
+        latency_ms=latency * 1e3,
+        mb_per_s=os.path.getsize(path) / MB / latency,
+        peak_rss_mb=rss / MB,
+        rss_mb=(rss - import_rss) / MB,
+    )
+
+
+@pytest.mark.parametrize("jobs", [1, default_jobs()], ids=["serial", "parallel"])
+def test_process_folder(benchmark, record, scan_folder, import_rss, jobs, size_name):
+    """Throughput of the command line tool on a folder of mixed scans"""
+    folder = scan_folder(size_name)
+    files = sorted(folder.glob("*.nxs"))
+    megabytes = sum(path.stat().st_size for path in files) / MB
+    command = [sys.executable, "-m", "B07nxs2txt", str(folder), "--force"]
+    runs = []
+
+    def process_folder():
+        runs.append(run_measured(command + ["-j", str(jobs)]))
+
+    benchmark.pedantic(process_folder, rounds=3, iterations=1, warmup_rounds=1)
+
+    elapsed = sum(run[0] for run in runs) / len(runs)
+    rss = max(run[1] for run in runs)
+    record(
+        latency_ms=elapsed / len(files) * 1e3,
+        files_per_s=len(files) / elapsed,
+        mb_per_s=megabytes / elapsed,
+        peak_rss_mb=rss / MB,
+        rss_mb=(rss - import_rss) / MB,
+    )
@@ -6,6 +6,43 @@
     Version number as calculated by https://github.com/pypa/setuptools_scm
 """
 
+from typing import TYPE_CHECKING
+
 from ._version import __version__
 
-__all__ = ["__version__"]
+if TYPE_CHECKING:
+    from ._folder import open_folder
+    from ._utils import ConversionOptions, ConversionResult
+    from ._visit import open_visit
+    from .converter import convert_file
+
+__all__ = [
+    "__version__",
+    "ConversionOptions",
+    "ConversionResult",
+    "convert_file",
+    "open_folder",
+    "open_visit",
+]
+
+
+def __getattr__(name: str):
+    # Imported on first use, so that importing the package (e.g. to run the
+    # CLI) does not import h5py
+    if name == "convert_file":
+        from .converter import convert_file
+
+        return convert_file
+    if name == "open_folder":
+        from ._folder import open_folder
+
+        return open_folder
+    if name == "open_visit":
+        from ._visit import open_visit
+
+        return open_visit
+    if name in ("ConversionOptions", "ConversionResult"):
+        from . import _utils
+
+        return getattr(_utils, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
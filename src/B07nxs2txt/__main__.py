@@ -1,128 +1,368 @@
-"""Interface for ``python -m B07nxs2txt``."""
+"""Interface for ``python -m B07nxs2txt``.
 
+Only what parsing the arguments needs is imported at startup; h5py, numpy and
+the converter are imported once there are files to convert.
+"""
+
+from __future__ import annotations
+
+import logging
 import os
-import subprocess
 import sys
-from argparse import ArgumentParser, Namespace
-from collections.abc import Sequence
-
-import h5py  # Assuming .nxs files are HDF5-compatible
+import time
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from collections.abc import Callable, Iterable, Iterator, Sequence, Sized
+from typing import TYPE_CHECKING
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.dirname(SCRIPT_DIR))
 
+from B07nxs2txt._discover import (  # noqa: E402
+    Selection,
+    iter_nxs_files,
+    parse_scan_ranges,
+    parse_shard,
+)
+from B07nxs2txt._images import parse_angle_roi  # noqa: E402
+from B07nxs2txt._logging import ConsoleHandler, configure_logging  # noqa: E402
+from B07nxs2txt._manifest import Manifest  # noqa: E402
+from B07nxs2txt._report import RunReport, SlowestProfiles  # noqa: E402
 from B07nxs2txt._utils import (  # noqa: E402
-    MAIN_NODE_NEW,
-    MAIN_NODE_OLD,
-    SCRIPT_NEW,
-    SCRIPT_OLD,
+    COMPRESSION_LEVELS,
+    MISSING_MAIN_NODE,
+    OUTPUT_FORMATS,
+    SWEEP_REDUCTIONS,
+    WATCH_SETTLE_TIME,
+    ConversionOptions,
+    ConversionResult,
 )
 from B07nxs2txt._version import __version__  # noqa: E402
 
+if TYPE_CHECKING:
+    from B07nxs2txt._aggregate import Aggregator
+    from B07nxs2txt._batch import WorkQueue
+
 __all__ = ["main"]
 
 errors: list[str] = []
 counter_old: int = 0
 counter_new: int = 0
+counter_skipped: int = 0
 parsed_args: Namespace
+run_report: RunReport | None = None
+profiles: SlowestProfiles | None = None
+console: ConsoleHandler | None = None
 
+logger = logging.getLogger("B07nxs2txt.cli")
 
-def is_main_node_new(file_path: str) -> bool | None:
-    """
-    Extracts the main node information from the .nxs file.
-    Adjust the logic based on the file's structure.
-    """
-    try:
-        main_node = ""
-        with h5py.File(file_path, "r") as f:
-            # Assuming the main node is stored as an attribute or dataset
-            if MAIN_NODE_OLD in f.keys():
-                print("File structure is OLD")
-                main_node = MAIN_NODE_OLD  # Retrieve the value
-            elif MAIN_NODE_NEW in f.keys():
-                print("\n File structure is NEW")
-                main_node = MAIN_NODE_NEW  # Retrieve the value
-            else:
-                print(f"No main node found in {file_path}.")
-            f.close()
-        return main_node == MAIN_NODE_NEW
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None
-
-
-def run_script_with_python(file_path: str, script: str):
+MANIFEST_SAVE_INTERVAL = 50  # Files converted between manifest saves
+
+
+def report_result(file_path: str, result: ConversionResult):
     """
-    Runs the appropriate Python script for the given .nxs file.
+    Reports the outcome of converting the given .nxs file.
     """
-    result = None
-    try:
-        if parsed_args.titles_off:
-            command = f"cd {SCRIPT_DIR}; python -m {script} {file_path} --titles_off"
-        else:
-            command = f"cd {SCRIPT_DIR}; python -m {script} {file_path}"
-        result = subprocess.run(
-            command, shell=True, check=True, capture_output=True, text=True
-        )
-        if result.stdout == "":
-            print("\n WARNING: No output from script - check logs/files")
+    if result.error is not None:
+        logger.error("Conversion FAILED for %s: %s", file_path, result.error)
+        errors.append(f"\n ERROR {file_path} : {result.error} \n")
+        return
+    if not result.outputs:
+        if result.scan_type is not None:
+            logger.warning("No output from converting %s - check the file", file_path)
             errors.append(f"\n WARNING empty result {file_path} \n")
-            return
-        print(
-            f"\n Script executed successfully for {file_path} using \
-                Python script {script}. \n Output: \n {result.stdout}"
-        )
-    except subprocess.CalledProcessError as e:
-        print(
-            f"\n Script FAILED for {file_path} using Python script {script}. \
-            Output: {e.stdout}"
-        )
-        print(
-            f"\n Error while executing script for {file_path} \
-            using Python script {script}: {e.stderr}"
-        )
-        errors.append(f"\n ERROR {file_path} : {e.stderr} \n")
+        return
+    logger.info("Converted %s: %s", file_path, ", ".join(result.outputs))
+
+
+def argument_type(parse: Callable[[str], object]) -> Callable[[str], object]:
+    """Reports the ValueError of ``parse`` as an invalid argument"""
+
+    def parse_argument(text: str) -> object:
+        try:
+            return parse(text)
+        except ValueError as e:
+            raise ArgumentTypeError(str(e)) from e
+
+    return parse_argument
 
 
 def process_folder():
     """
     Processes all .nxs files in the folder.
     """
-    global counter_old
-    global counter_new
-    nxs_files: list[str]
+    global counter_skipped
+    options: ConversionOptions
+    manifest: Manifest
+    aggregator: Aggregator | None = None
+    found = 0
 
     if not os.path.isdir(parsed_args.folderpath):
-        print(f"The provided path {parsed_args.folderpath} is not a valid folder.")
+        logger.error(
+            "The provided path %s is not a valid folder.", parsed_args.folderpath
+        )
         return
-    # Get all .nxs files
-    nxs_files = [f for f in os.listdir(parsed_args.folderpath) if f.endswith(".nxs")]
-    if not nxs_files:
-        print(f"No .nxs files found in the folder {parsed_args.folderpath}.")
+    if parsed_args.formats:
+        formats = tuple(parsed_args.formats)
+    else:
+        # Only the consolidated files are wanted unless formats are given
+        formats = () if parsed_args.aggregate else ("dat",)
+    options = ConversionOptions(
+        titles_off=parsed_args.titles_off,
+        formats=formats,
+        aggregate=parsed_args.aggregate,
+        classifiers=parsed_args.classifiers
+        and os.path.abspath(parsed_args.classifiers),
+        images=parsed_args.images,
+        angle_roi=parsed_args.angle_roi,
+        sweeps=parsed_args.sweeps,
+        reject_sigma=parsed_args.reject_sigma,
+        normalise=parsed_args.normalise,
+        rebin=parsed_args.rebin,
+        compression_level=parsed_args.compression_level,
+        compression_threads=parsed_args.compression_threads,
+    )
+    folder = os.path.abspath(parsed_args.folderpath)
+    if options.aggregate:
+        from B07nxs2txt._aggregate import Aggregator
+
+        aggregator = Aggregator(folder, os.path.basename(folder))
+    selection = Selection(
+        include=tuple(parsed_args.include or Selection.include),
+        exclude=tuple(parsed_args.exclude or ()),
+        scans=parsed_args.scans or (),
+        shard=parsed_args.shard or Selection.shard,
+    )
+    manifest = Manifest(folder)
+
+    def pending_files() -> Iterator[str]:
+        nonlocal found
+        global counter_skipped
+        for file_path in iter_nxs_files(folder, selection, parsed_args.recursive):
+            found += 1
+            # Incremental mode - skip files converted since they last changed
+            if not parsed_args.force and manifest.is_up_to_date(file_path, options):
+                counter_skipped += 1
+                continue
+            yield file_path
+
+    def is_up_to_date(file_path: str) -> bool:
+        # Files outside the selection count as up to date while watching
+        relative_path = os.path.relpath(file_path, folder)
+        if not selection.selects(relative_path):
+            return True
+        return manifest.is_up_to_date(file_path, options)
+
+    if parsed_args.queue:
+        convert_queued(folder, selection, options, manifest)
         return
-    for nxs_file in nxs_files:
-        print(os.path.abspath(parsed_args.folderpath))
-        file_path = os.path.join(os.path.abspath(parsed_args.folderpath), nxs_file)
-        print("\n" + "#" * 50)
-        print(f"Processing file: {file_path}")
-        # Determine the Python version based on the main node
-        main_node_new = is_main_node_new(file_path)
-        if main_node_new is None:
-            print(f"Skipping {file_path} due to missing main node.")
-            continue
-        if main_node_new:
-            run_script_with_python(file_path, SCRIPT_NEW)
-            counter_new += 1
+    try:
+        if parsed_args.recursive:
+            # Conversion starts while the rest of the tree is searched
+            convert_and_record(pending_files(), options, manifest, aggregator)
         else:
-            run_script_with_python(file_path, SCRIPT_OLD)
-            counter_old += 1
+            convert_and_record(list(pending_files()), options, manifest, aggregator)
+        if not found:
+            logger.warning("No .nxs files found in the folder %s.", folder)
+        if parsed_args.watch:
+            from B07nxs2txt._watch import watch_folder
+
+            save(manifest, aggregator)
+            watch_folder(
+                folder,
+                lambda file_path: convert_new_file(
+                    file_path, options, manifest, aggregator
+                ),
+                is_up_to_date,
+                polling=parsed_args.watch_polling,
+                settle_time=parsed_args.watch_settle,
+            )
+    finally:
+        save(manifest, aggregator)
+
+
+def convert_queued(
+    folder: str, selection: Selection, options: ConversionOptions, manifest: Manifest
+):
+    """
+    Converts files claimed from the work queue shared with other workers,
+    until none are left. The results are recorded in the queue rather than
+    in the manifest, which is only read to skip up to date files.
+    """
+    from B07nxs2txt._batch import UP_TO_DATE, WorkQueue
+
+    queue = WorkQueue(parsed_args.queue, folder)
+
+    def claimed_files() -> Iterator[str]:
+        global counter_skipped
+        for file_path in queue.claims():
+            if not parsed_args.force and manifest.is_up_to_date(file_path, options):
+                queue.skip(file_path, UP_TO_DATE)
+                counter_skipped += 1
+                continue
+            yield file_path
+
+    try:
+        added = queue.fill(iter_nxs_files(folder, selection, parsed_args.recursive))
+        if added:
+            logger.info("Added %d files to the queue %s", added, parsed_args.queue)
+        # Files failing at the end of a pass are retried in another one
+        while queue.next_retry() is not None:
+            convert_and_record(claimed_files(), options, queue)
+    finally:
+        queue.close()
+
+
+def save(manifest: Manifest | WorkQueue, aggregator: Aggregator | None):
+    """
+    Saves the aggregate files before the manifest that refers to them.
+    """
+    if aggregator is not None:
+        aggregator.save()
+    manifest.save()
+
+
+def convert_new_file(
+    file_path: str,
+    options: ConversionOptions,
+    manifest: Manifest,
+    aggregator: Aggregator | None,
+):
+    """
+    Converts a file completed while watching the folder.
+    """
+    convert_and_record([file_path], options, manifest, aggregator)
+    save(manifest, aggregator)
+
+
+def convert_and_record(
+    file_paths: Iterable[str],
+    options: ConversionOptions,
+    manifest: Manifest | WorkQueue,
+    aggregator: Aggregator | None = None,
+):
+    """
+    Converts the given files, reporting and recording each result. The files
+    may be given as an iterator, in which case they are converted as they are
+    found.
+    """
+    global counter_old
+    global counter_new
+
+    total = len(file_paths) if isinstance(file_paths, Sized) else None
+    if total == 0:
+        return
+    from B07nxs2txt._parallel import convert_files
+
+    jobs = requested_jobs() if total is None else min(requested_jobs(), total)
+    progress = None
+    if console is not None and (total is None or total > 1):
+        progress = console.start_progress(total)
+    try:
+        converted = convert_files(
+            file_paths,
+            options,
+            jobs,
+            profile=profiles is not None,
+            prefetch=parsed_args.prefetch,
+            # Files are hashed for the manifest, not for the work queue
+            recorded=manifest.entry if isinstance(manifest, Manifest) else None,
+        )
+        for index, (file_path, result, records) in enumerate(converted):
+            if progress is not None:
+                progress.update()
+            logger.debug("Processing file: %s", file_path)
+            # Messages logged by the conversion, possibly in a worker process
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if profiles is not None:
+                profiles.add(result)
+            if run_report is not None:
+                run_report.add(result)
+            if result.main_node_new is None and result.error == MISSING_MAIN_NODE:
+                logger.info("Skipping %s due to missing main node.", file_path)
+                manifest.forget(file_path)
+                continue
+            if aggregator is not None and result.error is None:
+                result.outputs.extend(aggregator.add(result))
+                result.tables.clear()
+            report_result(file_path, result)
+            manifest.record(result, options)
+            if (index + 1) % MANIFEST_SAVE_INTERVAL == 0:
+                save(manifest, aggregator)
+            if result.main_node_new:
+                counter_new += 1
+            elif result.main_node_new is not None:
+                counter_old += 1
+    finally:
+        if console is not None:
+            console.stop_progress()
+
+
+def requested_jobs() -> int:
+    """The number of jobs given with -j, by default the number of CPUs"""
+    if parsed_args.jobs is None:
+        from B07nxs2txt._parallel import default_jobs
+
+        parsed_args.jobs = default_jobs()
+    return parsed_args.jobs
+
+
+def print_summary(
+    new_files: int, old_files: int, skipped_files: int, all_errors: list[str]
+):
+    print(f"NUMBER OF PROCESSED NEW FILES: {new_files} \n")
+    print(f"NUMBER OF PROCESSED OLD FILES: {old_files} \n")
+    print(f"NUMBER OF UP TO DATE FILES SKIPPED: {skipped_files} \n")
+    print("ALL ERRORS: " + "\n")
+    print(sorted(all_errors))
+
+
+def summary_main(args: Sequence[str]) -> None:
+    """Merges the counters and errors of the workers sharing a work queue."""
+    parser = ArgumentParser(
+        prog="B07nxs2txt summary",
+        description="Summarise the conversion of the files in a work queue",
+    )
+    parser.add_argument("queue", help="Work queue given to the workers with --queue")
+    queue_path = parser.parse_args(args).queue
+    if not os.path.isfile(queue_path):
+        parser.error(f"{queue_path} is not a work queue")
+    from B07nxs2txt._batch import WorkQueue
+
+    queue = WorkQueue(queue_path)
+    try:
+        summary = queue.summary()
+    finally:
+        queue.close()
+    for state, count in sorted(summary.states.items()):
+        print(f"{state}: {count}")
+    left = summary.states.get("pending", 0) + summary.states.get("claimed", 0)
+    print(f"NUMBER OF FILES LEFT TO CONVERT: {left} \n")
+    print_summary(
+        summary.layouts.get("new", 0),
+        summary.layouts.get("old", 0),
+        summary.up_to_date,
+        summary.errors,
+    )
 
 
 def main(args: Sequence[str] | None = None) -> None:
     """Argument parser for the CLI."""
     global parsed_args
+    global run_report
+    global profiles
+    global console
+
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] == "summary":
+        summary_main(args[1:])
+        return
 
-    parser = ArgumentParser()
+    parser = ArgumentParser(
+        epilog="Run '%(prog)s summary QUEUE' to summarise the work of the "
+        "workers sharing a --queue"
+    )
     parser.add_argument(
         "-v",
         "--version",
@@ -134,15 +374,242 @@ def main(args: Sequence[str] | None = None) -> None:
         "--titles_off", help="Switch OFF column titles", action="store_true"
     )
 
-    parsed_args = parser.parse_args()
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        help="Also convert the files in sub-folders (not watched with --watch)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--include",
+        help="Only convert files whose name or path relative to the folder "
+        "matches this glob, may be given several times (default: *.nxs)",
+        metavar="GLOB",
+        action="append",
+    )
+    parser.add_argument(
+        "--exclude",
+        help="Skip files and sub-folders whose name or relative path matches "
+        "this glob, may be given several times",
+        metavar="GLOB",
+        action="append",
+    )
+    parser.add_argument(
+        "--scans",
+        help="Only convert these scan numbers, e.g. 100-200,305",
+        type=argument_type(parse_scan_ranges),
+    )
+    parser.add_argument(
+        "--shard",
+        help="Only convert the i-th of N parts of the files, split the same "
+        "way by every job, e.g. 2/4",
+        metavar="i/N",
+        type=argument_type(parse_shard),
+    )
+
+    parser.add_argument(
+        "--format",
+        dest="formats",
+        help="Output format, may be given several times (default: dat). "
+        "parquet needs the optional pyarrow dependency, dat.zst the optional "
+        "zstandard dependency",
+        choices=OUTPUT_FORMATS,
+        action="append",
+    )
+    parser.add_argument(
+        "--compression_level",
+        help="Compression level of the "
+        + " and ".join(
+            f"{name} ({low}-{high}, default {default})"
+            for name, (low, high, default) in COMPRESSION_LEVELS.items()
+        )
+        + " outputs",
+        metavar="LEVEL",
+        type=int,
+    )
+    parser.add_argument(
+        "--compression_threads",
+        help="Threads compressing each dat.gz or dat.zst output (default: 1 "
+        "when converting several files in parallel, otherwise the number of "
+        "CPUs, at most 4)",
+        metavar="N",
+        type=int,
+    )
+    parser.add_argument(
+        "--aggregate",
+        help="Write one HDF5 file per scan type for the whole folder instead "
+        "of a file per scan (add --format to write both)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--images",
+        help="Also reduce the detector images of each analyser region to an "
+        "angle-integrated spectrum (_ANGLEINT) and an energy-angle map (_MAP)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--angle_roi",
+        help="Angle channels summed into the spectrum reduced from the images "
+        "(default: all), e.g. 100:900",
+        metavar="START:STOP",
+        type=argument_type(parse_angle_roi),
+    )
+    parser.add_argument(
+        "--sweeps",
+        help="Write the sum or mean of the sweeps of each analyser region "
+        "instead of every sweep",
+        choices=SWEEP_REDUCTIONS,
+    )
+    parser.add_argument(
+        "--reject_sigma",
+        help="Leave out of --sweeps the sweeps deviating from the median "
+        "sweep by more than this many (robust) standard deviations",
+        metavar="SIGMA",
+        type=float,
+    )
+    parser.add_argument(
+        "--normalise",
+        help="Divide the currents of NEXAFS scans by this reference (I0) "
+        "current, e.g. ca11b",
+        metavar="CURRENT",
+    )
+    parser.add_argument(
+        "--rebin",
+        help="Average every N points of NEXAFS and XPS scans together",
+        metavar="N",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--classifiers",
+        help="TOML file of rules classifying scans, tried before the built-in ones",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of files to convert in parallel (default: number of CPUs)",
+        type=int,
+    )
+    parser.add_argument(
+        "--prefetch",
+        help="Number of files read ahead while others are converted (default: "
+        "the number of jobs, at least 2; 0 to disable)",
+        metavar="N",
+        type=int,
+    )
+    parser.add_argument(
+        "--watch",
+        help="Keep running and convert new .nxs files as they are completed",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch_polling",
+        help="Watch by polling the folder instead of using inotify (use on "
+        "network filesystems where files are written by another host)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch_settle",
+        help="With --watch, convert files without an end time (written by GDA "
+        "when a scan ends) once they have not changed for this long (default: "
+        f"{WATCH_SETTLE_TIME:g})",
+        metavar="SECONDS",
+        type=float,
+        default=WATCH_SETTLE_TIME,
+    )
+    parser.add_argument(
+        "--queue",
+        help="Share the conversion of the folder with other workers (e.g. "
+        "the tasks of a cluster job array) through this work queue on a shared "
+        "filesystem, retrying failed files",
+    )
+    parser.add_argument(
+        "--force",
+        help="Convert all files, even those whose outputs are up to date",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--report",
+        help="Write a JSON Lines report with the time spent in each stage of "
+        "every conversion, the bytes read and written and the rows exported",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile every conversion and keep the cProfile statistics of "
+        "the N slowest files",
+        metavar="N",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--profile_dir",
+        help="Folder for the statistics kept by --profile (default: "
+        "cuddle_profiles in the current folder)",
+        default="cuddle_profiles",
+    )
+
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        help="Only show warnings and errors, and no progress, on the console",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--log_level",
+        help="Level of the messages shown and logged (default: INFO)",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+    )
+    parser.add_argument(
+        "--log_file",
+        "--log-file",
+        help="Also write the messages to this file",
+    )
+
+    parsed_args = parser.parse_args(args)
+    if parsed_args.queue and (parsed_args.aggregate or parsed_args.watch):
+        parser.error("--queue cannot be combined with --aggregate or --watch")
+    if parsed_args.reject_sigma is not None and not parsed_args.sweeps:
+        parser.error("--reject_sigma needs --sweeps")
+    if parsed_args.rebin < 1:
+        parser.error("--rebin must be at least 1")
+    if parsed_args.compression_threads is not None and (
+        parsed_args.compression_threads < 1
+    ):
+        parser.error("--compression_threads must be at least 1")
+    if parsed_args.compression_level is not None:
+        compressed = set(parsed_args.formats or ()) & set(COMPRESSION_LEVELS)
+        if not compressed:
+            parser.error("--compression_level requires a compressed format")
+        for name in sorted(compressed):
+            low, high, _ = COMPRESSION_LEVELS[name]
+            if not low <= parsed_args.compression_level <= high:
+                parser.error(f"--compression_level must be {low}-{high} for {name}")
+    console = configure_logging(
+        getattr(logging, parsed_args.log_level),
+        quiet=parsed_args.quiet,
+        log_file=parsed_args.log_file,
+    )
+    if parsed_args.report:
+        run_report = RunReport(parsed_args.report)
+    if parsed_args.profile > 0:
+        profiles = SlowestProfiles(parsed_args.profile, parsed_args.profile_dir)
 
     # do conversion
-    process_folder()
+    start = time.perf_counter()
+    try:
+        process_folder()
+    finally:
+        if run_report is not None:
+            run_report.close(
+                time.perf_counter() - start, requested_jobs(), counter_skipped
+            )
+        if profiles is not None:
+            for path in profiles.save():
+                logger.info("Profile written to %s", path)
 
-    print(f"NUMBER OF PROCESSED NEW FILES: {counter_new} \n")
-    print(f"NUMBER OF PROCESSED OLD FILES: {counter_old} \n")
-    print("ALL ERRORS: " + "\n")
-    print(errors)
+    print_summary(counter_new, counter_old, counter_skipped, errors)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+"""Consolidated output - one HDF5 file per scan type for a whole folder."""
+
+import os
+from collections import defaultdict
+
+import h5py
+import numpy as np
+
+from B07nxs2txt._utils import ConversionResult, ExportedTable, scan_number
+from B07nxs2txt._writers import _field_names
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("name", h5py.string_dtype()),
+        ("source", h5py.string_dtype()),
+        ("scan_number", np.int64),  # -1 if the file name has no scan number
+        ("region", h5py.string_dtype()),
+        ("rows", np.int64),
+    ]
+)
+
+
+def _decode(value: bytes | str) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class Aggregator:
+    """Collects the tables exported from a folder into one HDF5 file per kind
+    of scan, ``<prefix>_XPS.h5``, ``<prefix>_NEXAFS.h5`` and ``<prefix>_XY.h5``.
+
+    Every table is a group ``/scans/<name>`` (``name`` being what the .dat
+    file would have been called) with one dataset per column and the column
+    order in its ``columns`` attribute, so one scan can be read without
+    touching the others. The ``/index`` dataset lists the name, source file,
+    scan number, region and number of rows of every table, ordered by scan
+    number.
+
+    Converting a source file again replaces its tables. HDF5 does not reuse
+    the space freed by replaced tables, so run with ``--force`` into an empty
+    folder to compact an aggregate that has been updated many times.
+    """
+
+    def __init__(self, output_dir: str, prefix: str):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self._files: dict[str, h5py.File] = {}
+        self._index: dict[str, dict[str, tuple]] = {}  # kind -> name -> row
+
+    def path(self, kind: str) -> str:
+        return os.path.join(self.output_dir, f"{self.prefix}_{kind}.h5")
+
+    def _open(self, kind: str) -> h5py.File:
+        output_file = self._files.get(kind)
+        if output_file is None:
+            output_file = h5py.File(self.path(kind), "a")
+            self._files[kind] = output_file
+            if kind not in self._index:
+                rows = output_file["index"][()] if "index" in output_file else []
+                self._index[kind] = {
+                    _decode(row["name"]): (
+                        _decode(row["name"]),
+                        _decode(row["source"]),
+                        int(row["scan_number"]),
+                        _decode(row["region"]),
+                        int(row["rows"]),
+                    )
+                    for row in rows
+                }
+        return output_file
+
+    def add(self, result: ConversionResult) -> list[str]:
+        """Stores the tables of a converted file, returning the paths of the
+        aggregate files they went to"""
+        source = os.path.basename(result.file_path)
+        number = scan_number(source)
+        by_kind: dict[str, list[ExportedTable]] = defaultdict(list)
+        for table in result.tables:
+            by_kind[table.kind].append(table)
+
+        for kind, tables in by_kind.items():
+            scans = self._open(kind).require_group("scans")
+            index = self._index[kind]
+            # Drop what an earlier conversion of the file stored
+            for name in [name for name, row in index.items() if row[1] == source]:
+                del index[name]
+                if name in scans:
+                    del scans[name]
+            for table in tables:
+                if table.name in scans:
+                    del scans[table.name]
+                group = scans.create_group(table.name)
+                names = _field_names(table.titles)
+                for name, column in zip(names, table.columns, strict=True):
+                    group.create_dataset(name, data=column)
+                group.attrs["columns"] = names
+                group.attrs["source"] = source
+                rows = min((len(column) for column in table.columns), default=0)
+                index[table.name] = (
+                    table.name,
+                    source,
+                    -1 if number is None else number,
+                    table.region or "",
+                    rows,
+                )
+        return [self.path(kind) for kind in by_kind]
+
+    def save(self):
+        """Writes the index of every aggregate file and closes them, so that
+        they can be read by other programs until more tables are added"""
+        for kind, output_file in self._files.items():
+            rows = sorted(self._index[kind].values(), key=lambda row: (row[2], row[0]))
+            if "index" in output_file:
+                del output_file["index"]
+            output_file.create_dataset("index", data=np.array(rows, dtype=INDEX_DTYPE))
+            output_file.close()
+        self._files.clear()
@@ -0,0 +1,312 @@
+"""A work queue shared by many workers converting one visit, e.g. the tasks of
+a cluster job array.
+
+The queue is an SQLite database on the shared filesystem holding one row per
+file, with its state and the outcome of its conversion. Workers claim files
+one at a time in an immediate (write locked) transaction, so no file is
+claimed twice. SQLite relies on POSIX locks for this, and uses the default
+rollback journal since WAL mode does not work on network filesystems.
+
+States:
+
+- ``pending`` - to be converted, not before ``not_before``
+- ``claimed`` - being converted by ``worker``; claims older than
+  :data:`LEASE_SECONDS` are from workers that died and are taken over
+- ``done`` - converted (possibly to no output)
+- ``skipped`` - up to date, or not a readable .nxs file
+- ``failed`` - the conversion failed :data:`MAX_ATTEMPTS` times; failures are
+  retried after :data:`RETRY_DELAY` seconds, doubling every attempt
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from B07nxs2txt._utils import ConversionOptions, ConversionResult
+
+UP_TO_DATE = "up to date"
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30.0  # seconds before the first retry of a failed file
+LEASE_SECONDS = 3600.0  # after which a claim is assumed to be abandoned
+LOCK_TIMEOUT = 600.0  # seconds to wait for another worker's transaction
+INSERT_BATCH = 1000  # files added to the queue per transaction
+FILL_POLL = 1.0  # seconds between looks at a queue being filled by another worker
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,  -- relative to the folder converted
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    finished_at REAL,
+    seconds REAL,
+    layout TEXT,
+    scan_type TEXT,
+    outputs TEXT,  -- JSON list
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS files_state ON files (state, not_before);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def worker_name() -> str:
+    """Identifies this process in the queue"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class QueueSummary:
+    """Counters and errors merged across the workers of a queue"""
+
+    states: dict[str, int] = field(default_factory=dict)
+    layouts: dict[str, int] = field(default_factory=dict)  # "new", "old"
+    up_to_date: int = 0  # files skipped as their outputs were up to date
+    errors: list[str] = field(default_factory=list)  # as printed by the CLI
+
+
+class WorkQueue:
+    """The queue of the files in ``folder``, stored in the database at
+    ``path``. The folder is stored in the queue by :meth:`fill`, so it need
+    not be given to look at a filled queue.
+
+    Quacks like :class:`B07nxs2txt._manifest.Manifest`, so that workers
+    record their results through the same calls.
+    """
+
+    def __init__(self, path: str, folder: str | None = None, worker: str | None = None):
+        self.worker = worker or worker_name()
+        # Transactions are started explicitly, see _transaction
+        self._db = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+        self._db.executescript(SCHEMA)
+        if folder is None:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'folder'")
+            folder = (row.fetchone() or [""])[0]
+        self.folder = folder
+
+    def _key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.folder)
+
+    def _transaction(self):
+        """Starts a transaction holding the write lock until it ends"""
+        self._db.execute("BEGIN IMMEDIATE")
+        return self._db
+
+    def fill(self, file_paths: Iterable[str]) -> int:
+        """Adds the files to the queue, unless it has been filled (or is being
+        filled) already. Returns the number of files added.
+
+        Only the first worker to start walks the folder. It commits the files
+        :data:`INSERT_BATCH` at a time, so that the others do not wait for the
+        whole walk to get the write lock, and claim the files added so far
+        (see :meth:`next_retry`). A walk that made no progress for
+        :data:`LOCK_TIMEOUT` seconds, e.g. as its worker died, is taken over.
+        """
+        if not self._start_filling():
+            return 0
+        try:
+            added = 0
+            batch: list[tuple[str]] = []
+            for file_path in file_paths:
+                batch.append((self._key(file_path),))
+                if len(batch) == INSERT_BATCH:
+                    added += self._insert(batch)
+            added += self._insert(batch)
+        except BaseException:
+            # Let another worker walk the folder
+            self._db.execute("DELETE FROM meta WHERE key = 'filling'")
+            raise
+        db = self._transaction()
+        try:
+            # Or replaced, if the walk was taken over by another worker
+            db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('filled', ?)", (str(time.time()),)
+            )
+            db.execute("DELETE FROM meta WHERE key = 'filling'")
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return added
+
+    def _start_filling(self) -> bool:
+        """Whether this worker is to fill the queue, marking it as being
+        filled if so"""
+        db = self._transaction()
+        try:
+            start = (
+                not db.execute("SELECT 1 FROM meta WHERE key = 'filled'").fetchone()
+                and not self._filling()
+            )
+            if start:
+                db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('folder', ?)", (self.folder,)
+                )
+                db.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('filling', ?)",
+                    (str(time.time()),),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return start
+
+    def _filling(self) -> bool:
+        """Whether a worker is filling the queue, and made progress lately"""
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'filling'"
+        ).fetchone()
+        return row is not None and float(row[0]) > time.time() - LOCK_TIMEOUT
+
+    def _insert(self, batch: list[tuple[str]]) -> int:
+        """Adds a batch of files in a transaction of its own"""
+        db = self._transaction()
+        try:
+            added = db.executemany(
+                "INSERT OR IGNORE INTO files (path) VALUES (?)", batch
+            ).rowcount
+            db.execute(
+                "UPDATE meta SET value = ? WHERE key = 'filling'", (str(time.time()),)
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        batch.clear()
+        return added
+
+    def claim(self) -> str | None:
+        """Claims the next file to convert, returning its path, or None if no
+        file can be converted now"""
+        now = time.time()
+        db = self._transaction()
+        try:
+            # Abandoned claims are retried, unless they were the last attempt
+            db.execute(
+                "UPDATE files SET state = 'failed', error = ?"
+                " WHERE state = 'claimed' AND claimed_at < ? AND attempts >= ?",
+                ("worker lost", now - LEASE_SECONDS, MAX_ATTEMPTS),
+            )
+            row = db.execute(
+                "SELECT path FROM files WHERE (state = 'pending' AND not_before <= ?)"
+                " OR (state = 'claimed' AND claimed_at < ?) LIMIT 1",
+                (now, now - LEASE_SECONDS),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE files SET state = 'claimed', worker = ?, claimed_at = ?,"
+                    " attempts = attempts + 1 WHERE path = ?",
+                    (self.worker, now, row[0]),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return None if row is None else os.path.join(self.folder, row[0])
+
+    def next_retry(self) -> float | None:
+        """When the next pending file (possibly waiting to be retried) can be
+        claimed, or None if no file is pending. While another worker is
+        filling the queue more files may come, and none pending means looking
+        again in :data:`FILL_POLL` seconds."""
+        (not_before,) = self._db.execute(
+            "SELECT min(not_before) FROM files WHERE state = 'pending'"
+        ).fetchone()
+        if not_before is None and self._filling():
+            return time.time() + FILL_POLL
+        return not_before
+
+    def claims(self) -> Iterator[str]:
+        """Yields the files claimed one after the other, waiting for the
+        files being retried, until there are none left"""
+        while True:
+            file_path = self.claim()
+            if file_path is not None:
+                yield file_path
+                continue
+            not_before = self.next_retry()
+            if not_before is None:
+                return
+            time.sleep(max(0.0, not_before - time.time()))
+
+    def _finish(self, file_path: str, state: str, **values):
+        values.update(state=state, finished_at=time.time())
+        columns = ", ".join(f"{name} = ?" for name in values)
+        self._db.execute(
+            f"UPDATE files SET {columns} WHERE path = ? AND worker = ?",
+            (*values.values(), self._key(file_path), self.worker),
+        )
+
+    def record(self, result: ConversionResult, options: ConversionOptions):
+        """Stores the outcome of a conversion, scheduling a retry if it
+        failed"""
+        if result.main_node_new is None:
+            layout = None
+        else:
+            layout = "new" if result.main_node_new else "old"
+        values = {
+            "seconds": result.stats.seconds,
+            "layout": layout,
+            "scan_type": result.scan_type.name if result.scan_type else None,
+            "outputs": json.dumps([self._key(output) for output in result.outputs]),
+            "error": result.error,
+        }
+        if result.error is None:
+            self._finish(result.file_path, "done", **values)
+            return
+        (attempts,) = self._db.execute(
+            "SELECT attempts FROM files WHERE path = ?", (self._key(result.file_path),)
+        ).fetchone()
+        if attempts >= MAX_ATTEMPTS:
+            self._finish(result.file_path, "failed", **values)
+        else:
+            retry_at = time.time() + RETRY_DELAY * 2 ** (attempts - 1)
+            self._finish(result.file_path, "pending", not_before=retry_at, **values)
+
+    def skip(self, file_path: str, reason: str):
+        """Marks a file that is not to be converted"""
+        self._finish(file_path, "skipped", error=reason)
+
+    def forget(self, file_path: str):
+        """Marks a file that could not be read as skipped, as the CLI does
+        not retry these"""
+        self.skip(file_path, "not a readable .nxs file")
+
+    def save(self):
+        """Every change is committed as it is made"""
+
+    def summary(self) -> QueueSummary:
+        summary = QueueSummary()
+        for state, count in self._db.execute(
+            "SELECT state, count(*) FROM files GROUP BY state"
+        ):
+            summary.states[state] = count
+        (summary.up_to_date,) = self._db.execute(
+            "SELECT count(*) FROM files WHERE state = 'skipped' AND error = ?",
+            (UP_TO_DATE,),
+        ).fetchone()
+        for layout, count in self._db.execute(
+            "SELECT layout, count(*) FROM files WHERE state IN ('done', 'failed')"
+            " AND layout IS NOT NULL GROUP BY layout"
+        ):
+            summary.layouts[layout] = count
+        for path, state, error, outputs in self._db.execute(
+            "SELECT path, state, error, outputs FROM files"
+            " WHERE state = 'failed' OR (state = 'done' AND scan_type IS NOT NULL)"
+        ):
+            file_path = os.path.join(self.folder, path)
+            if state == "failed":
+                summary.errors.append(f"\n ERROR {file_path} : {error} \n")
+            elif not json.loads(outputs):
+                summary.errors.append(f"\n WARNING empty result {file_path} \n")
+        return summary
+
+    def close(self):
+        self._db.close()
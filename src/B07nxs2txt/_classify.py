@@ -0,0 +1,199 @@
+"""Declarative classification of scans into :class:`ScanType`.
+
+A :class:`Rule` assigns a scan type when every one of its conditions is met,
+a condition being met when any key (a scan field in the new layout, a member
+of the instrument group in the old one) matches any of its patterns. Rules
+are tried in order and the first one met wins.
+
+Rules come, in order of precedence, from a TOML file given with
+``--classifiers``, from packages registering them under the
+``B07nxs2txt.classifiers`` entry point group and from :data:`DEFAULT_RULES`.
+A TOML file holds a list of rules::
+
+    [[rules]]
+    scan_type = "ARPES_MAP"
+    layout = "new"  # "new", "old" or "both" (the default)
+    require = [{prefix = ["analyser"]}, {prefix = ["deflector"]}]
+
+An entry point refers to a list of :class:`Rule` or a function returning one.
+"""
+
+import functools
+import sys
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from B07nxs2txt._utils import PGM_NAMES, XY_SCAN_SCANNABLES_NAMES, ScanType
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+ENTRY_POINT_GROUP = "B07nxs2txt.classifiers"
+LAYOUTS = ("new", "old")
+MATCH_MODES = ("exact", "prefix", "contains")
+KEY_CACHE_SIZE = 4096  # keys whose matches are remembered between scans
+
+
+@dataclass(frozen=True)
+class Condition:
+    """Met if any key matches any of the patterns"""
+
+    match: str  # one of MATCH_MODES
+    patterns: tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Classifies a scan as ``scan_type`` if all the conditions are met"""
+
+    scan_type: ScanType
+    require: tuple[Condition, ...]
+    layout: str = "both"  # "new", "old" or "both"
+
+
+def _rule(layout: str, scan_type: ScanType, *require: Condition) -> Rule:
+    return Rule(scan_type=scan_type, require=require, layout=layout)
+
+
+_ANALYSER_NEW = Condition("prefix", ("analyser",))
+_PGM_NEW = Condition("prefix", PGM_NAMES)
+_CURRENT_NEW = Condition("prefix", ("ca", "femto"))
+_ANALYSER_OLD = Condition("exact", ("analyser",))
+_PGM_OLD = Condition("exact", ("pgm_energy",))
+_CURRENT_OLD = Condition("contains", ("ca", "femto"))
+
+DEFAULT_RULES: tuple[Rule, ...] = (
+    # The new layout lists the fields that were scanned
+    _rule("new", ScanType.NEXAFS_ANALYSER, _PGM_NEW, _CURRENT_NEW, _ANALYSER_NEW),
+    _rule("new", ScanType.NEXAFS, _PGM_NEW, _CURRENT_NEW),
+    # Analyser spectra taken while scanning photon energy, deflector or angle,
+    # or sample position
+    _rule("new", ScanType.RESONANT_PES, _ANALYSER_NEW, _PGM_NEW),
+    _rule(
+        "new",
+        ScanType.ARPES_MAP,
+        _ANALYSER_NEW,
+        Condition("prefix", ("deflector", "sm21b_polar", "sm21b_tilt")),
+    ),
+    _rule(
+        "new",
+        ScanType.MAPPING,
+        _ANALYSER_NEW,
+        Condition("prefix", ("sm21b_x",)),
+        Condition("prefix", ("sm21b_y",)),
+    ),
+    _rule("new", ScanType.XPS, _ANALYSER_NEW),
+    _rule("new", ScanType.XY_DATA, Condition("prefix", XY_SCAN_SCANNABLES_NAMES)),
+    # The old layout only has the members of the instrument group, which do
+    # not tell scanned fields apart, so only the original types are detected
+    _rule("old", ScanType.NEXAFS_ANALYSER, _PGM_OLD, _CURRENT_OLD, _ANALYSER_OLD),
+    _rule("old", ScanType.NEXAFS, _PGM_OLD, _CURRENT_OLD),
+    _rule("old", ScanType.XPS, _ANALYSER_OLD),
+    _rule("old", ScanType.XY_DATA, Condition("exact", XY_SCAN_SCANNABLES_NAMES)),
+)
+
+
+class Classifier:
+    """The rules of one layout compiled for a single pass over the keys.
+
+    Every distinct condition gets a bit. Each key is matched once against all
+    the patterns, through a dictionary for exact and prefix patterns, giving
+    the mask of conditions it meets; masks are cached as the same keys recur
+    in every scan of a folder. A rule is met if its mask is contained in the
+    union of the masks of the keys.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        conditions: dict[Condition, int] = {}
+        self.rules: list[tuple[int, ScanType]] = []
+        for rule in rules:
+            mask = 0
+            for condition in rule.require:
+                mask |= 1 << conditions.setdefault(condition, len(conditions))
+            self.rules.append((mask, rule.scan_type))
+
+        self._exact: dict[str, int] = {}
+        self._prefixes: dict[str, int] = {}
+        self._contains: dict[str, int] = {}
+        tables = {
+            "exact": self._exact,
+            "prefix": self._prefixes,
+            "contains": self._contains,
+        }
+        for condition, bit in conditions.items():
+            patterns = tables[condition.match]
+            for pattern in condition.patterns:
+                patterns[pattern] = patterns.get(pattern, 0) | 1 << bit
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixes})
+        self._key_mask = functools.lru_cache(maxsize=KEY_CACHE_SIZE)(self._match)
+
+    def _match(self, key: str) -> int:
+        mask = self._exact.get(key, 0)
+        for length in self._prefix_lengths:
+            if length > len(key):
+                break
+            mask |= self._prefixes.get(key[:length], 0)
+        for pattern, bits in self._contains.items():
+            if pattern in key:
+                mask |= bits
+        return mask
+
+    def classify(self, keys: Iterable[str]) -> ScanType | None:
+        met = 0
+        for key in keys:
+            met |= self._key_mask(key)
+        for mask, scan_type in self.rules:
+            if mask & met == mask:
+                return scan_type
+        return None
+
+
+def parse_rules(content: dict) -> list[Rule]:
+    """Rules from the contents of a classifier TOML file"""
+    rules = []
+    for entry in content.get("rules", []):
+        try:
+            scan_type = ScanType[entry["scan_type"]]
+        except KeyError as e:
+            raise ValueError(f"Unknown scan type in classifier rule {entry}") from e
+        layout = entry.get("layout", "both")
+        if layout not in (*LAYOUTS, "both"):
+            raise ValueError(f"Unknown layout {layout!r} in classifier rule {entry}")
+        require = []
+        for condition in entry.get("require", []):
+            if len(condition) != 1 or next(iter(condition)) not in MATCH_MODES:
+                raise ValueError(
+                    f"Classifier conditions need one of {MATCH_MODES}, got {condition}"
+                )
+            [(match, patterns)] = condition.items()
+            require.append(Condition(match, tuple(patterns)))
+        if not require:
+            raise ValueError(f"Classifier rule {entry} has no conditions")
+        rules.append(Rule(scan_type=scan_type, require=tuple(require), layout=layout))
+    return rules
+
+
+def load_rules(path: str) -> list[Rule]:
+    with open(path, "rb") as f:
+        return parse_rules(tomllib.load(f))
+
+
+def plugin_rules() -> list[Rule]:
+    """Rules registered by installed packages"""
+    from importlib.metadata import entry_points  # slow to import
+
+    rules: list[Rule] = []
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        loaded = entry_point.load()
+        rules.extend(loaded() if callable(loaded) else loaded)
+    return rules
+
+
+@functools.lru_cache(maxsize=8)
+def get_classifier(layout: str, rules_file: str | None = None) -> Classifier:
+    """The classifier for the given layout, built once per process"""
+    rules = [*(load_rules(rules_file) if rules_file else []), *plugin_rules()]
+    rules.extend(DEFAULT_RULES)
+    return Classifier(rule for rule in rules if rule.layout in (layout, "both"))
@@ -0,0 +1,126 @@
+"""Finding the .nxs files to convert in a folder, or a tree of folders.
+
+Files are yielded as they are found, one directory at a time, so that
+conversion can start before a large visit has been walked completely. Each
+directory is listed with :func:`os.scandir`, whose entries carry their type,
+so telling files from sub-folders costs no further ``stat`` calls.
+"""
+
+import fnmatch
+import os
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from B07nxs2txt._utils import scan_number
+
+
+@dataclass(frozen=True)
+class Selection:
+    """Which of the files found are converted.
+
+    Globs are matched against both the name of a file and its path relative
+    to the folder searched (with ``/`` separators), so ``*.nxs`` and
+    ``*/processed/*`` both work. Folders matching an exclude glob are not
+    searched at all.
+    """
+
+    include: tuple[str, ...] = ("*.nxs",)  # a file must match one of these
+    exclude: tuple[str, ...] = ()  # and none of these
+    scans: tuple[range, ...] = ()  # scan numbers converted, all if empty
+    shard: tuple[int, int] = (1, 1)  # the i-th of N disjoint parts of the files
+
+    def _matches(self, patterns: tuple[str, ...], relative_path: str) -> bool:
+        name = relative_path.rsplit("/", 1)[-1]
+        return any(
+            fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative_path, pattern)
+            for pattern in patterns
+        )
+
+    def searches(self, relative_path: str) -> bool:
+        """Whether a sub-folder is searched"""
+        return not self._matches(self.exclude, relative_path)
+
+    def selects(self, relative_path: str) -> bool:
+        """Whether a file is converted"""
+        if not self._matches(self.include, relative_path):
+            return False
+        if self._matches(self.exclude, relative_path):
+            return False
+        if self.scans:
+            number = scan_number(relative_path)
+            if number is None or not any(number in scans for scans in self.scans):
+                return False
+        return in_shard(relative_path, *self.shard)
+
+
+def in_shard(relative_path: str, index: int, count: int) -> bool:
+    """Whether a file belongs to the ``index``-th (from 1) of ``count`` shards.
+
+    Files are assigned by a CRC-32 of their path relative to the folder
+    searched, so every job splitting a visit agrees on the assignment
+    without any coordination, wherever the visit is mounted.
+    """
+    return zlib.crc32(relative_path.encode("utf-8")) % count == index - 1
+
+
+def parse_scan_ranges(text: str) -> tuple[range, ...]:
+    """Scan numbers given as e.g. ``"100-200,305"`` (ranges are inclusive)"""
+    ranges = []
+    for part in text.split(","):
+        bounds = part.split("-")
+        try:
+            if len(bounds) > 2:
+                raise ValueError
+            ranges.append(range(int(bounds[0]), int(bounds[-1]) + 1))
+        except ValueError as e:
+            raise ValueError(f"Invalid scan range {part!r}") from e
+    return tuple(ranges)
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """A shard given as ``"i/N"``, with ``1 <= i <= N``"""
+    index, _, count = text.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError as e:
+        raise ValueError(f"Invalid shard {text!r}, expected i/N") from e
+    if not 1 <= shard[0] <= shard[1]:
+        raise ValueError(f"Invalid shard {text!r}, expected 1 <= i <= N")
+    return shard
+
+
+def iter_nxs_files(
+    folder: str, selection: Selection | None = None, recursive: bool = False
+) -> Iterator[str]:
+    """Yields the paths of the selected files in ``folder`` (and its
+    sub-folders, depth first, if ``recursive``), sorted by name within each
+    folder"""
+    if selection is None:
+        selection = Selection()
+    folders = [(folder, "")]
+    while folders:
+        path, relative = folders.pop()
+        try:
+            with os.scandir(path) as scanner:
+                entries = sorted(scanner, key=lambda entry: entry.name)
+        except OSError:
+            # Deleted or unreadable while walking - skip it
+            if path == folder:
+                raise
+            continue
+        sub_folders = []
+        for entry in entries:
+            relative_path = relative + entry.name
+            try:
+                # Links to folders are not followed, so a walk cannot loop
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if recursive and selection.searches(relative_path):
+                    sub_folders.append((entry.path, relative_path + "/"))
+            elif selection.selects(relative_path):
+                yield entry.path
+        # Popped from the end - the first sub-folder is searched first
+        folders.extend(reversed(sub_folders))
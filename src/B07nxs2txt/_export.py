@@ -0,0 +1,380 @@
+"""Export of the scans read by :class:`B07nxs2txt._reader.ScanReader` to
+data files, one table per NEXAFS or XY scan and per analyser region."""
+
+import logging
+import os
+from collections.abc import Iterable
+
+import numpy as np
+from h5py._hl.files import File
+
+from B07nxs2txt._classify import get_classifier
+from B07nxs2txt._images import reduce_image
+from B07nxs2txt._reader import Layout, ScanReader
+from B07nxs2txt._reduce import combine_sweeps, normalise, rebin
+from B07nxs2txt._utils import (
+    NUMBER_FORMAT,
+    XPS_SCAN_TYPES,
+    ConversionOptions,
+    ConversionResult,
+    ConversionStats,
+    DatasetColumn,
+    ScanType,
+    read_values,
+)
+from B07nxs2txt._writers import exported_table, write_table
+
+logger = logging.getLogger(__name__)
+
+
+def classify_scan_type(
+    keys: Iterable[str] | None, layout: Layout, rules_file: str | None = None
+) -> ScanType | None:
+    """Given the names a scan is classified by (see
+    :meth:`ScanReader.classification_keys`), attempts to classify the type of
+    scan it is, using the rules in :mod:`B07nxs2txt._classify` (plus those in
+    ``rules_file``). For now, a blunt distinction is used -if the analyser is
+    involved, classify as XPS, if not and pgm_energy plus a 'current'
+    measurement is involved, classify as NEXAFS.
+    """
+    if keys is None:
+        return None
+    return get_classifier(layout.name, rules_file).classify(keys)
+
+
+def output_data(
+    reader: ScanReader,
+    filename: str,
+    filedir: str,
+    options: ConversionOptions,
+    result: ConversionResult,
+):
+    """Controls the data output according to scan file type"""
+    with result.stats.stage("classify"):
+        scan_type = classify_scan_type(
+            reader.classification_keys(), reader.layout, options.classifiers
+        )
+    result.scan_type = scan_type
+
+    if scan_type in XPS_SCAN_TYPES:
+        logger.debug("%s determined to be an %s scan.", filename, scan_type.name)
+        regions = reader.regions()
+        logger.debug("Number of regions found: %d", len(regions))
+        for region in regions:
+            logger.debug("Region %s", region)
+            export_xps_data(reader, region, filename, filedir, options, result)
+            if options.images:
+                export_image_data(reader, region, filename, filedir, options, result)
+
+    elif scan_type == ScanType.NEXAFS:
+        logger.debug("%s determined to be a simple NEXAFS scan.", filename)
+        export_nexafs_data(reader, filename, None, filedir, options, result)
+
+    elif scan_type == ScanType.NEXAFS_ANALYSER:
+        logger.debug(
+            "%s determined to be a NEXAFS scan with analyser output.", filename
+        )
+        regions = reader.regions()
+        if len(regions) == 1:
+            logger.debug("Region name: %s", regions[0])
+            export_nexafs_data(reader, filename, regions[0], filedir, options, result)
+        else:
+            logger.warning(
+                "Number of regions does not equal 1. Not sure what to do with %s.",
+                filename,
+            )
+
+    elif scan_type == ScanType.XY_DATA:
+        logger.debug("%s determined to be an XY_DATA scan.", filename)
+        export_xy_data(reader, filename, filedir, options, result)
+
+    else:
+        logger.info(
+            "Could not detect type of scan for %s. No output file will be written.",
+            filename,
+        )
+
+
+def nexafs_columns(
+    reader: ScanReader, region_name: str | None = None
+) -> tuple[list[str], list[np.ndarray | DatasetColumn]]:
+    """The titles and columns of a NEXAFS table: the photon energy, the
+    intensity of the analyser region (if any) and the currents"""
+    title_list = []  # list to store column titles
+    data_list = []  # list to store data
+
+    if region_name:
+        title_list.append(region_name)
+        data_list.append(reader.column(region_name))
+
+    for item in reader.scannables():
+        # Adds pgm_energy as well as any scannables with ca/femto in their name
+        if item in reader.layout.energy_names:
+            # Hacky special case - want this to be the first column
+            column = reader.column(item)
+            if len(column) != 0:
+                title_list.insert(0, item)
+                data_list.insert(0, column)
+        elif ("ca" in item) or ("femto" in item):
+            column = reader.column(item)
+            if len(column) != 0:
+                title_list.append(item)
+                data_list.append(column)
+    return title_list, data_list
+
+
+def xy_columns(
+    reader: ScanReader,
+) -> tuple[list[str], list[np.ndarray | DatasetColumn]]:
+    """The titles and columns of an XY table: the scannable moved and the
+    currents"""
+    title_list = []  # list to store column titles
+    data_list = []  # list to store data
+    for item in reader.scannables():
+        if ("sm21b" in item) or (
+            "dummy" in item
+        ):  # Hacky special case - want this to be the first column
+            title_list.insert(0, item)
+            data_list.insert(0, reader.column(item))
+        elif ("ca" in item) or ("femto" in item):
+            title_list.append(item)
+            data_list.append(reader.column(item))
+    return title_list, data_list
+
+
+def export_nexafs_data(
+    reader: ScanReader,
+    filename: str,
+    region_name: str | None,
+    filedir: str,
+    options: ConversionOptions,
+    result: ConversionResult,
+):
+    """Format pgm_energy vs current and trigger writing to
+    a file
+    """
+    title_list, data_list = nexafs_columns(reader, region_name)
+    if data_list:
+        logger.debug("Data types found: %s", " ".join(title_list))
+        if options.normalise:
+            normalise_currents(reader, title_list, data_list, options, result)
+        data_list = rebinned(data_list, options, result.stats)
+        filename = filename.split(".")[0] + "_NEXAFS.dat"
+        filename = filename.replace(" ", "_")
+        write_data_out(
+            filename, title_list, data_list, filedir, options, result, region_name
+        )
+        logger.debug("Data written to file %s", filename)
+
+
+def export_xy_data(
+    reader: ScanReader,
+    filename: str,
+    filedir: str,
+    options: ConversionOptions,
+    result: ConversionResult,
+):
+    """Format scannable vs current and trigger writing to a file"""
+    title_list, data_list = xy_columns(reader)
+    if data_list:
+        logger.debug("Data types found: %s", " ".join(title_list))
+        filename = filename.split(".")[0] + "_XY.dat"
+        filename = filename.replace(" ", "_")
+        write_data_out(filename, title_list, data_list, filedir, options, result)
+        logger.debug("Data written to file %s", filename)
+
+
+def export_xps_data(
+    reader: ScanReader,
+    region_path: str,
+    filename: str,
+    filedir: str,
+    options: ConversionOptions,
+    result: ConversionResult,
+):
+    """Format binding_energy vs intensity data and trigger writing to
+    a file
+    """
+    columns = reader.xps_columns(region_path)
+    if columns is None:
+        logger.warning("Empty binding energy dataset - skipping %s", filename)
+        return
+
+    region_name = region_path.split("/")[-1]
+    if options.sweeps:
+        columns = combined_sweeps(columns, options, result, region_name)
+    filename = filename.split(".")[0] + "_" + region_name + "_XPS.dat"
+    filename = filename.replace(" ", "_")
+    write_data_out(
+        filename,
+        list(columns),
+        rebinned(list(columns.values()), options, result.stats),
+        filedir,
+        options,
+        result,
+        region_name,
+    )
+    logger.debug("Data for region %s written to file %s", region_name, filename)
+
+
+def combined_sweeps(
+    columns: dict[str, DatasetColumn],
+    options: ConversionOptions,
+    result: ConversionResult,
+    region_name: str,
+) -> dict[str, np.ndarray | DatasetColumn]:
+    """Replace the sweeps of an analyser region with their sum or mean"""
+    names = [name for name in columns if name.startswith("spectrum_")]
+    if not names:
+        return columns
+    combined: dict[str, np.ndarray | DatasetColumn] = {
+        name: column for name, column in columns.items() if name not in names
+    }
+    rows = min(len(columns[name]) for name in names)
+    sweeps = np.stack(
+        [read_values(columns[name], slice(rows), result.stats) for name in names]
+    )
+    with result.stats.stage("reduce"):
+        values, rejected = combine_sweeps(sweeps, options.sweeps, options.reject_sigma)
+    if rejected.any():
+        logger.info(
+            "Left out outlier sweeps %s of region %s",
+            ", ".join(np.array(names)[rejected]),
+            region_name,
+        )
+    combined[f"sweeps_{options.sweeps}"] = values
+    return combined
+
+
+def normalise_currents(
+    reader: ScanReader,
+    title_list: list[str],
+    data_list: list[np.ndarray | DatasetColumn],
+    options: ConversionOptions,
+    result: ConversionResult,
+):
+    """Divide the currents of a NEXAFS table by the reference current, in
+    place"""
+    if options.normalise not in title_list:
+        logger.warning(
+            "No reference current %s to normalise by - writing raw currents",
+            options.normalise,
+        )
+        return
+    reference_index = title_list.index(options.normalise)
+    reference = read_values(data_list[reference_index], slice(None), result.stats)
+    for index, title in enumerate(title_list):
+        if index == reference_index or title in reader.layout.energy_names:
+            continue
+        values = read_values(data_list[index], slice(None), result.stats)
+        with result.stats.stage("reduce"):
+            data_list[index] = normalise(values, reference)
+        # No "/", which HDF5 and zip archives take for a path separator
+        title_list[index] = f"{title}_over_{options.normalise}"
+
+
+def rebinned(
+    data_list: list[np.ndarray | DatasetColumn],
+    options: ConversionOptions,
+    stats: ConversionStats,
+) -> list[np.ndarray | DatasetColumn]:
+    """Average every ``options.rebin`` rows of the columns together"""
+    if options.rebin <= 1:
+        return data_list
+    values = [read_values(column, slice(None), stats) for column in data_list]
+    with stats.stage("reduce"):
+        return rebin(values, options.rebin)
+
+
+def export_image_data(
+    reader: ScanReader,
+    region_path: str,
+    filename: str,
+    filedir: str,
+    options: ConversionOptions,
+    result: ConversionResult,
+):
+    """Reduce the detector images of an analyser region to an
+    angle-integrated spectrum (``_ANGLEINT``) and an energy-angle map
+    (``_MAP``, one column per angle) and trigger writing them to files
+    """
+    image = reader.image(region_path)
+    columns = reader.xps_columns(region_path)
+    if image is None or columns is None:
+        logger.debug("No images to reduce for region %s", region_path)
+        return
+    dataset, mapped = image
+    energy = columns["binding_energy"]
+    if len(energy) != dataset.shape[-1]:
+        logger.warning(
+            "Images of region %s do not match its %d binding energies - skipping",
+            region_path,
+            len(energy),
+        )
+        return
+
+    reduced = reduce_image(dataset, mapped, options.angle_roi, stats=result.stats)
+    logger.debug("Summed %d images of region %s", reduced.images, region_path)
+    angles = reader.angles(region_path)
+    if angles is None or len(angles) != dataset.shape[-2]:
+        angle_titles = [f"angle_{index}" for index in range(dataset.shape[-2])]
+    else:
+        angle_titles = [f"angle_{NUMBER_FORMAT % angle}" for angle in angles]
+
+    region_name = region_path.split("/")[-1]
+    base = filename.split(".")[0] + "_" + region_name
+    base = base.replace(" ", "_")
+    write_data_out(
+        base + "_ANGLEINT.dat",
+        ["binding_energy", "intensity"],
+        [energy, reduced.spectrum],
+        filedir,
+        options,
+        result,
+        region_name,
+    )
+    write_data_out(
+        base + "_MAP.dat",
+        ["binding_energy", *angle_titles],
+        [energy, *reduced.energy_angle_map],
+        filedir,
+        options,
+        result,
+        region_name,
+    )
+    logger.debug("Images of region %s written to %s_*.dat", region_name, base)
+
+
+def write_data_out(
+    filename: str,
+    title_list: list[str],
+    data_list: list[np.ndarray | DatasetColumn],
+    filedir: str,
+    options: ConversionOptions,
+    result: ConversionResult,
+    region_name: str | None = None,
+):
+    """Writes out the data columns in each of the requested formats."""
+    output_base = os.path.join(filedir, os.path.splitext(filename)[0])
+    result.outputs.extend(
+        write_table(output_base, title_list, data_list, options, result.stats)
+    )
+    if options.aggregate:
+        result.tables.append(
+            exported_table(filename, region_name, title_list, data_list, result.stats)
+        )
+
+
+def convert_nexus(
+    nexus: File, filepath: str, options: ConversionOptions, layout: Layout
+) -> ConversionResult:
+    """Converts an open .nxs file of the given layout, returning what was
+    written"""
+    result = ConversionResult(file_path=filepath, main_node_new=layout.name == "new")
+
+    filename = filepath.split("/")[-1]
+    filedir = options.output_dir or filepath.split(filename)[0]
+
+    reader = ScanReader(nexus, layout, result.stats)
+    output_data(reader, filename, filedir, options, result)
+    return result
@@ -0,0 +1,58 @@
+"""Reading contiguous datasets without going through HDF5.
+
+The values of a contiguous dataset (neither chunked nor filtered) are stored
+in one block of the file, at an offset HDF5 reports. A :class:`FileMap`
+memory-maps the file once and returns these blocks as read-only arrays, so
+reading a column costs no HDF5 selection, buffer allocation or copy: pages
+are only read from the file when the values are formatted. Any other dataset
+is read through h5py as before, as are datasets stored in other files
+through external links.
+
+A mapped array keeps the mapping (and a file descriptor) alive until it is
+garbage collected, so arrays kept beyond the conversion of the file should
+be copied (see :func:`~B07nxs2txt._writers.exported_table`).
+"""
+
+import mmap
+
+import numpy as np
+from h5py._hl.dataset import Dataset
+from h5py._hl.files import File
+
+MAPPED_KINDS = "biuf"  # bool, integer and floating point values
+MAPPED_DRIVERS = ("sec2", "core", "stdio")  # drivers storing the file as is
+
+
+class FileMap:
+    """Zero-copy views of the contiguous datasets of an open .nxs file"""
+
+    def __init__(self, nexus: File):
+        self.file_path = nexus.filename if nexus.driver in MAPPED_DRIVERS else None
+        self.fileno = nexus.id.fileno  # of the datasets stored in the mapped file
+        self._map: mmap.mmap | None = None
+
+    def _mapped(self) -> mmap.mmap | None:
+        if self._map is None and self.file_path is not None:
+            try:
+                with open(self.file_path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                self.file_path = None  # e.g. an empty file, or not mappable
+        return self._map
+
+    def view(self, dataset: Dataset) -> np.ndarray | None:
+        """The values of the dataset mapped from the file, or None if they
+        have to be read through h5py"""
+        dtype = dataset.dtype
+        if dtype.kind not in MAPPED_KINDS or self.file_path is None:
+            return None
+        if dataset.id.fileno != self.fileno:
+            return None  # e.g. behind an external link, offset in another file
+        offset = dataset.id.get_offset()  # None unless contiguous and written
+        if offset is None or offset % dtype.alignment:
+            return None
+        mapped = self._mapped()
+        if mapped is None or offset + dataset.size * dtype.itemsize > len(mapped):
+            return None
+        values = np.frombuffer(mapped, dtype, count=dataset.size, offset=offset)
+        return values.reshape(dataset.shape)
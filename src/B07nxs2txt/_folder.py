@@ -0,0 +1,279 @@
+"""Reading the scans of a folder as arrays, without writing data files.
+
+:func:`open_folder` gives the scans of a folder by scan number and type, and
+the tables of a scan hold the columns the exporters would have written (see
+:func:`~B07nxs2txt._export.convert_nexus`), as NumPy arrays::
+
+    folder = open_folder("/dls/b07/data/2024/visit")
+    for scan in folder.scans("XPS"):
+        arrays = scan.arrays(region="Survey")
+        plot(arrays["binding_energy"], arrays["intensity"])
+
+The columns read and the open files are kept in least recently used caches,
+bounded by :data:`CACHE_BYTES` and :data:`MAX_OPEN_FILES`, so that plotting
+the same scans again does not read them again. A file that changed since it
+was read is read again.
+"""
+
+import dataclasses
+import logging
+import os
+from collections import OrderedDict
+from collections.abc import Iterator
+
+import h5py
+import numpy as np
+from h5py._hl.files import File
+
+from B07nxs2txt._discover import Selection, iter_nxs_files
+from B07nxs2txt._export import classify_scan_type, convert_nexus
+from B07nxs2txt._reader import Layout, ScanReader, detect_layout
+from B07nxs2txt._utils import (
+    CHUNK_CACHE_SIZE,
+    CHUNK_CACHE_SLOTS,
+    ConversionOptions,
+    ExportedTable,
+    ScanType,
+    scan_number,
+)
+
+CACHE_BYTES = 1 << 30  # columns kept in memory, per folder
+MAX_OPEN_FILES = 32  # files kept open, per folder
+
+logger = logging.getLogger(__name__)
+
+
+def _file_key(file_path: str) -> tuple[int, int]:
+    """Changes when the file is written"""
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileCache:
+    """The files last opened, closing the least recently used ones beyond
+    ``max_open`` files"""
+
+    def __init__(self, max_open: int = MAX_OPEN_FILES):
+        self.max_open = max_open
+        self._files: OrderedDict[str, tuple[tuple[int, int], File]] = OrderedDict()
+
+    def open(self, file_path: str) -> File:
+        key = _file_key(file_path)
+        cached = self._files.pop(file_path, None)
+        if cached is not None and cached[0] != key:
+            cached[1].close()
+            cached = None
+        if cached is None:
+            nexus = h5py.File(
+                file_path,
+                "r",
+                libver="latest",
+                rdcc_nbytes=CHUNK_CACHE_SIZE,
+                rdcc_nslots=CHUNK_CACHE_SLOTS,
+            )
+            cached = key, nexus
+        self._files[file_path] = cached
+        while len(self._files) > max(self.max_open, 1):
+            _, (_, oldest) = self._files.popitem(last=False)
+            oldest.close()
+        return cached[1]
+
+    def close(self):
+        for _, nexus in self._files.values():
+            nexus.close()
+        self._files.clear()
+
+
+class TableCache:
+    """The tables last read, dropping the least recently used ones beyond
+    ``max_bytes`` of columns"""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tables: OrderedDict[tuple, tuple[int, list[ExportedTable]]] = (
+            OrderedDict()
+        )
+
+    def get(self, key: tuple) -> list[ExportedTable] | None:
+        cached = self._tables.get(key)
+        if cached is None:
+            return None
+        self._tables.move_to_end(key)
+        return cached[1]
+
+    def put(self, key: tuple, tables: list[ExportedTable]):
+        nbytes = sum(column.nbytes for table in tables for column in table.columns)
+        if nbytes > self.max_bytes:
+            return  # would evict everything else
+        previous = self._tables.pop(key, None)
+        if previous is not None:
+            self.nbytes -= previous[0]
+        self._tables[key] = nbytes, tables
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, (evicted, _) = self._tables.popitem(last=False)
+            self.nbytes -= evicted
+
+    def clear(self):
+        self._tables.clear()
+        self.nbytes = 0
+
+
+class Scan:
+    """A .nxs file of a :class:`ScanFolder`"""
+
+    def __init__(self, folder: "ScanFolder", file_path: str):
+        self.folder = folder
+        self.file_path = file_path
+        self.number = scan_number(os.path.basename(file_path))
+        self._scan_type: tuple[tuple[int, int], ScanType | None] | None = None
+
+    def __repr__(self) -> str:
+        return f"Scan({self.file_path!r})"
+
+    def _open(self) -> tuple[File, Layout | None]:
+        nexus = self.folder.files.open(self.file_path)
+        return nexus, detect_layout(nexus)
+
+    @property
+    def scan_type(self) -> ScanType | None:
+        """The type of scan, or None if it could not be classified (or the
+        file could not be read)"""
+        key = _file_key(self.file_path)
+        if self._scan_type is None or self._scan_type[0] != key:
+            try:
+                nexus, layout = self._open()
+            except OSError as e:
+                logger.warning("Error reading %s: %s", self.file_path, e)
+                return None
+            scan_type = None
+            if layout is not None:
+                reader = ScanReader(nexus, layout)
+                scan_type = classify_scan_type(
+                    reader.classification_keys(),
+                    layout,
+                    self.folder.options.classifiers,
+                )
+            self._scan_type = key, scan_type
+        return self._scan_type[1]
+
+    @property
+    def tables(self) -> list[ExportedTable]:
+        """The tables the exporters select from the scan, with the options of
+        the folder - one per analyser region for XPS scans"""
+        key = (self.file_path, *_file_key(self.file_path))
+        tables = self.folder.cache.get(key)
+        if tables is None:
+            nexus, layout = self._open()
+            tables = []
+            if layout is not None:
+                result = convert_nexus(
+                    nexus, self.file_path, self.folder.table_options, layout
+                )
+                tables = result.tables
+                self._scan_type = key[1:], result.scan_type
+            self.folder.cache.put(key, tables)
+        return tables
+
+    def table(
+        self, region: str | None = None, kind: str | None = None
+    ) -> ExportedTable:
+        """The first table of the analyser region and kind (e.g. "XPS",
+        "NEXAFS"), if given"""
+        for table in self.tables:
+            if region not in (None, table.region):
+                continue
+            if kind not in (None, table.kind):
+                continue
+            return table
+        raise KeyError(f"No table for region {region} of kind {kind} in {self}")
+
+    def arrays(
+        self, region: str | None = None, kind: str | None = None
+    ) -> dict[str, np.ndarray]:
+        """The columns of :meth:`table` by title"""
+        table = self.table(region, kind)
+        return dict(zip(table.titles, table.columns, strict=True))
+
+
+class ScanFolder:
+    """The scans of a folder, see :func:`open_folder`"""
+
+    def __init__(
+        self,
+        folder: str,
+        options: ConversionOptions | None = None,
+        recursive: bool = False,
+        selection: Selection | None = None,
+        cache_bytes: int = CACHE_BYTES,
+        max_open_files: int = MAX_OPEN_FILES,
+    ):
+        self.folder = os.path.abspath(folder)
+        self.options = options or ConversionOptions()
+        # The tables are returned rather than written
+        self.table_options = dataclasses.replace(
+            self.options, formats=(), aggregate=True
+        )
+        self.cache = TableCache(cache_bytes)
+        self.files = FileCache(max_open_files)
+        self._scans = [
+            Scan(self, file_path)
+            for file_path in iter_nxs_files(self.folder, selection, recursive)
+        ]
+        self._by_number: dict[int, Scan] = {}
+        for scan in self._scans:
+            if scan.number is not None:
+                self._by_number.setdefault(scan.number, scan)
+
+    def __len__(self) -> int:
+        return len(self._scans)
+
+    def __iter__(self) -> Iterator[Scan]:
+        return iter(self._scans)
+
+    def __getitem__(self, number: int) -> Scan:
+        return self._by_number[number]
+
+    def __contains__(self, number: int) -> bool:
+        return number in self._by_number
+
+    def numbers(self) -> list[int]:
+        """The scan numbers, in order"""
+        return sorted(self._by_number)
+
+    def scans(self, scan_type: ScanType | str | None = None) -> list[Scan]:
+        """The scans of the given type (e.g. ``"XPS"``), or every scan"""
+        if scan_type is None:
+            return list(self._scans)
+        if isinstance(scan_type, str):
+            scan_type = ScanType[scan_type]
+        return [scan for scan in self._scans if scan.scan_type == scan_type]
+
+    def close(self):
+        """Closes the open files and empties the cache"""
+        self.files.close()
+        self.cache.clear()
+
+    def __enter__(self) -> "ScanFolder":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_folder(
+    folder: str,
+    options: ConversionOptions | None = None,
+    recursive: bool = False,
+    selection: Selection | None = None,
+    cache_bytes: int = CACHE_BYTES,
+    max_open_files: int = MAX_OPEN_FILES,
+) -> ScanFolder:
+    """The scans of the .nxs files in a folder (and its sub-folders if
+    ``recursive``), read with the given options (e.g. ``sweeps="mean"``),
+    keeping up to ``cache_bytes`` of columns and ``max_open_files`` files
+    open."""
+    return ScanFolder(
+        folder, options, recursive, selection, cache_bytes, max_open_files
+    )
@@ -0,0 +1,110 @@
+"""Reduction of the detector images of an analyser region to spectra.
+
+The analyser records an image per point of a scan, angle against energy,
+stacked in a dataset of shape ``(..., angles, energies)`` that can be much
+larger than memory. It is read in blocks aligned to its HDF5 chunks (see
+:func:`iter_blocks`), so that every chunk is read and decompressed once,
+and summed over the scan points into an energy-angle map. The
+angle-integrated spectrum is the sum of the map over the angles of interest.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from B07nxs2txt._utils import CHUNK_VALUES, ConversionStats, read_values
+
+if TYPE_CHECKING:
+    import numpy as np
+    from h5py._hl.dataset import Dataset
+
+
+def parse_angle_roi(text: str) -> tuple[int, int]:
+    """Angle channels given as ``"START:STOP"`` (STOP excluded)"""
+    start, _, stop = text.partition(":")
+    try:
+        roi = int(start), int(stop)
+    except ValueError as e:
+        raise ValueError(f"Invalid angle range {text!r}, expected START:STOP") from e
+    if not 0 <= roi[0] < roi[1]:
+        raise ValueError(f"Invalid angle range {text!r}, expected 0 <= START < STOP")
+    return roi
+
+
+@dataclass
+class ReducedImage:
+    """The images of a region summed over the points of the scan"""
+
+    energy_angle_map: np.ndarray  # (angles, energies)
+    spectrum: np.ndarray  # summed over the angles of interest
+    images: int  # number of images summed
+
+
+def block_shape(
+    shape: tuple[int, ...], chunks: tuple[int, ...], block_values: int
+) -> tuple[int, ...]:
+    """The largest block of whole chunks holding about ``block_values``
+    values (or a single chunk, if larger), grown from the last axis so that
+    blocks are as contiguous as the chunks allow"""
+    block = list(chunks)
+    for axis in reversed(range(len(shape))):
+        others = math.prod(block) // block[axis]
+        count = max(1, block_values // (others * chunks[axis]))
+        block[axis] = min(shape[axis], count * chunks[axis])
+        if block[axis] < shape[axis]:
+            break
+    return tuple(block)
+
+
+def iter_blocks(
+    shape: tuple[int, ...], chunks: tuple[int, ...], block_values: int = CHUNK_VALUES
+) -> Iterator[tuple[slice, ...]]:
+    """Selections tiling a dataset of the given shape with blocks of whole
+    chunks, in the order the chunks are stored"""
+    block = block_shape(shape, chunks, block_values)
+    starts = [range(0, length, step) for length, step in zip(shape, block, strict=True)]
+    for corner in itertools.product(*starts):
+        yield tuple(
+            slice(start, min(start + step, length))
+            for start, step, length in zip(corner, block, shape, strict=True)
+        )
+
+
+def reduce_image(
+    dataset: Dataset,
+    mapped: np.ndarray | None = None,
+    angle_roi: tuple[int, int] | None = None,
+    block_values: int = CHUNK_VALUES,
+    stats: ConversionStats | None = None,
+) -> ReducedImage:
+    """Sums the images of a dataset of shape ``(..., angles, energies)``.
+
+    ``mapped`` is the dataset mapped from the file, if it is contiguous (see
+    :class:`~B07nxs2txt._fastread.FileMap`), and is read instead of the
+    dataset. ``angle_roi`` are the first and last (excluded) angle channels
+    summed into the spectrum, by default all of them.
+    """
+    import numpy as np
+
+    if stats is None:
+        stats = ConversionStats()
+    shape = dataset.shape
+    # Contiguous datasets are read a row of energies at a time
+    chunks = dataset.chunks or (1,) * (len(shape) - 1) + shape[-1:]
+    source = dataset if mapped is None else mapped
+    energy_angle_map = np.zeros(shape[-2:])
+    for selection in iter_blocks(shape, chunks, block_values):
+        block = read_values(source, selection, stats)
+        with stats.stage("reduce"):
+            block = block.reshape(-1, *block.shape[-2:])
+            energy_angle_map[selection[-2:]] += block.sum(axis=0, dtype=np.float64)
+    start, stop = angle_roi or (0, shape[-2])
+    return ReducedImage(
+        energy_angle_map=energy_angle_map,
+        spectrum=energy_angle_map[start:stop].sum(axis=0),
+        images=math.prod(shape[:-2]),
+    )
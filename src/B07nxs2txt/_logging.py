@@ -0,0 +1,131 @@
+"""Logging set-up for the command line tool, with a progress line on the
+console."""
+
+import logging
+import sys
+import time
+from typing import TextIO
+
+LOGGER_NAME = "B07nxs2txt"
+FILE_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+REDRAW_INTERVAL = 0.1  # seconds between redraws of the progress line
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
+
+
+class Progress:
+    """A single line showing the files done out of ``total``, the rate and
+    the estimated time left, redrawn in place on a terminal. Only the files
+    done and the rate are shown if the total is not known (None)."""
+
+    def __init__(self, total: int | None, stream: TextIO):
+        self.total = total
+        self.stream = stream
+        self.done = 0
+        self._start = time.monotonic()
+        self._drawn_at = 0.0
+        self._width = 0
+
+    def update(self, done: int = 1):
+        self.done += done
+        self.draw(force=self.done == self.total)
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        if self.total is None:
+            return f"[{self.done}] {rate:.1f} files/s"
+        line = f"[{self.done}/{self.total}] {rate:.1f} files/s"
+        if 0 < self.done < self.total and rate > 0:
+            line += f", {format_duration((self.total - self.done) / rate)} left"
+        return line
+
+    def draw(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._drawn_at < REDRAW_INTERVAL:
+            return
+        self._drawn_at = now
+        line = self.line()
+        self.stream.write("\r" + line.ljust(self._width))
+        self.stream.flush()
+        self._width = len(line)
+
+    def clear(self):
+        if self._width:
+            self.stream.write("\r" + " " * self._width + "\r")
+            self._width = 0
+
+    def close(self):
+        self.clear()
+        self.stream.flush()
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Plain messages, prefixed with the level for warnings and errors"""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        if record.levelno >= logging.WARNING:
+            return f"{record.levelname}: {record.message}"
+        return record.message
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """Writes to the console, moving the progress line (if any) below the
+    messages"""
+
+    def __init__(self, stream: TextIO):
+        super().__init__(stream)
+        self.progress: Progress | None = None
+
+    def emit(self, record: logging.LogRecord):
+        if self.progress is None:
+            super().emit(record)
+            return
+        self.progress.clear()
+        super().emit(record)
+        self.progress.draw(force=True)
+
+    def start_progress(self, total: int | None) -> Progress | None:
+        """Shows progress through ``total`` files, if the console is a
+        terminal that shows informational messages"""
+        if not self.stream.isatty() or self.level > logging.INFO:
+            return None
+        self.progress = Progress(total, self.stream)
+        return self.progress
+
+    def stop_progress(self):
+        if self.progress is not None:
+            self.progress.close()
+            self.progress = None
+
+
+def configure_logging(
+    level: int = logging.INFO, quiet: bool = False, log_file: str | None = None
+) -> ConsoleHandler:
+    """Sends the messages of the package at ``level`` and above to stderr
+    (only warnings and errors if ``quiet``) and to ``log_file``"""
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    console = ConsoleHandler(sys.stderr)
+    console.setLevel(max(level, logging.WARNING) if quiet else level)
+    console.setFormatter(ConsoleFormatter())
+    logger.addHandler(console)
+    if log_file is not None:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(level)
+        file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+        logger.addHandler(file_handler)
+    # Records below every handler's level are dropped before being formatted
+    logger.setLevel(min(handler.level for handler in logger.handlers))
+    logger.propagate = False
+    return console
@@ -0,0 +1,149 @@
+"""Record of converted files, used to skip scans whose outputs are up to date."""
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+from B07nxs2txt._utils import ConversionOptions, ConversionResult
+from B07nxs2txt._version import __version__
+
+MANIFEST_NAME = ".cuddle_manifest.json"
+MANIFEST_FORMAT = 1
+HASH_CHUNK_SIZE = 1 << 20
+
+
+# Options changing only how fast the outputs are written, not what they hold
+PERFORMANCE_OPTIONS = ("compression_threads",)
+
+
+def options_record(options: ConversionOptions) -> dict:
+    """The conversion options as stored in the manifest (JSON types only),
+    without :data:`PERFORMANCE_OPTIONS`"""
+    record = asdict(options)
+    for name in PERFORMANCE_OPTIONS:
+        del record[name]
+    return json.loads(json.dumps(record))
+
+
+def file_hash(file_path: str) -> str:
+    """SHA-256 of the file contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    """What is known about one converted source file"""
+
+    mtime_ns: int
+    size: int
+    sha256: str
+    converter_version: str
+    layout: str | None  # "new" or "old"
+    scan_type: str | None
+    outputs: list[str] = field(default_factory=list)
+    options: dict = field(default_factory=dict)
+
+
+class Manifest:
+    """JSON manifest stored next to the converted outputs.
+
+    A source file is considered up to date when it was converted by the same
+    converter version with the same options, all of its outputs still exist
+    and either its
+    mtime/size are unchanged or, if only the mtime changed, its contents hash
+    to the recorded value.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.entries: dict[str, ManifestEntry] = {}
+        self._dirty = False
+        try:
+            with open(self.path) as f:
+                content = json.load(f)
+            if content.get("format") == MANIFEST_FORMAT:
+                self.entries = {
+                    name: ManifestEntry(**entry)
+                    for name, entry in content["files"].items()
+                }
+        except (OSError, ValueError, TypeError, KeyError):
+            # Missing or unreadable manifest - everything will be converted
+            self.entries = {}
+
+    def _key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.folder)
+
+    def entry(self, file_path: str) -> ManifestEntry | None:
+        return self.entries.get(self._key(file_path))
+
+    def is_up_to_date(self, file_path: str, options: ConversionOptions) -> bool:
+        entry = self.entries.get(self._key(file_path))
+        if entry is None or entry.converter_version != __version__:
+            return False
+        if entry.options != options_record(options):
+            return False
+        if not all(
+            os.path.exists(os.path.join(self.folder, output))
+            for output in entry.outputs
+        ):
+            return False
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        if stat.st_size != entry.size:
+            return False
+        if stat.st_mtime_ns == entry.mtime_ns:
+            return True
+        if file_hash(file_path) != entry.sha256:
+            return False
+        # Touched but unchanged - remember the new mtime to avoid rehashing
+        entry.mtime_ns = stat.st_mtime_ns
+        self._dirty = True
+        return True
+
+    def record(self, result: ConversionResult, options: ConversionOptions):
+        """Stores the outcome of a successful conversion, with the mtime, size
+        and hash the converter took when it opened the file"""
+        if result.error is not None or result.sha256 is None:
+            self.forget(result.file_path)
+            return
+        if result.main_node_new is None:
+            layout = None
+        else:
+            layout = "new" if result.main_node_new else "old"
+        self.entries[self._key(result.file_path)] = ManifestEntry(
+            mtime_ns=result.mtime_ns,
+            size=result.size,
+            sha256=result.sha256,
+            converter_version=__version__,
+            layout=layout,
+            scan_type=result.scan_type.name if result.scan_type else None,
+            outputs=[self._key(output) for output in result.outputs],
+            options=options_record(options),
+        )
+        self._dirty = True
+
+    def forget(self, file_path: str):
+        if self.entries.pop(self._key(file_path), None) is not None:
+            self._dirty = True
+
+    def save(self):
+        """Atomically writes the manifest if anything changed"""
+        if not self._dirty:
+            return
+        content = {
+            "format": MANIFEST_FORMAT,
+            "files": {name: asdict(entry) for name, entry in self.entries.items()},
+        }
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(content, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self._dirty = False
@@ -0,0 +1,208 @@
+"""Conversion of many .nxs files across a pool of worker processes."""
+
+import cProfile
+import dataclasses
+import logging
+import os
+import time
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain, islice
+
+from B07nxs2txt._logging import LOGGER_NAME
+from B07nxs2txt._manifest import ManifestEntry
+from B07nxs2txt._pipeline import PREFETCH_FILES, prefetched
+from B07nxs2txt._utils import ConversionOptions, ConversionResult
+
+WORKER_CRASHED = "worker process crashed while converting this file"
+
+
+def default_jobs() -> int:
+    """Number of CPUs available to this process"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def convert_file(
+    file_path: str,
+    options: ConversionOptions,
+    hash_file: bool = False,
+    previous: ManifestEntry | None = None,
+) -> ConversionResult:
+    """:func:`B07nxs2txt.converter.convert_file`, imported (with h5py) once
+    there is a file to convert"""
+    from B07nxs2txt.converter import convert_file
+
+    return convert_file(file_path, options, hash_file, previous)
+
+
+class RecordCollector(logging.Handler):
+    """Keeps log records so that they can be sent to the parent process"""
+
+    def __init__(self):
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        # Merge the arguments as they may not be picklable, as QueueHandler does
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _convert_captured(
+    file_path: str,
+    options: ConversionOptions,
+    profile: bool = False,
+    level: int = 0,
+    hash_file: bool = False,
+    previous: ManifestEntry | None = None,
+) -> tuple[ConversionResult, list[logging.LogRecord]]:
+    """Worker entry point - converts a file and returns what it logged at
+    ``level`` and above, so that the messages of concurrent conversions are not
+    interleaved"""
+    logger = logging.getLogger(LOGGER_NAME)
+    saved = logger.handlers, logger.level, logger.propagate
+    collector = RecordCollector()
+    logger.handlers = [collector]
+    logger.setLevel(level or logger.getEffectiveLevel())
+    logger.propagate = False
+    try:
+        if profile:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(
+                convert_file, file_path, options, hash_file, previous
+            )
+            profiler.create_stats()
+            result.stats.profile = profiler.stats  # type: ignore
+        else:
+            result = convert_file(file_path, options, hash_file, previous)
+    finally:
+        logger.handlers, logger.level, logger.propagate = saved
+    return result, collector.records
+
+
+def _convert_isolated(
+    file_path: str,
+    options: ConversionOptions,
+    profile: bool,
+    level: int,
+    hash_file: bool,
+    previous: ManifestEntry | None,
+) -> tuple[ConversionResult, list[logging.LogRecord]]:
+    """Converts a file in a dedicated worker process so that a crash can be
+    attributed to it"""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(
+            _convert_captured, file_path, options, profile, level, hash_file, previous
+        )
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            return ConversionResult(file_path=file_path, error=WORKER_CRASHED), []
+
+
+def _with_overhead(
+    start: float, converted: tuple[ConversionResult, list[logging.LogRecord]]
+) -> tuple[ConversionResult, list[logging.LogRecord]]:
+    """Records the time between requesting a conversion and getting its result
+    that was not spent converting - process startup and moving the result
+    between processes"""
+    result = converted[0]
+    result.stats.add("overhead", time.perf_counter() - start - result.stats.seconds)
+    result.stats.seconds = time.perf_counter() - start
+    return converted
+
+
+def convert_files(
+    file_paths: Iterable[str],
+    options: ConversionOptions,
+    jobs: int,
+    profile: bool = False,
+    prefetch: int | None = None,
+    recorded: Callable[[str], ManifestEntry | None] | None = None,
+) -> Iterator[tuple[str, ConversionResult, list[logging.LogRecord]]]:
+    """Converts the given files using ``jobs`` worker processes.
+
+    Yields ``(file_path, result, records)`` in completion order, where
+    ``records`` are the messages logged by the conversion, to be passed to
+    ``logging.getLogger(record.name).handle(record)``. Only records at the
+    level enabled in this process are collected. With a single job files are
+    converted in this process, otherwise every table is compressed by a
+    single thread unless ``options.compression_threads`` says otherwise (see
+    :class:`~B07nxs2txt._pipeline.CompressingWriter`). With ``profile`` every
+    conversion runs under
+    cProfile and its statistics are returned in ``result.stats.profile``.
+
+    The next ``prefetch`` files (by default :data:`PREFETCH_FILES`, or as
+    many as there are jobs) are read ahead by a thread, so that they are
+    opened from the page cache (see :func:`~B07nxs2txt._pipeline.prefetched`).
+
+    Files are only hashed for a manifest, given as ``recorded`` which returns
+    the entry of a file in it, if any (see
+    :func:`~B07nxs2txt.converter.convert_file`).
+
+    At most ``jobs`` files are in flight at once. If a worker dies (e.g. a
+    segfault in the HDF5 library) the pool is broken and every in-flight file
+    is retried on its own, so only the file that actually crashed is reported
+    as failed and the remaining files continue in a fresh pool.
+    """
+    if prefetch is None:
+        prefetch = max(jobs, PREFETCH_FILES)
+    paths = prefetched(file_paths, prefetch)
+    level = logging.getLogger(LOGGER_NAME).getEffectiveLevel()
+
+    def arguments(file_path: str) -> tuple:
+        """Of :func:`_convert_captured` and :func:`_convert_isolated`"""
+        previous = recorded(file_path) if recorded is not None else None
+        return file_path, options, profile, level, recorded is not None, previous
+
+    if jobs <= 1:
+        for file_path in paths:
+            yield (file_path, *_convert_captured(*arguments(file_path)))
+        return
+    first = next(paths, None)
+    if first is None:
+        return
+    paths = chain([first], paths)
+    if options.compression_threads is None:
+        # The workers already use every CPU
+        options = dataclasses.replace(options, compression_threads=1)
+    # Imported once here rather than by every worker forked from this process
+    import B07nxs2txt.converter  # noqa: F401
+
+    broken = True
+    while broken:
+        broken = False
+        suspects: list[str] = []
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            running: dict[Future, tuple[str, float]] = {}
+            for file_path in islice(paths, jobs):
+                future = executor.submit(_convert_captured, *arguments(file_path))
+                running[future] = file_path, time.perf_counter()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, start = running.pop(future)
+                    try:
+                        converted = future.result()
+                    except BrokenProcessPool:
+                        suspects.append(file_path)
+                        broken = True
+                        continue
+                    yield file_path, *_with_overhead(start, converted)
+                if broken:
+                    suspects.extend(file_path for file_path, _ in running.values())
+                    break
+                for file_path in islice(paths, len(done)):
+                    future = executor.submit(_convert_captured, *arguments(file_path))
+                    running[future] = file_path, time.perf_counter()
+        for file_path in suspects:
+            start = time.perf_counter()
+            converted = _convert_isolated(*arguments(file_path))
+            yield file_path, *_with_overhead(start, converted)
@@ -0,0 +1,201 @@
+"""Overlapping the reads and writes of a conversion with its formatting.
+
+A conversion reads a .nxs file, formats its values as text and writes the
+text, and while any of these runs the others wait. Two threads let the I/O
+proceed while the converting thread formats:
+
+- :func:`prefetched` reads the files about to be converted into the page
+  cache, so that opening file N+1 does not wait for (network) storage while
+  file N is being formatted and written.
+- :class:`BackgroundWriter` writes the formatted blocks of a table while the
+  next block is formatted.
+- :class:`CompressingWriter` compresses the formatted blocks of a compressed
+  table on a pool of threads.
+
+Plain file reads and writes, and zlib and zstd compression, release the GIL,
+which HDF5 reads through h5py and the formatting do not, so only these are
+moved to threads.
+"""
+
+import collections
+import os
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO
+
+from B07nxs2txt._utils import SMALL_FILE_SIZE
+
+PREFETCH_FILES = 2  # files read ahead when converting in this process
+READ_BUFFER_SIZE = 1 << 20
+WRITE_QUEUE_DEPTH = 2  # formatted blocks waiting to be written
+COMPRESS_BLOCK_SIZE = 1 << 22  # bytes of text compressed at a time
+MAX_COMPRESS_THREADS = 4  # by default, per table written
+
+
+def warm_page_cache(file_path: str, buffer: bytearray) -> int:
+    """Reads a file small enough to be loaded whole when opened (see
+    :func:`~B07nxs2txt._utils.open_nexus`), so that opening it is served from
+    the page cache. Returns the number of bytes read."""
+    read = 0
+    try:
+        if os.path.getsize(file_path) > SMALL_FILE_SIZE:
+            return 0
+        with open(file_path, "rb", buffering=0) as f:
+            while size := f.readinto(buffer):
+                read += size
+    except OSError:
+        pass  # reported when the file is converted
+    return read
+
+
+def _warm_files(file_paths: queue.SimpleQueue):
+    buffer = bytearray(READ_BUFFER_SIZE)
+    while (file_path := file_paths.get()) is not None:
+        warm_page_cache(file_path, buffer)
+
+
+def prefetched(file_paths: Iterable[str], depth: int) -> Iterator[str]:
+    """Yields the paths, while a thread reads the next ``depth`` files.
+
+    The paths are taken from ``file_paths`` in the calling thread, as it may
+    be a generator with side effects (e.g. claiming files from a queue), up
+    to ``depth`` ahead of the path last yielded.
+    """
+    if depth <= 0:
+        yield from file_paths
+        return
+    to_warm: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+    thread = threading.Thread(
+        target=_warm_files, args=(to_warm,), name="B07nxs2txt-prefetch", daemon=True
+    )
+    thread.start()
+    ahead: collections.deque[str] = collections.deque()
+    try:
+        for file_path in file_paths:
+            ahead.append(file_path)
+            to_warm.put(file_path)
+            if len(ahead) > depth:
+                yield ahead.popleft()
+        while ahead:
+            yield ahead.popleft()
+    finally:
+        to_warm.put(None)
+
+
+class BackgroundWriter:
+    """A file-like object writing to ``output_file`` from a thread, so that
+    writing a block overlaps formatting the next one.
+
+    At most :data:`WRITE_QUEUE_DEPTH` blocks wait to be written, bounding
+    memory use. An error raised by a write is raised again by the next call
+    to :meth:`write` or by :meth:`close`, which waits for the writes.
+    """
+
+    def __init__(self, output_file: IO[str], depth: int = WRITE_QUEUE_DEPTH):
+        self._file = output_file
+        self._blocks: queue.Queue[str | None] = queue.Queue(depth)
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._write_blocks, name="B07nxs2txt-writer", daemon=True
+        )
+        self._thread.start()
+
+    def _write_blocks(self):
+        while (block := self._blocks.get()) is not None:
+            if self._error is None:
+                try:
+                    self._file.write(block)
+                except BaseException as e:
+                    self._error = e
+
+    def write(self, text: str):
+        if self._error is not None:
+            raise self._error
+        self._blocks.put(text)
+
+    def close(self):
+        self._blocks.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def compress_threads(threads: int | None = None) -> int:
+    """The threads compressing a table, by default one per CPU up to
+    :data:`MAX_COMPRESS_THREADS`"""
+    if threads is None:
+        threads = min(os.cpu_count() or 1, MAX_COMPRESS_THREADS)
+    return max(threads, 1)
+
+
+class CompressingWriter:
+    """A file-like object compressing the text written to it on a pool of
+    threads, so that compressing a block overlaps formatting the next ones.
+
+    The text is gathered into blocks of about ``block_size`` bytes, each
+    compressed on its own by ``compress`` (e.g. into a gzip member or a zstd
+    frame) and written to ``output_file`` in order, giving a stream of
+    concatenated members that decompresses to the whole text. At most twice
+    as many blocks as threads are compressed or waiting to be written,
+    bounding memory use. An error raised by compressing a block is raised
+    again by :meth:`write` or :meth:`close`.
+    """
+
+    def __init__(
+        self,
+        output_file: IO[bytes],
+        compress: Callable[[bytes], bytes],
+        threads: int | None = None,
+        block_size: int = COMPRESS_BLOCK_SIZE,
+    ):
+        self._file = output_file
+        self._compress = compress
+        self._block_size = block_size
+        threads = compress_threads(threads)
+        self._depth = 2 * threads
+        self._executor = ThreadPoolExecutor(
+            threads, thread_name_prefix="B07nxs2txt-compress"
+        )
+        self._pending: collections.deque[Future[bytes]] = collections.deque()
+        self._text: list[str] = []
+        self._buffered = 0
+        self._blocks = 0
+
+    def _submit(self):
+        block = "".join(self._text).encode("utf-8")
+        self._text.clear()
+        self._buffered = 0
+        self._pending.append(self._executor.submit(self._compress, block))
+        self._blocks += 1
+        while len(self._pending) > self._depth:
+            self._file.write(self._pending.popleft().result())
+
+    def write(self, text: str):
+        self._text.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self._block_size:
+            self._submit()
+
+    def close(self):
+        try:
+            # An empty text still gives one (empty) member, a valid stream
+            if self._buffered or not self._blocks:
+                self._submit()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self) -> "CompressingWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,203 @@
+"""Reading scans from .nxs files, whatever their layout.
+
+GDA has written two layouts: the old one under ``/entry1`` and the new one
+under ``/entry``. A :class:`Layout` describes where one of them keeps the
+scannables and analyser regions, and a :class:`ScanReader` uses it to hand
+the columns of a scan to the exporters in :mod:`B07nxs2txt._export`, so
+that these do not depend on the layout. Supporting a further layout only
+needs another :class:`Layout` in :data:`LAYOUTS`.
+"""
+
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import numpy as np
+from h5py._hl.dataset import Dataset
+from h5py._hl.files import File
+
+from B07nxs2txt._fastread import FileMap
+from B07nxs2txt._utils import (
+    ANGLE_NAMES,
+    CLASSIFICATIION_NODE_NEW,
+    GLOBAL_NODE_NEW,
+    GLOBAL_NODE_OLD,
+    IMAGE_NAMES,
+    MAIN_NODE_NEW,
+    MAIN_NODE_OLD,
+    PGM_NAMES,
+    ConversionStats,
+    DatasetColumn,
+    MetadataIndex,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Layout:
+    """Where a layout of .nxs files keeps the data of a scan"""
+
+    name: str  # also selects the classifier rules, see _classify
+    main_node: str
+    instrument_node: str
+    # Names of the scanned fields, if recorded; the members of the instrument
+    # group are classified otherwise
+    scan_fields_node: str | None
+    # Datasets holding the values of a scannable, tried in order; "" stands
+    # for the name of the scannable
+    value_names: tuple[str, ...]
+    energy_names: tuple[str, ...]  # scannables giving the first NEXAFS column
+    # Whether scannables that are not 1D are exported flattened, or skipped
+    flatten: bool
+
+
+NEW_LAYOUT = Layout(
+    name="new",
+    main_node=MAIN_NODE_NEW,
+    instrument_node=GLOBAL_NODE_NEW,
+    scan_fields_node=CLASSIFICATIION_NODE_NEW,
+    value_names=("value", ""),
+    energy_names=PGM_NAMES,
+    flatten=False,
+)
+OLD_LAYOUT = Layout(
+    name="old",
+    main_node=MAIN_NODE_OLD,
+    instrument_node=GLOBAL_NODE_OLD,
+    scan_fields_node=None,
+    value_names=("",),
+    energy_names=("pgm_energy",),
+    flatten=True,
+)
+LAYOUTS = (OLD_LAYOUT, NEW_LAYOUT)  # in the order they are looked for
+
+
+def detect_layout(nexus: File) -> Layout | None:
+    """The layout of an open .nxs file, from the main node it has"""
+    for layout in LAYOUTS:
+        if layout.main_node in nexus:
+            logger.debug("File structure is %s", layout.name.upper())
+            return layout
+    logger.warning("No main node found in %s.", nexus.filename)
+    return None
+
+
+class ScanReader:
+    """The columns of the scan in an open .nxs file.
+
+    The instrument group is indexed once (see :class:`MetadataIndex`), and
+    the dataset of each scannable is looked up in the index, so reading
+    columns costs no HDF5 metadata lookups beyond opening the datasets.
+    Columns are returned as :class:`DatasetColumn`, read lazily by the
+    writers, or as arrays. Contiguous datasets are read from a memory map of
+    the file (see :class:`FileMap`).
+    """
+
+    def __init__(
+        self, nexus: File, layout: Layout, stats: ConversionStats | None = None
+    ):
+        self.layout = layout
+        self.instrument = nexus[layout.instrument_node]
+        self.scan_fields = (
+            nexus[layout.scan_fields_node] if layout.scan_fields_node else None
+        )
+        self.file_map = FileMap(nexus)
+        if stats is None:
+            stats = ConversionStats()
+        with stats.stage("index"):
+            self.metadata = MetadataIndex(self.instrument)
+
+    def scannables(self) -> list[str]:
+        """Names of the members of the instrument group"""
+        return self.metadata.children()
+
+    def classification_keys(self) -> Iterable[str]:
+        """The names the scan is classified by"""
+        if self.scan_fields is None:
+            return self.scannables()
+        return (field.decode("utf-8") for field in self.scan_fields)
+
+    def regions(self) -> list[str]:
+        """Names of the analyser regions, stored as a list or as a single row"""
+        region_list = self.instrument["analyser/region_list"]
+        names = region_list[0, :] if region_list.ndim == 2 else region_list[:]
+        return [n.decode("utf-8") if isinstance(n, bytes) else n for n in names]
+
+    def value_path(self, item: str) -> str | None:
+        """Path of the dataset holding the values of a scannable, if any"""
+        members = self.metadata.children(item)
+        for name in self.layout.value_names:
+            path = f"{item}/{name or item}"
+            # Dangling links are not indexed
+            if (name or item) in members and path in self.metadata:
+                return path
+        return None
+
+    def dataset_column(self, path: str, row: int | None = None) -> DatasetColumn:
+        """The dataset at ``path`` in the instrument group, or one of its
+        rows"""
+        dataset = self.instrument[path]
+        return DatasetColumn(dataset, row, self.file_map.view(dataset))
+
+    def column(self, item: str) -> np.ndarray | DatasetColumn:
+        """The values of a scannable, or an empty array if it has none that
+        can be exported"""
+        path = self.value_path(item)
+        if path is None:
+            return np.empty(0)
+        if self.metadata[path].ndim == 1:
+            return self.dataset_column(path)
+        if self.layout.flatten:
+            dataset = self.instrument[path]
+            values = self.file_map.view(dataset)
+            if values is None:
+                return dataset[()].ravel()
+            return values.flatten()  # copied, so as not to keep the file mapped
+        return np.empty(0)
+
+    def xps_columns(self, region: str) -> dict[str, DatasetColumn] | None:
+        """Binding energy, intensity and the sweeps recorded for an analyser
+        region, or None if the region has no binding energies"""
+        energy_shape = self.metadata[f"{region}/binding_energy"].shape
+        if energy_shape[0] == 0:
+            return None
+        columns = {
+            "binding_energy": self.dataset_column(
+                f"{region}/binding_energy", 0 if len(energy_shape) == 2 else None
+            ),
+            "intensity": self.dataset_column(f"{region}/spectrum", 0),
+        }
+        # Only the sweeps that are written are opened
+        sweep_paths = {
+            name: f"{region}/{name}"
+            for name in self.metadata.children(region)
+            if "spectrum_" in name
+            and f"{region}/{name}" in self.metadata
+            and self.metadata[f"{region}/{name}"].shape[0] > 0
+        }
+        for index in range(len(sweep_paths)):
+            name = f"spectrum_{index + 1}"
+            columns[name] = self.dataset_column(sweep_paths[name], 0)
+        return columns
+
+    def image(self, region: str) -> tuple[Dataset, np.ndarray | None] | None:
+        """The detector images of an analyser region, of shape ``(...,
+        angles, energies)``, and their values mapped from the file if it is
+        contiguous, or None if the region has no images"""
+        for name in IMAGE_NAMES:
+            path = f"{region}/{name}"
+            if path in self.metadata and self.metadata[path].ndim >= 2:
+                dataset = self.instrument[path]
+                return dataset, self.file_map.view(dataset)
+        return None
+
+    def angles(self, region: str) -> np.ndarray | None:
+        """The angles of the rows of the images of an analyser region, if
+        recorded"""
+        for name in ANGLE_NAMES:
+            path = f"{region}/{name}"
+            if path in self.metadata and self.metadata[path].ndim in (1, 2):
+                angles = self.instrument[path][()]
+                return angles[0] if angles.ndim == 2 else angles
+        return None
@@ -0,0 +1,67 @@
+"""Reductions applied to the columns of a table before it is written.
+
+These replace what every user otherwise does on the text files: combining
+the sweeps of an analyser region, dividing NEXAFS currents by the incident
+flux (I0) and rebinning in energy. They operate on whole columns at once in
+NumPy, so a table is read into memory when any of them is requested.
+"""
+
+import numpy as np
+
+MAD_TO_SIGMA = 1.4826  # scales a median absolute deviation to a normal sigma
+MIN_SWEEPS_REJECTED = 3  # fewer sweeps cannot tell which one is the outlier
+
+
+def outlier_sweeps(sweeps: np.ndarray, sigma: float) -> np.ndarray:
+    """Which of the sweeps (one per row) to reject.
+
+    A sweep is rejected if its RMS deviation from the median sweep is more
+    than ``sigma`` robust standard deviations above the median deviation of
+    the sweeps - e.g. a sweep recorded while the beam was lost.
+    """
+    if len(sweeps) < MIN_SWEEPS_REJECTED:
+        return np.zeros(len(sweeps), dtype=bool)
+    deviations = np.sqrt(np.mean((sweeps - np.median(sweeps, axis=0)) ** 2, axis=1))
+    median = np.median(deviations)
+    spread = MAD_TO_SIGMA * np.median(np.abs(deviations - median))
+    return deviations > median + sigma * spread
+
+
+def combine_sweeps(
+    sweeps: np.ndarray, method: str, reject_sigma: float | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """The sum or mean of the sweeps (one per row) that are not outliers
+    (see :func:`outlier_sweeps`), and which sweeps were rejected"""
+    rejected = np.zeros(len(sweeps), dtype=bool)
+    if reject_sigma is not None:
+        rejected = outlier_sweeps(sweeps, reject_sigma)
+    kept = sweeps[~rejected]
+    if method == "sum":
+        return kept.sum(axis=0, dtype=np.float64), rejected
+    if method == "mean":
+        return kept.mean(axis=0, dtype=np.float64), rejected
+    raise ValueError(f"Unknown sweep reduction {method!r}")
+
+
+def normalise(values: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """The values divided by the reference, NaN where the reference is 0"""
+    rows = min(len(values), len(reference))
+    normalised = np.full(rows, np.nan)
+    reference = reference[:rows]
+    np.divide(values[:rows], reference, out=normalised, where=reference != 0)
+    return normalised
+
+
+def rebin(columns: list[np.ndarray], factor: int) -> list[np.ndarray]:
+    """The mean of every ``factor`` rows of the columns, the last bin holding
+    the rows left over. As with zip(), rows beyond the end of the shortest
+    column are dropped."""
+    rows = min((len(column) for column in columns), default=0)
+    if factor <= 1 or rows == 0:
+        return columns
+    starts = np.arange(0, rows, factor)
+    counts = np.diff(np.append(starts, rows))
+    return [
+        np.add.reduceat(column[:rows], starts, dtype=np.float64) / counts
+        for column in columns
+    ]
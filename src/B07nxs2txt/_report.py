@@ -0,0 +1,128 @@
+"""Machine-readable report of a run and profiles of its slowest files."""
+
+import heapq
+import json
+import marshal
+import os
+from collections import Counter
+from itertools import count
+
+from B07nxs2txt._utils import ConversionResult
+from B07nxs2txt._version import __version__
+
+MB = 1 << 20
+
+
+class RunReport:
+    """JSON Lines report of a run.
+
+    A ``"file"`` record is written as each file completes, with the seconds
+    spent in every stage of its conversion (open, index, classify, read,
+    format, write and, for worker processes, overhead) and the bytes and rows
+    it moved. A final ``"run"`` record holds the totals of the run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w")
+        self.files = 0
+        self.failed = 0
+        self.stages: Counter[str] = Counter()
+        self.totals: Counter[str] = Counter()
+        self.rows: Counter[str] = Counter()  # per scan type
+
+    def add(self, result: ConversionResult):
+        stats = result.stats
+        if result.main_node_new is None:
+            layout = None
+        else:
+            layout = "new" if result.main_node_new else "old"
+        scan_type = result.scan_type.name if result.scan_type else None
+        record = {
+            "record": "file",
+            "path": result.file_path,
+            "layout": layout,
+            "scan_type": scan_type,
+            "error": result.error,
+            "outputs": result.outputs,
+            "seconds": stats.seconds,
+            "stages": stats.stages,
+            "file_bytes": stats.file_bytes,
+            "bytes_read": stats.bytes_read,
+            "bytes_written": stats.bytes_written,
+            "rows": stats.rows,
+        }
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+        self.files += 1
+        self.failed += result.error is not None
+        self.stages.update(stats.stages)
+        self.totals.update(
+            seconds=stats.seconds,
+            file_bytes=stats.file_bytes,
+            bytes_read=stats.bytes_read,
+            bytes_written=stats.bytes_written,
+        )
+        self.rows[scan_type or "unclassified"] += stats.rows
+
+    def close(self, seconds: float, jobs: int, skipped: int):
+        """Writes the totals of a run that took ``seconds``"""
+        record = {
+            "record": "run",
+            "version": __version__,
+            "jobs": jobs,
+            "files": self.files,
+            "failed": self.failed,
+            "skipped": skipped,
+            "seconds": seconds,
+            "files_per_s": self.files / seconds if seconds else None,
+            "mb_per_s": self.totals["file_bytes"] / MB / seconds if seconds else None,
+            "file_seconds": self.totals["seconds"],
+            "stages": dict(self.stages),
+            "file_bytes": self.totals["file_bytes"],
+            "bytes_read": self.totals["bytes_read"],
+            "bytes_written": self.totals["bytes_written"],
+            "rows": dict(self.rows),
+        }
+        self._file.write(json.dumps(record) + "\n")
+        self._file.close()
+
+
+class SlowestProfiles:
+    """Keeps the cProfile statistics of the ``number`` slowest files.
+
+    They are saved as ``<rank>_<file name>.prof``, the format of
+    ``pstats.Stats.dump_stats``, which can be read with ``python -m pstats``,
+    snakeviz or converted to flame graphs.
+    """
+
+    def __init__(self, number: int, folder: str):
+        self.number = number
+        self.folder = folder
+        self._heap: list[tuple[float, int, str, dict]] = []
+        self._order = count()  # breaks ties without comparing the statistics
+
+    def add(self, result: ConversionResult):
+        profile = result.stats.profile
+        # The statistics are not needed anywhere else
+        result.stats.profile = None
+        if profile is None:
+            return
+        entry = (result.stats.seconds, next(self._order), result.file_path, profile)
+        if len(self._heap) < self.number:
+            heapq.heappush(self._heap, entry)
+        else:
+            heapq.heappushpop(self._heap, entry)
+
+    def save(self) -> list[str]:
+        os.makedirs(self.folder, exist_ok=True)
+        paths = []
+        slowest = sorted(self._heap, key=lambda entry: entry[0], reverse=True)
+        for rank, (_, _, file_path, profile) in enumerate(slowest, start=1):
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            path = os.path.join(self.folder, f"{rank}_{name}.prof")
+            with open(path, "wb") as f:
+                marshal.dump(profile, f)
+            paths.append(path)
+        return paths
@@ -1,6 +1,21 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import TYPE_CHECKING, Protocol
 
-from h5py._hl.files import File
+if TYPE_CHECKING:
+    # h5py and numpy are only imported once a file is read, so that the CLI
+    # starts without their ~150ms import (see test_cli)
+    import numpy as np
+    from h5py._hl.dataset import Dataset
+    from h5py._hl.files import File
+    from h5py._hl.group import Group
 
 MAIN_NODE_NEW = "/entry"
 MAIN_NODE_OLD = "/entry1"
@@ -8,13 +23,23 @@ GLOBAL_NODE_OLD = "/entry1/instrument"
 GLOBAL_NODE_NEW = "/entry/instrument"
 CLASSIFICATIION_NODE_NEW = "/entry/diamond_scan/scan_fields"
 
-SCRIPT_OLD = "scripts.b07_convert_old"
-SCRIPT_NEW = "scripts.b07_convert_new"
-
 PGM_NAMES = ("pgm_energy", "pgm_cff")
 XY_SCAN_SCANNABLES_NAMES = ("sm21b_x", "sm21b_y", "sm21b_z", "dummy_a")
+# Datasets of an analyser region holding its detector images, and the angles
+# of their rows
+IMAGE_NAMES = ("image_data", "image")
+ANGLE_NAMES = ("angles",)
+
+NUMBER_FORMAT = "%.8g"
+COLUMN_DELIMITER = "\t"
+ROW_TERMINATOR = "\r\n"  # as written by csv.writer
+CHUNK_VALUES = 1 << 18  # values read and formatted at a time when streaming
+WRITE_BUFFER_SIZE = 1 << 20
 
-NUMBER_FORMAT = "{0:.8g}"
+SMALL_FILE_SIZE = 64 << 20  # files up to this size are read into memory at once
+CHUNK_CACHE_SIZE = 16 << 20  # per-dataset chunk cache
+CHUNK_CACHE_SLOTS = 10007  # a prime, as recommended by HDF5
+PAGE_BUFFER_SIZE = 4 << 20  # only used for files written with paged allocation
 
 
 class ScanType(Enum):
@@ -24,6 +49,231 @@ class ScanType(Enum):
     NEXAFS = 1  # Simple NEXAFS with just photon energy vs current
     NEXAFS_ANALYSER = 2  # NEXAFS using the analyser in addition to current
     XY_DATA = 3  # dummy scans or sample manipulator scans
+    # Analyser scans exported region by region, as XPS
+    ARPES_MAP = 4  # spectra against deflector or sample angle
+    RESONANT_PES = 5  # spectra against photon energy
+    MAPPING = 6  # spectra against sample position
+
+
+# Scan types exported as one XPS table per analyser region
+XPS_SCAN_TYPES = (
+    ScanType.XPS,
+    ScanType.ARPES_MAP,
+    ScanType.RESONANT_PES,
+    ScanType.MAPPING,
+)
+
+
+@dataclass
+class ConversionOptions:
+    """Options controlling the conversion of a single .nxs file"""
+
+    titles_off: bool = False  # Switch OFF column titles
+    formats: tuple[str, ...] = ("dat",)  # Output formats, see _writers.WRITERS
+    aggregate: bool = False  # Return the exported tables in the result
+    classifiers: str | None = None  # TOML file of extra rules, see _classify
+    output_dir: str | None = None  # Defaults to the folder of the .nxs file
+    images: bool = False  # Also reduce the analyser images, see _images
+    angle_roi: tuple[int, int] | None = None  # Angle channels summed, if not all
+    # Reductions applied before writing, see _reduce
+    sweeps: str | None = None  # Combine the sweeps of a region, see SWEEP_REDUCTIONS
+    reject_sigma: float | None = None  # Leave out the outlier sweeps combined
+    normalise: str | None = None  # Reference current dividing NEXAFS currents
+    rebin: int = 1  # Rows of NEXAFS and XPS tables averaged together
+    # Compressed text outputs, see COMPRESSION_LEVELS
+    compression_level: int | None = None  # By default that of the format
+    # By default one per CPU up to 4, or 1 in a pool of workers (see _parallel)
+    compression_threads: int | None = None
+
+
+# The keys of _writers.WRITERS, known without importing the writers
+OUTPUT_FORMATS = ("dat", "npy", "npz", "h5", "parquet", "dat.gz", "dat.zst")
+# Levels of the compressed text formats - (lowest, highest, default)
+COMPRESSION_LEVELS = {"dat.gz": (0, 9, 6), "dat.zst": (1, 22, 3)}
+MISSING_MAIN_NODE = "missing main node"  # ConversionResult.error
+SWEEP_REDUCTIONS = ("sum", "mean")  # see _reduce.combine_sweeps
+# Seconds unchanged after which a watched file without an end time is converted
+WATCH_SETTLE_TIME = 60.0
+
+
+@dataclass
+class ExportedTable:
+    """The columns of one exported table, returned when aggregating a folder"""
+
+    name: str  # Output file name without extension, e.g. "b07-1_Survey_XPS"
+    kind: str  # Output file suffix - "XPS", "NEXAFS" or "XY"
+    region: str | None
+    titles: list[str]
+    columns: list[np.ndarray]
+
+
+@dataclass
+class ConversionStats:
+    """Where the time of a conversion went and how much data it moved"""
+
+    stages: dict[str, float] = field(default_factory=dict)  # seconds per stage
+    seconds: float = 0.0  # total, as seen by the process that requested it
+    file_bytes: int = 0  # size of the .nxs file
+    bytes_read: int = 0  # of exported values
+    bytes_written: int = 0  # size of the outputs
+    rows: int = 0  # exported, summed over the tables of the file
+    profile: dict | None = None  # raw cProfile statistics, if profiled
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Adds the time spent in the ``with`` block to the given stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+
+@dataclass
+class ConversionResult:
+    """Outcome of converting a single .nxs file"""
+
+    file_path: str
+    main_node_new: bool | None = None  # None if the file could not be read
+    scan_type: ScanType | None = None
+    outputs: list[str] = field(default_factory=list)  # Paths of files written
+    tables: list[ExportedTable] = field(default_factory=list)  # If aggregating
+    stats: ConversionStats = field(default_factory=ConversionStats)
+    error: str | None = None  # Traceback if the conversion failed
+    # The .nxs file as it was when opened, stored in the manifest
+    mtime_ns: int | None = None
+    size: int | None = None
+    sha256: str | None = None
+
+
+def scan_number(file_name: str) -> int | None:
+    """The scan number of a GDA data file (the last digits of its name), or
+    None if the name has no digits"""
+    match = re.search(r"(\d+)\D*$", os.path.splitext(os.path.basename(file_name))[0])
+    return int(match.group(1)) if match else None
+
+
+@dataclass
+class NodeInfo:
+    """Metadata of one group or dataset in a :class:`MetadataIndex`"""
+
+    children: list[str] | None = None  # member names, for groups only
+    shape: tuple[int, ...] | None = None  # for datasets only
+    dtype: np.dtype | None = None
+
+    @property
+    def is_group(self) -> bool:
+        return self.children is not None
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape) if self.shape is not None else 0
+
+
+class MetadataIndex:
+    """Shape, dtype and members of every node below a group, gathered in one
+    pass over the tree so that classifying a scan and choosing its columns do
+    not need further HDF5 metadata lookups. Paths are relative to the group,
+    with ``""`` being the group itself.
+
+    External links are not followed while indexing, so that the pass stays
+    inside the file: the nodes they lead to are looked up through h5py (which
+    opens the linked file) when first asked for. Dangling links are left out.
+    """
+
+    def __init__(self, group: Group):
+        from h5py._hl.group import ExternalLink
+
+        self.group = group
+        self.nodes: dict[str, NodeInfo] = {"": NodeInfo(children=list(group))}
+        self.external: set[str] = set()  # paths of the external links
+        self.missing: set[str] = set()  # paths behind them that do not resolve
+
+        def visit(name: str, link=None):
+            if isinstance(link, ExternalLink):
+                self.external.add(name)
+                return
+            node = self._node(name)
+            if node is not None:
+                self.nodes[name] = node
+
+        if hasattr(group, "visititems_links"):
+            # Visits every name, even if several link to the same object
+            group.visititems_links(visit)
+        else:
+            group.visititems(visit)
+
+    def _node(self, path: str) -> NodeInfo | None:
+        from h5py._hl.group import Group
+
+        try:
+            node = self.group.get(path)
+        except (KeyError, OSError):
+            return None  # dangling soft or external link
+        if isinstance(node, Group):
+            # Iterating the group keeps its creation order, if tracked
+            return NodeInfo(children=list(node))
+        if node is not None:
+            return NodeInfo(shape=node.shape, dtype=node.dtype)
+        return None
+
+    def _resolve(self, path: str) -> NodeInfo | None:
+        """The node at ``path``, looked up on first use if it is behind an
+        external link"""
+        node = self.nodes.get(path)
+        if node is not None or not self.external or path in self.missing:
+            return node
+        parts = path.split("/")
+        if not any(
+            "/".join(parts[:i]) in self.external for i in range(1, len(parts) + 1)
+        ):
+            return None
+        node = self._node(path)
+        if node is None:
+            self.missing.add(path)
+        else:
+            self.nodes[path] = node
+        return node
+
+    def __contains__(self, path: str) -> bool:
+        return self._resolve(path) is not None
+
+    def __getitem__(self, path: str) -> NodeInfo:
+        node = self._resolve(path)
+        if node is None:
+            raise KeyError(path)
+        return node
+
+    def children(self, path: str = "") -> list[str]:
+        node = self._resolve(path)
+        if node is None or node.children is None:
+            return []
+        return node.children
+
+
+def open_nexus(file_path: str) -> File:
+    """Opens a .nxs file read-only, tuned for a single pass over the file.
+
+    Small files are loaded with one sequential read through the ``core``
+    driver, so that the metadata walk and dataset reads that follow do not
+    each go to (network) storage. Larger files use the ``sec2`` driver with a
+    bigger chunk cache and page buffer.
+    """
+    tuning = {
+        "libver": "latest",
+        "rdcc_nbytes": CHUNK_CACHE_SIZE,
+        "rdcc_nslots": CHUNK_CACHE_SLOTS,
+    }
+    import h5py
+
+    if os.path.getsize(file_path) <= SMALL_FILE_SIZE:
+        return h5py.File(file_path, "r", driver="core", backing_store=False, **tuning)
+    return h5py.File(
+        file_path, "r", driver="sec2", page_buf_size=PAGE_BUFFER_SIZE, **tuning
+    )
 
 
 def get_instrument_node(global_node: File, node_path: str) -> File | None:
@@ -32,3 +282,114 @@ def get_instrument_node(global_node: File, node_path: str) -> File | None:
 
 def get_classification_node(global_node: File, node_path: str) -> list[str] | None:
     return global_node[node_path]
+
+
+class TextOutput(Protocol):
+    """What :func:`write_rows` writes to - a text file, or a
+    :class:`~B07nxs2txt._pipeline.BackgroundWriter`"""
+
+    def write(self, text: str, /) -> object: ...
+
+
+class DatasetColumn:
+    """A 1D dataset, or one row of a 2D dataset, read lazily in slices so
+    that long columns never have to be held in memory in full.
+
+    ``mapped`` are the values of the dataset mapped from the file, if it is
+    contiguous (see :class:`~B07nxs2txt._fastread.FileMap`), which are sliced
+    instead of reading the dataset.
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        row: int | None = None,
+        mapped: np.ndarray | None = None,
+    ):
+        self.dataset = dataset
+        self.row = row
+        self.mapped = mapped
+
+    def __len__(self) -> int:
+        return self.dataset.shape[-1] if self.row is not None else len(self.dataset)
+
+    def __getitem__(self, selection: slice) -> np.ndarray:
+        source = self.dataset if self.mapped is None else self.mapped
+        if self.row is not None:
+            return source[self.row, selection]
+        return source[selection]
+
+
+def format_rows(columns: Sequence[np.ndarray | DatasetColumn]) -> str:
+    """Formats the columns as delimited rows of text, one row per line.
+
+    As with zip(), rows beyond the end of the shortest column are dropped.
+    The whole block is formatted with a single %-operation, giving the same
+    text as formatting every value with NUMBER_FORMAT but without a Python
+    level loop over the values.
+    """
+    if not columns:
+        return ""
+    rows = min(len(column) for column in columns)
+    width = len(columns)
+    values: list = [None] * (rows * width)
+    for index, column in enumerate(columns):
+        # Interleave the columns, row by row
+        values[index::width] = column[:rows].tolist()
+    row_format = COLUMN_DELIMITER.join([NUMBER_FORMAT] * width) + ROW_TERMINATOR
+    return (row_format * rows) % tuple(values)
+
+
+def read_values(
+    column: np.ndarray | DatasetColumn,
+    selection: slice,
+    stats: ConversionStats | None = None,
+) -> np.ndarray:
+    """Reads part of a column, counting the time and bytes in ``stats``"""
+    import numpy as np
+
+    if stats is None:
+        stats = ConversionStats()
+    with stats.stage("read"):
+        values = np.asarray(column[selection])
+    stats.bytes_read += values.nbytes
+    return values
+
+
+def iter_row_chunks(
+    columns: Sequence[np.ndarray | DatasetColumn],
+    chunk_values: int = CHUNK_VALUES,
+    stats: ConversionStats | None = None,
+) -> Iterator[tuple[int, list[np.ndarray]]]:
+    """Reads the columns in blocks of rows holding about ``chunk_values``
+    values, yielding the first row of each block and its arrays.
+
+    As with zip(), rows beyond the end of the shortest column are dropped.
+    """
+    if not columns:
+        return
+    rows = min(len(column) for column in columns)
+    chunk_rows = max(1, chunk_values // len(columns))
+    for start in range(0, rows, chunk_rows):
+        selection = slice(start, min(start + chunk_rows, rows))
+        yield start, [read_values(column, selection, stats) for column in columns]
+
+
+def write_rows(
+    output_file: TextOutput,
+    columns: Sequence[np.ndarray | DatasetColumn],
+    chunk_values: int = CHUNK_VALUES,
+    stats: ConversionStats | None = None,
+):
+    """Streams the columns to the file as formatted rows.
+
+    The columns are read, formatted and written a block of rows at a time
+    (see :func:`iter_row_chunks`), so memory use does not grow with the
+    length of the scan.
+    """
+    if stats is None:
+        stats = ConversionStats()
+    for _, chunk in iter_row_chunks(columns, chunk_values, stats):
+        with stats.stage("format"):
+            text = format_rows(chunk)
+        output_file.write(text)
@@ -0,0 +1,209 @@
+"""A lazy xarray view of the NEXAFS or XY scans of a whole visit.
+
+:func:`open_visit` stacks the columns the exporters would write (see
+:func:`~B07nxs2txt._export.nexafs_columns` and
+:func:`~B07nxs2txt._export.xy_columns`) into an :class:`xarray.Dataset` of
+dimensions ``(scan, point)``, one variable per column, backed by dask::
+
+    visit = open_visit("/dls/b07/data/2024/visit", "NEXAFS")
+    mean = (visit.ca15b / visit.ca11b).mean("scan").compute()
+
+Only the metadata of the files is read when the dataset is opened. The
+values are read when computed, by one task per block of
+:data:`SCANS_PER_CHUNK` scans, so reductions across scans run in parallel on
+the dask scheduler in use and need no more memory than a few blocks. Scans
+shorter than the longest one, or without one of the columns, are padded with
+NaN.
+
+Needs the optional xarray and dask dependencies:
+``pip install cuddly-spoon[xarray]``.
+"""
+
+import logging
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import h5py
+import numpy as np
+from h5py._hl.files import File
+
+from B07nxs2txt._discover import Selection, iter_nxs_files
+from B07nxs2txt._export import classify_scan_type, nexafs_columns, xy_columns
+from B07nxs2txt._reader import ScanReader, detect_layout
+from B07nxs2txt._utils import (
+    CHUNK_CACHE_SIZE,
+    CHUNK_CACHE_SLOTS,
+    ConversionOptions,
+    DatasetColumn,
+    ScanType,
+    scan_number,
+)
+
+SCANS_PER_CHUNK = 100  # scans read by one task
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScanColumns:
+    """The columns of a scan of a visit, as found when it was opened"""
+
+    file_path: str
+    number: int
+    titles: list[str]
+    paths: list[str]  # of the datasets of the columns, in the file
+    rows: int  # of the shortest column, as when the table is written
+
+
+def _open(file_path: str) -> File:
+    """Opens a .nxs file reading only what is accessed, unlike
+    :func:`~B07nxs2txt._utils.open_nexus` which loads small files whole"""
+    return h5py.File(
+        file_path,
+        "r",
+        libver="latest",
+        rdcc_nbytes=CHUNK_CACHE_SIZE,
+        rdcc_nslots=CHUNK_CACHE_SLOTS,
+    )
+
+
+def table_columns(
+    reader: ScanReader, scan_type: ScanType | None
+) -> tuple[list[str], list[np.ndarray | DatasetColumn]]:
+    """The titles and columns the exporters select from a NEXAFS or XY scan,
+    or none for other scans"""
+    if scan_type == ScanType.NEXAFS:
+        return nexafs_columns(reader)
+    if scan_type == ScanType.NEXAFS_ANALYSER:
+        regions = reader.regions()
+        if len(regions) == 1:
+            return nexafs_columns(reader, regions[0])
+    elif scan_type == ScanType.XY_DATA:
+        return xy_columns(reader)
+    return [], []
+
+
+def _scan_columns(
+    file_path: str, scan_type: ScanType, options: ConversionOptions
+) -> ScanColumns | None:
+    """The columns of a scan of the given type, or None if it is of another
+    type, has no columns or could not be read"""
+    number = scan_number(file_path)
+    if number is None:
+        logger.warning("No scan number in %s - skipping", file_path)
+        return None
+    try:
+        with _open(file_path) as nexus:
+            layout = detect_layout(nexus)
+            if layout is None:
+                return None
+            reader = ScanReader(nexus, layout)
+            found = classify_scan_type(
+                reader.classification_keys(), layout, options.classifiers
+            )
+            if found != scan_type:
+                return None
+            titles, columns = table_columns(reader, found)
+            rows = min((len(column) for column in columns), default=0)
+            if rows == 0:
+                return None
+            paths = [
+                f"{layout.instrument_node}/{reader.value_path(title)}"
+                for title in titles
+            ]
+    except OSError as e:
+        logger.warning("Error reading %s: %s", file_path, e)
+        return None
+    return ScanColumns(file_path, number, titles, paths, rows)
+
+
+def _find_scans(
+    file_paths: Sequence[str], scan_type: ScanType, options: ConversionOptions
+) -> list[ScanColumns | None]:
+    return [_scan_columns(path, scan_type, options) for path in file_paths]
+
+
+def _read_scans(
+    scans: Sequence[ScanColumns], titles: Sequence[str], points: int
+) -> np.ndarray:
+    """The columns of the scans, of shape ``(scans, titles, points)``.
+
+    The datasets found when the scans were opened are read directly, without
+    indexing the files again. Datasets that are not 1D are flattened, as
+    :meth:`ScanReader.column` does.
+    """
+    index = {title: i for i, title in enumerate(titles)}
+    values = np.full((len(scans), len(titles), points), np.nan)
+    for i, scan in enumerate(scans):
+        with _open(scan.file_path) as nexus:
+            for title, path in zip(scan.titles, scan.paths, strict=True):
+                column = nexus[path][()].reshape(-1)
+                values[i, index[title], : scan.rows] = column[: scan.rows]
+    return values
+
+
+def open_visit(
+    folder: str,
+    scan_type: ScanType | str = ScanType.NEXAFS,
+    options: ConversionOptions | None = None,
+    recursive: bool = False,
+    selection: Selection | None = None,
+    scans_per_chunk: int = SCANS_PER_CHUNK,
+):
+    """The NEXAFS or XY scans of a folder (and its sub-folders if
+    ``recursive``) as a lazy :class:`xarray.Dataset` of dimensions ``(scan,
+    point)``, with one variable per column and the scan numbers and files as
+    coordinates. Scans are classified with the rules of ``options``."""
+    try:
+        import dask
+        import dask.array as da
+        import xarray as xr
+    except ImportError as e:
+        raise ImportError(
+            "Visit datasets need xarray and dask: pip install cuddly-spoon[xarray]"
+        ) from e
+
+    if isinstance(scan_type, str):
+        scan_type = ScanType[scan_type]
+    if scan_type not in (ScanType.NEXAFS, ScanType.NEXAFS_ANALYSER, ScanType.XY_DATA):
+        raise ValueError(f"Only NEXAFS and XY scans can be stacked, not {scan_type}")
+    options = options or ConversionOptions()
+    scans_per_chunk = max(scans_per_chunk, 1)
+
+    file_paths = list(iter_nxs_files(os.path.abspath(folder), selection, recursive))
+    blocks = [
+        file_paths[start : start + scans_per_chunk]
+        for start in range(0, len(file_paths), scans_per_chunk)
+    ]
+    found = dask.compute(
+        *(dask.delayed(_find_scans)(block, scan_type, options) for block in blocks)
+    )
+    scans = [scan for block in found for scan in block if scan is not None]
+
+    titles = list(dict.fromkeys(title for scan in scans for title in scan.titles))
+    points = max((scan.rows for scan in scans), default=0)
+    stacked = [
+        da.from_delayed(
+            dask.delayed(_read_scans)(block, titles, points),
+            shape=(len(block), len(titles), points),
+            dtype=np.float64,
+        )
+        for block in (
+            scans[start : start + scans_per_chunk]
+            for start in range(0, len(scans), scans_per_chunk)
+        )
+    ]
+    values = (
+        da.concatenate(stacked)
+        if stacked
+        else da.empty((0, len(titles), points), dtype=np.float64)
+    )
+    return xr.Dataset(
+        {title: (("scan", "point"), values[:, i]) for i, title in enumerate(titles)},
+        coords={
+            "scan": [scan.number for scan in scans],
+            "file": ("scan", [scan.file_path for scan in scans]),
+        },
+        attrs={"scan_type": scan_type.name, "folder": os.path.abspath(folder)},
+    )
@@ -0,0 +1,212 @@
+"""Watching a folder for .nxs files finished by the acquisition system."""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from collections.abc import Callable
+
+import h5py
+
+from B07nxs2txt._utils import MAIN_NODE_NEW, MAIN_NODE_OLD, WATCH_SETTLE_TIME
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+EVENT_BUFFER_SIZE = 64 * 1024
+
+POLL_INTERVAL = 0.25  # seconds between polls / retries of incomplete files
+# Written by GDA once a scan has ended, in either layout
+END_MARKERS = (f"{MAIN_NODE_NEW}/end_time", f"{MAIN_NODE_OLD}/end_time")
+
+logger = logging.getLogger(__name__)
+
+
+def is_complete(
+    file_path: str, quiet_for: float = 0.0, settle_time: float = WATCH_SETTLE_TIME
+) -> bool:
+    """Whether the writer has finished with the file, which has not changed
+    for ``quiet_for`` seconds.
+
+    A scan has ended once GDA has written its end time (see
+    :data:`END_MARKERS`). Scans are written point by point, so a file that
+    can be opened may still be growing: GDA holds an HDF5 file lock while
+    writing, but the lock does nothing on network filesystems where locking
+    is disabled (``HDF5_USE_FILE_LOCKING=FALSE``), nor against SWMR writers.
+    Files without an end time are taken as complete once they have not
+    changed for ``settle_time`` seconds. So are files that fail to open, e.g.
+    half-written without a valid superblock: once settled, a truncated or
+    corrupt file is converted so that its error is reported, rather than
+    being retried for as long as the folder is watched.
+    """
+    try:
+        with h5py.File(file_path, "r") as nexus:
+            if any(marker in nexus for marker in END_MARKERS):
+                return True
+    except OSError:
+        pass
+    return quiet_for >= settle_time
+
+
+def _signature(file_path: str) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class InotifyWatcher:
+    """Reports files closed after writing (or moved into) a folder, using the
+    Linux inotify API"""
+
+    def __init__(self, folder: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+        # Files closed before the watch was added are found by a rescan
+        self.needs_rescan = True
+
+    def changed(self, timeout: float) -> list[str]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self._fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.needs_rescan = True
+            elif name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Reports files whose size and mtime stayed the same over one polling
+    interval since they last changed. Works on network filesystems where
+    inotify does not see writes made by other hosts. Whether a file reported
+    is complete is decided by :func:`is_complete`."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.needs_rescan = False
+        self._last = self._poll()
+        self._reported: dict[str, tuple[int, int]] = {}
+
+    def _poll(self) -> dict[str, tuple[int, int]]:
+        signatures = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                signatures[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def changed(self, timeout: float) -> list[str]:
+        time.sleep(timeout)
+        current = self._poll()
+        names = [
+            name
+            for name, signature in current.items()
+            if self._last.get(name) == signature
+            and self._reported.get(name) != signature
+        ]
+        for name in names:
+            self._reported[name] = current[name]
+        # Forget deleted files so memory is bounded by the folder contents
+        for name in self._reported.keys() - current.keys():
+            del self._reported[name]
+        self._last = current
+        return names
+
+    def close(self):
+        pass
+
+
+def watch_folder(
+    folder: str,
+    convert: Callable[[str], None],
+    is_up_to_date: Callable[[str], bool],
+    polling: bool = False,
+    stop: threading.Event | None = None,
+    settle_time: float = WATCH_SETTLE_TIME,
+):
+    """Calls ``convert`` for every .nxs file completed in ``folder`` until
+    interrupted (or ``stop`` is set).
+
+    Files reported by the watcher that are not up to date but not complete
+    yet (see :func:`is_complete`) are retried every :data:`POLL_INTERVAL`
+    seconds, timing how long they have not changed for, until they have
+    settled.
+    """
+    watcher: InotifyWatcher | PollingWatcher
+    if polling:
+        watcher = PollingWatcher(folder)
+    else:
+        try:
+            watcher = InotifyWatcher(folder)
+        except (OSError, AttributeError, TypeError):
+            logger.warning("inotify is not available - falling back to polling")
+            watcher = PollingWatcher(folder)
+
+    # Size and mtime of the pending files, and when these were last seen to change
+    pending: dict[str, tuple[tuple[int, int] | None, float]] = {}
+    logger.info("Watching %s for new .nxs files. Press Ctrl+C to stop.", folder)
+    try:
+        while stop is None or not stop.is_set():
+            timeout = POLL_INTERVAL if pending or stop is not None else 1.0
+            found = [
+                os.path.join(folder, name)
+                for name in watcher.changed(timeout)
+                if name.endswith(".nxs")
+            ]
+            if watcher.needs_rescan:
+                # Events were lost - fall back to looking at the whole folder
+                watcher.needs_rescan = False
+                with os.scandir(folder) as entries:
+                    found.extend(e.path for e in entries if e.name.endswith(".nxs"))
+            now = time.monotonic()
+            for file_path in found:
+                pending.setdefault(file_path, (None, now))
+            for file_path in sorted(pending):
+                signature = _signature(file_path)
+                if signature is None or is_up_to_date(file_path):
+                    del pending[file_path]
+                    continue
+                last, changed_at = pending[file_path]
+                if signature != last:
+                    pending[file_path] = signature, now
+                    changed_at = now
+                if is_complete(file_path, now - changed_at, settle_time):
+                    del pending[file_path]
+                    convert(file_path)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching.")
+    finally:
+        watcher.close()
@@ -0,0 +1,310 @@
+"""Writers for the exported columns, one per output format.
+
+Every writer takes the output path, the column titles, the columns and the
+statistics of the conversion, and streams the rows a block at a time (see
+:func:`~B07nxs2txt._utils.iter_row_chunks`). Rows beyond the end of the
+shortest column are dropped, as they always have been for the .dat files.
+"""
+
+import csv
+import functools
+import gzip
+import os
+import time
+import zipfile
+from collections.abc import Callable, Sequence
+from contextlib import nullcontext
+
+import h5py
+import numpy as np
+
+from B07nxs2txt._pipeline import BackgroundWriter, CompressingWriter
+from B07nxs2txt._utils import (
+    CHUNK_VALUES,
+    COMPRESSION_LEVELS,
+    WRITE_BUFFER_SIZE,
+    ConversionOptions,
+    ConversionStats,
+    DatasetColumn,
+    ExportedTable,
+    iter_row_chunks,
+    read_values,
+    write_rows,
+)
+
+Columns = Sequence[np.ndarray | DatasetColumn]
+
+
+def _row_count(columns: Columns) -> int:
+    return min((len(column) for column in columns), default=0)
+
+
+def _column_dtype(column: np.ndarray | DatasetColumn) -> np.dtype:
+    if isinstance(column, DatasetColumn):
+        return column.dataset.dtype
+    return np.asarray(column).dtype
+
+
+def _field_names(titles: Sequence[str]) -> list[str]:
+    """Column titles made unique, as needed for field and dataset names"""
+    names: list[str] = []
+    for title in titles:
+        name = title
+        suffix = 1
+        while name in names:
+            name = f"{title}_{suffix}"
+            suffix += 1
+        names.append(name)
+    return names
+
+
+def write_dat(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+):
+    """Tab-separated text, as produced by the original scripts. Tables of
+    several blocks of rows are written by a thread, overlapping the writes
+    with formatting (see :class:`~B07nxs2txt._pipeline.BackgroundWriter`)."""
+    several_blocks = _row_count(columns) * len(columns) > CHUNK_VALUES
+    with open(path, "w", buffering=WRITE_BUFFER_SIZE) as output_file:
+        background = BackgroundWriter(output_file) if several_blocks else None
+        with background or nullcontext(output_file) as writer:
+            if not titles_off:
+                csv.writer(writer, delimiter="\t").writerow(titles)
+            write_rows(writer, columns, stats=stats)
+
+
+def _write_compressed_dat(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+    compress: Callable[[bytes], bytes],
+    threads: int | None,
+):
+    """The text of :func:`write_dat`, compressed by a pool of threads (see
+    :class:`~B07nxs2txt._pipeline.CompressingWriter`)"""
+    with open(path, "wb") as output_file:
+        with CompressingWriter(output_file, compress, threads) as writer:
+            if not titles_off:
+                csv.writer(writer, delimiter="\t").writerow(titles)
+            write_rows(writer, columns, stats=stats)
+
+
+def write_dat_gz(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+    level: int | None = None,
+    threads: int | None = None,
+):
+    """:func:`write_dat` text compressed with gzip, as a series of gzip
+    members read back whole by ``zcat``, :mod:`gzip` and ``numpy.loadtxt``"""
+    if level is None:
+        level = COMPRESSION_LEVELS["dat.gz"][2]
+    compress = functools.partial(gzip.compress, compresslevel=level, mtime=0)
+    _write_compressed_dat(path, titles, columns, titles_off, stats, compress, threads)
+
+
+def write_dat_zst(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+    level: int | None = None,
+    threads: int | None = None,
+):
+    """:func:`write_dat` text compressed with Zstandard, as a series of
+    frames read back whole by ``zstdcat``. Needs the optional zstandard
+    dependency."""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "Zstandard output needs zstandard: pip install cuddly-spoon[zstd]"
+        ) from e
+
+    if level is None:
+        level = COMPRESSION_LEVELS["dat.zst"][2]
+
+    def compress(block: bytes) -> bytes:
+        # A compressor per block, as they cannot be shared between threads
+        return zstandard.ZstdCompressor(level=level).compress(block)
+
+    _write_compressed_dat(path, titles, columns, titles_off, stats, compress, threads)
+
+
+def write_npy(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+):
+    """A single structured array with one field per column, which can be
+    memory-mapped with ``numpy.load(path, mmap_mode="r")``"""
+    dtype = np.dtype(
+        [
+            (name, _column_dtype(column))
+            for name, column in zip(_field_names(titles), columns, strict=True)
+        ]
+    )
+    rows = _row_count(columns)
+    if rows == 0:
+        # An empty file cannot be memory-mapped for writing
+        np.save(path, np.empty(0, dtype=dtype))
+        return
+    array = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(rows,))
+    for start, chunk in iter_row_chunks(columns, stats=stats):
+        block = array[start : start + len(chunk[0])]
+        for name, values in zip(dtype.names, chunk, strict=True):
+            block[name] = values
+    array.flush()
+    del array
+
+
+def write_npz(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+):
+    """One uncompressed array per column, as written by ``numpy.savez``"""
+    rows = _row_count(columns)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for name, column in zip(_field_names(titles), columns, strict=True):
+            # One column in memory at a time
+            with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                values = read_values(column, slice(rows), stats)
+                np.lib.format.write_array(member, values)
+
+
+def write_h5(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+):
+    """A flat HDF5 file with one 1D dataset per column. The ``columns``
+    attribute of the root group lists them in order."""
+    rows = _row_count(columns)
+    names = _field_names(titles)
+    with h5py.File(path, "w") as output_file:
+        datasets = [
+            output_file.create_dataset(name, shape=(rows,), dtype=_column_dtype(c))
+            for name, c in zip(names, columns, strict=True)
+        ]
+        output_file.attrs["columns"] = names
+        for start, chunk in iter_row_chunks(columns, stats=stats):
+            for dataset, values in zip(datasets, chunk, strict=True):
+                dataset[start : start + len(values)] = values
+
+
+def write_parquet(
+    path: str,
+    titles: Sequence[str],
+    columns: Columns,
+    titles_off: bool,
+    stats: ConversionStats,
+):
+    """An Apache Parquet table, with one row group per block of rows. Needs
+    the optional pyarrow dependency."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet output needs pyarrow: pip install cuddly-spoon[parquet]"
+        ) from e
+
+    names = _field_names(titles)
+    schema = pa.schema(
+        [
+            (name, pa.from_numpy_dtype(_column_dtype(column)))
+            for name, column in zip(names, columns, strict=True)
+        ]
+    )
+    with pq.ParquetWriter(path, schema) as writer:
+        for _, chunk in iter_row_chunks(columns, stats=stats):
+            writer.write_table(pa.Table.from_arrays(chunk, schema=schema))
+
+
+WRITERS: dict[str, tuple[str, Callable]] = {
+    "dat": (".dat", write_dat),
+    "npy": (".npy", write_npy),
+    "npz": (".npz", write_npz),
+    "h5": (".h5", write_h5),
+    "parquet": (".parquet", write_parquet),
+    "dat.gz": (".dat.gz", write_dat_gz),
+    "dat.zst": (".dat.zst", write_dat_zst),
+}
+
+
+def write_table(
+    output_base: str,
+    titles: Sequence[str],
+    columns: Columns,
+    options: ConversionOptions,
+    stats: ConversionStats | None = None,
+) -> list[str]:
+    """Writes the columns in every format in ``options.formats``, returning
+    the paths written. ``output_base`` is the output path without extension.
+    """
+    if stats is None:
+        stats = ConversionStats()
+    output_paths = []
+    for output_format in options.formats:
+        extension, writer = WRITERS[output_format]
+        output_path = output_base + extension
+        # Whatever is not reading or formatting the values counts as writing
+        other = sum(stats.stages.values())
+        start = time.perf_counter()
+        compression = {}
+        if output_format in COMPRESSION_LEVELS:
+            compression = {
+                "level": options.compression_level,
+                "threads": options.compression_threads,
+            }
+        writer(output_path, titles, columns, options.titles_off, stats, **compression)
+        elapsed = time.perf_counter() - start
+        stats.add("write", elapsed - (sum(stats.stages.values()) - other))
+        stats.bytes_written += os.path.getsize(output_path)
+        output_paths.append(output_path)
+    stats.rows += _row_count(columns)
+    return output_paths
+
+
+def exported_table(
+    filename: str,
+    region_name: str | None,
+    titles: Sequence[str],
+    columns: Columns,
+    stats: ConversionStats | None = None,
+) -> ExportedTable:
+    """The columns read into memory, to be returned to the process
+    aggregating the folder. Columns mapped from the .nxs file are copied, so
+    that they do not keep it mapped."""
+    name = os.path.splitext(filename)[0]
+    rows = _row_count(columns)
+    return ExportedTable(
+        name=name,
+        kind=name.rsplit("_", 1)[-1],
+        region=region_name,
+        titles=list(titles),
+        columns=[
+            np.array(
+                read_values(column, slice(rows), stats),
+                copy=isinstance(column, DatasetColumn) and column.mapped is not None,
+            )
+            for column in columns
+        ],
+    )
@@ -0,0 +1,118 @@
+"""In-process conversion of .nxs files to plain text data files."""
+
+import logging
+import os
+import time
+import traceback
+
+from h5py._hl.files import File
+
+from B07nxs2txt._export import convert_nexus
+from B07nxs2txt._manifest import ManifestEntry, file_hash
+from B07nxs2txt._reader import NEW_LAYOUT, OLD_LAYOUT, detect_layout
+from B07nxs2txt._utils import (
+    MISSING_MAIN_NODE,
+    ConversionOptions,
+    ConversionResult,
+    open_nexus,
+)
+
+__all__ = [
+    "ConversionOptions",
+    "ConversionResult",
+    "convert_file",
+    "is_main_node_new",
+    "main_node_is_new",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def main_node_is_new(nexus: File) -> bool:
+    """
+    Determines from the root node of an open .nxs file whether it uses
+    the new (``/entry``) or old (``/entry1``) layout.
+    """
+    return detect_layout(nexus) is NEW_LAYOUT
+
+
+def is_main_node_new(file_path: str) -> bool | None:
+    """
+    Extracts the main node information from the .nxs file.
+    Returns None if the file cannot be read.
+    """
+    try:
+        with open_nexus(file_path) as nexus:
+            return main_node_is_new(nexus)
+    except Exception as e:
+        logger.warning("Error reading %s: %s", file_path, e)
+        return None
+
+
+def convert_file(
+    file_path: str,
+    options: ConversionOptions | None = None,
+    hash_file: bool = False,
+    previous: ManifestEntry | None = None,
+) -> ConversionResult:
+    """Converts a single .nxs file in the current process.
+
+    The file is opened once: the layout (``/entry`` or ``/entry1``) is
+    detected and the scan is read, classified and exported through the same
+    handle (see :mod:`B07nxs2txt._reader`). The time spent in each stage is recorded in
+    :attr:`ConversionResult.stats`. Exceptions raised by the converter are
+    caught and their traceback stored in :attr:`ConversionResult.error`, so
+    that one broken file does not stop the conversion of a whole folder.
+
+    The mtime and size of the file are taken when it is opened, so that a
+    file rewritten during its conversion is not recorded as up to date (see
+    :class:`~B07nxs2txt._manifest.Manifest`). With ``hash_file``, for a
+    manifest, so is its hash, unless the mtime and size are those of the
+    ``previous`` entry of the manifest, whose hash is kept.
+    """
+    if options is None:
+        options = ConversionOptions()
+
+    start = time.perf_counter()
+    try:
+        stat = os.stat(file_path)
+        nexus = open_nexus(file_path)
+    except Exception as e:
+        logger.warning("Error reading %s: %s", file_path, e)
+        return ConversionResult(file_path=file_path, error=MISSING_MAIN_NODE)
+    opened = time.perf_counter()
+    sha256 = None  # not recorded as up to date
+    unchanged = (
+        previous is not None
+        and previous.mtime_ns == stat.st_mtime_ns
+        and previous.size == stat.st_size
+    )
+    if hash_file and unchanged:
+        sha256 = previous.sha256  # as it was hashed when last converted
+    elif hash_file:
+        try:
+            # Read from the page cache, as the file was just opened
+            sha256 = file_hash(file_path)
+        except OSError:
+            pass
+    hashed = time.perf_counter()
+
+    with nexus:
+        # Without a main node, the instrument group of the old layout is
+        # missing and the conversion fails below
+        layout = detect_layout(nexus) or OLD_LAYOUT
+        try:
+            result = convert_nexus(nexus, file_path, options, layout)
+        except Exception:
+            result = ConversionResult(
+                file_path=file_path,
+                main_node_new=layout is NEW_LAYOUT,
+                error=traceback.format_exc(),
+            )
+    result.stats.add("open", opened - start)
+    if hash_file:
+        result.stats.add("hash", hashed - opened)
+    result.mtime_ns, result.size, result.sha256 = stat.st_mtime_ns, stat.st_size, sha256
+    result.stats.file_bytes = stat.st_size
+    result.stats.seconds = time.perf_counter() - start
+    return result
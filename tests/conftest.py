@@ -1,6 +1,9 @@
 import os
+from pathlib import Path
 from typing import Any
 
+import h5py
+import numpy as np
 import pytest
 
 # Prevent pytest from catching exceptions when debugging in vscode so that break on
@@ -19,3 +22,65 @@ if os.getenv("PYTEST_RAISE", "0") == "1":
     @pytest.hookimpl(tryfirst=True)
     def pytest_internalerror(excinfo: pytest.ExceptionInfo[Any]):
         raise excinfo.value
+
+
+def _write_scannables(instrument, names, values, layout_new):
+    for name in names:
+        group = instrument.require_group(name)
+        group.create_dataset("value" if layout_new else name, data=values)
+
+
+def _write_regions(instrument, regions, points, sweeps, layout_new):
+    energies = np.linspace(100.0, 90.0, points)
+    region_names = np.array([r.encode("utf-8") for r in regions])
+    instrument.create_group("analyser").create_dataset(
+        "region_list", data=region_names[np.newaxis, :] if layout_new else region_names
+    )
+    for offset, region_name in enumerate(regions):
+        region = instrument.create_group(region_name)
+        region.create_dataset(
+            "binding_energy", data=energies[np.newaxis, :] if layout_new else energies
+        )
+        spectra = np.arange(sweeps * points, dtype=np.float64).reshape(sweeps, points)
+        spectra = spectra / 7.0 + offset
+        region.create_dataset("spectrum", data=spectra.sum(axis=0)[np.newaxis, :])
+        for index in range(sweeps):
+            region.create_dataset(f"spectrum_{index + 1}", data=spectra[[index]])
+
+
+@pytest.fixture
+def make_nxs(tmp_path: Path):
+    """Factory writing small synthetic .nxs files in either layout"""
+
+    def _make(
+        name: str,
+        scan_type: str,
+        layout_new: bool = True,
+        points: int = 11,
+        regions: tuple[str, ...] = ("Survey",),
+        sweeps: int = 2,
+    ) -> Path:
+        path = tmp_path / name
+        values = np.linspace(500.0, 510.0, points)
+        with h5py.File(path, "w") as f:
+            entry = f.create_group("entry" if layout_new else "entry1")
+            instrument = entry.create_group("instrument")
+            if scan_type == "NEXAFS":
+                fields = ["pgm_energy", "ca15b"]
+                _write_scannables(instrument, fields, values, layout_new)
+            elif scan_type == "XY_DATA":
+                fields = ["sm21b_x", "ca15b"]
+                _write_scannables(instrument, fields, values, layout_new)
+            elif scan_type == "XPS":
+                fields = ["analyser"]
+                _write_regions(instrument, regions, points, sweeps, layout_new)
+            else:
+                fields = ["unknown"]
+            entry["end_time"] = "2024-01-01T00:00:00"  # written once a scan ends
+            if layout_new:
+                entry.create_group("diamond_scan").create_dataset(
+                    "scan_fields", data=[s.encode("utf-8") for s in fields]
+                )
+        return path
+
+    return _make
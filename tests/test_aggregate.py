@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+
+from B07nxs2txt._utils import scan_number
+
+
+def test_scan_number():
+    assert scan_number("/dls/b07/data/b07-12345.nxs") == 12345
+    assert scan_number("i09-1_Survey_XPS.dat") == 1
+    assert scan_number("scan.nxs") is None
+
+
+def test_cli_aggregate(make_nxs):
+    make_nxs("b07-2.nxs", "NEXAFS")
+    make_nxs("b07-1.nxs", "NEXAFS", False)
+    path = make_nxs("b07-3.nxs", "XPS", regions=("Survey", "C1s"), sweeps=3)
+    folder = path.parent
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(folder), "--aggregate"]
+
+    subprocess.check_call(cmd + ["-j", "2"], stdout=subprocess.DEVNULL)
+    assert not list(folder.glob("*.dat"))
+    with h5py.File(folder / f"{folder.name}_NEXAFS.h5", "r") as f:
+        index = f["index"][()]
+        assert [i.decode() for i in index["name"]] == ["b07-1_NEXAFS", "b07-2_NEXAFS"]
+        assert list(index["scan_number"]) == [1, 2]
+    with h5py.File(folder / f"{folder.name}_XPS.h5", "r") as f:
+        assert [i.decode() for i in f["index"]["region"]] == ["C1s", "Survey"]
+        scan = f["scans/b07-3_C1s_XPS"]
+        assert list(scan.attrs["columns"]) == [
+            "binding_energy",
+            "intensity",
+            "spectrum_1",
+            "spectrum_2",
+            "spectrum_3",
+        ]
+        aggregated = np.column_stack([scan[name][()] for name in scan.attrs["columns"]])
+
+    # Same values as the .dat file, without the loss of precision
+    subprocess.check_call(cmd + ["--format", "dat"], stdout=subprocess.DEVNULL)
+    dat = np.loadtxt(folder / "b07-3_C1s_XPS.dat", skiprows=1)
+    np.testing.assert_allclose(aggregated, dat, rtol=1e-7)
+
+    # Converting a file again replaces its tables
+    make_nxs("b07-3.nxs", "XPS", regions=("Survey",), points=5)
+    subprocess.check_call(cmd, stdout=subprocess.DEVNULL)
+    with h5py.File(folder / f"{folder.name}_XPS.h5", "r") as f:
+        assert list(f["scans"]) == ["b07-3_Survey_XPS"]
+        assert list(f["index"]["rows"]) == [5]
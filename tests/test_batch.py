@@ -0,0 +1,115 @@
+import subprocess
+import sys
+
+from B07nxs2txt import _batch
+from B07nxs2txt._batch import WorkQueue
+from B07nxs2txt._utils import ConversionResult, ScanType
+
+
+def test_work_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(_batch, "RETRY_DELAY", 0.0)
+    folder = str(tmp_path)
+    queue_path = str(tmp_path / "queue.sqlite")
+    worker_a = WorkQueue(queue_path, folder, worker="a")
+    worker_b = WorkQueue(queue_path, folder, worker="b")
+    paths = [f"{folder}/b07-{n}.nxs" for n in range(3)]
+
+    assert worker_a.fill(paths) == 3
+    assert worker_b.fill(paths[:1]) == 0
+    claims = {worker_a.claim(): worker_a, worker_b.claim(): worker_b}
+    claims[worker_a.claim()] = worker_a
+    assert sorted(claims) == paths
+    assert worker_b.claim() is None
+
+    done, failing, empty = paths
+    claims[done].record(
+        ConversionResult(done, True, ScanType.XPS, [f"{done}.dat"]), None
+    )
+    claims[empty].record(ConversionResult(empty, False, ScanType.NEXAFS), None)
+    # Failures are retried, by any worker, until the last attempt
+    owner = claims[failing]
+    for attempt in range(1, _batch.MAX_ATTEMPTS + 1):
+        owner.record(ConversionResult(failing, True, error="boom"), None)
+        if attempt < _batch.MAX_ATTEMPTS:
+            owner = worker_b if owner is worker_a else worker_a
+            assert owner.claim() == failing
+    assert owner.next_retry() is None
+    # Only the worker holding the claim records the outcome
+    other = worker_b if owner is worker_a else worker_a
+    other.record(ConversionResult(failing, True), None)
+
+    summary = WorkQueue(queue_path).summary()
+    assert summary.states == {"done": 2, "failed": 1}
+    assert summary.layouts == {"new": 2, "old": 1}
+    assert sorted(summary.errors) == [
+        f"\n ERROR {failing} : boom \n",
+        f"\n WARNING empty result {empty} \n",
+    ]
+
+
+def test_cli_workers_and_summary(make_nxs, tmp_path):
+    for n in range(1, 5):
+        make_nxs(f"b07-{n}.nxs", "NEXAFS" if n % 2 else "XY_DATA", n < 3)
+    (tmp_path / "b07-5.nxs").write_bytes(b"not hdf5")
+    queue = str(tmp_path / "queue.sqlite")
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(tmp_path), "--queue", queue]
+
+    workers = [
+        subprocess.Popen(
+            cmd + ["-j", "1"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        for _ in range(3)
+    ]
+    outputs = [worker.communicate()[0] for worker in workers]
+    assert all(worker.returncode == 0 for worker in workers)
+    assert len(list(tmp_path.glob("*.dat"))) == 4
+    # Every file was converted by a single worker
+    converted = [
+        int(line.split(":")[1])
+        for output in outputs
+        for line in output.splitlines()
+        if line.startswith("NUMBER OF PROCESSED")
+    ]
+    assert sum(converted) == 4
+
+    summary = subprocess.check_output(
+        [sys.executable, "-m", "B07nxs2txt", "summary", queue], text=True
+    )
+    assert "done: 4\nskipped: 1\n" in summary
+    assert "NUMBER OF FILES LEFT TO CONVERT: 0" in summary
+    assert "NUMBER OF PROCESSED NEW FILES: 2" in summary
+    assert "NUMBER OF PROCESSED OLD FILES: 2" in summary
+    assert "ALL ERRORS: \n\n[]" in summary
+
+
+def test_fill_commits_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(_batch, "INSERT_BATCH", 2)
+    # Waiting for the filling worker's lock would fail rather than hang
+    monkeypatch.setattr(_batch, "LOCK_TIMEOUT", 1.0)
+    folder = str(tmp_path)
+    queue_path = str(tmp_path / "queue.sqlite")
+    filler = WorkQueue(queue_path, folder, worker="a")
+    other = WorkQueue(queue_path, folder, worker="b")
+    paths = [f"{folder}/b07-{n}.nxs" for n in range(5)]
+    claimed = []
+
+    def walk():
+        for index, path in enumerate(paths):
+            if index == 3:
+                # The first batch can be claimed while the folder is walked
+                assert other.fill(paths) == 0
+                claimed.extend([other.claim(), other.claim()])
+                assert None not in claimed
+                assert other.claim() is None
+                assert other.next_retry() is not None  # more files to come
+            yield path
+
+    assert filler.fill(walk()) == 5
+    assert other.fill(paths) == 0
+    while (path := other.claim()) is not None:
+        claimed.append(path)
+    assert sorted(claimed) == paths
+    assert other.next_retry() is None
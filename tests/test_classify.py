@@ -0,0 +1,105 @@
+import itertools
+
+import pytest
+
+from B07nxs2txt._classify import Classifier, Condition, Rule, parse_rules
+from B07nxs2txt._utils import ConversionOptions, ScanType
+from B07nxs2txt.converter import convert_file
+from B07nxs2txt.scripts import b07_convert_new, b07_convert_old
+
+KEYS = ["pgm_energy", "pgm_cff", "ca15b", "femto2", "analyser", "sm21b_x", "dummy_a"]
+KEYS += ["s1_pos", "cam1"]
+
+
+def original_new(keys):
+    """The classification before the rules were introduced"""
+    if any(s.startswith(("pgm_energy", "pgm_cff")) for s in keys) and any(
+        s.startswith(("ca", "femto")) for s in keys
+    ):
+        if any(s.startswith("analyser") for s in keys):
+            return ScanType.NEXAFS_ANALYSER
+        return ScanType.NEXAFS
+    elif any(s.startswith("analyser") for s in keys):
+        return ScanType.XPS
+    elif any(s.startswith(("sm21b_x", "sm21b_y", "sm21b_z", "dummy_a")) for s in keys):
+        return ScanType.XY_DATA
+    return None
+
+
+def original_old(keys):
+    if "pgm_energy" in keys and any("ca" in s or "femto" in s for s in keys):
+        if "analyser" in keys:
+            return ScanType.NEXAFS_ANALYSER
+        return ScanType.NEXAFS
+    elif "analyser" in keys:
+        return ScanType.XPS
+    elif {"sm21b_x", "sm21b_y", "sm21b_z", "dummy_a"} & set(keys):
+        return ScanType.XY_DATA
+    return None
+
+
+class FakeMetadata:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def children(self):
+        return self.keys
+
+
+def test_default_rules_match_original():
+    for n in range(4):
+        for keys in itertools.combinations(KEYS, n):
+            new = b07_convert_new.classify_scan_type([k.encode() for k in keys])
+            expected = original_new(keys)
+            if expected == ScanType.XPS and new == ScanType.RESONANT_PES:
+                # Newly detected, and exported as before
+                expected = ScanType.RESONANT_PES
+            assert new == expected, keys
+            old = b07_convert_old.classify_scan_type(FakeMetadata(keys))
+            assert old == original_old(keys), keys
+
+
+def test_new_scan_types():
+    def classify(*keys):
+        return b07_convert_new.classify_scan_type([k.encode() for k in keys])
+
+    assert classify("analyser", "pgm_energy") == ScanType.RESONANT_PES
+    assert classify("analyser", "deflector_x") == ScanType.ARPES_MAP
+    assert classify("analyser", "sm21b_x", "sm21b_y") == ScanType.MAPPING
+    assert classify("analyser", "sm21b_x") == ScanType.XPS
+
+
+def test_classifier_single_pass():
+    classifier = Classifier(
+        [
+            Rule(ScanType.MAPPING, (Condition("contains", ("map",)),)),
+            Rule(
+                ScanType.XPS,
+                (Condition("prefix", ("ana", "analyser")), Condition("exact", ("x",))),
+            ),
+        ]
+    )
+    assert classifier.classify(["x", "analyser"]) == ScanType.XPS
+    assert classifier.classify(["anax"]) is None
+    assert classifier.classify(["mymap", "x", "ana"]) == ScanType.MAPPING
+
+
+def test_parse_rules_errors():
+    with pytest.raises(ValueError, match="Unknown scan type"):
+        parse_rules({"rules": [{"scan_type": "EXAFS", "require": []}]})
+    with pytest.raises(ValueError, match="need one of"):
+        parse_rules({"rules": [{"scan_type": "XPS", "require": [{"glob": ["a*"]}]}]})
+    with pytest.raises(ValueError, match="no conditions"):
+        parse_rules({"rules": [{"scan_type": "XPS"}]})
+
+
+def test_rules_file(make_nxs, tmp_path):
+    rules_file = tmp_path / "rules.toml"
+    rules_file.write_text(
+        '[[rules]]\nscan_type = "XY_DATA"\nrequire = [{exact = ["unknown"]}]\n'
+    )
+    path = make_nxs("b07-1.nxs", "OTHER")
+
+    assert convert_file(str(path)).scan_type is None
+    options = ConversionOptions(classifiers=str(rules_file))
+    assert convert_file(str(path), options).scan_type == ScanType.XY_DATA
@@ -7,3 +7,25 @@ from B07nxs2txt import __version__
 def test_cli_version():
     cmd = [sys.executable, "-m", "B07nxs2txt", "--version"]
     assert subprocess.check_output(cmd).decode().strip() == __version__
+
+
+def test_cli_compression_level_needs_compressed_format(tmp_path):
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(tmp_path), "--compression_level"]
+    rejected = subprocess.run(cmd + ["1"], capture_output=True, text=True)
+    assert rejected.returncode == 2
+    assert "--compression_level requires a compressed format" in rejected.stderr
+
+    accepted = subprocess.run(cmd + ["1", "--format", "dat.gz", "-q"])
+    assert accepted.returncode == 0
+
+
+def test_cli_starts_without_h5py(tmp_path):
+    # Neither parsing the arguments nor an empty folder imports h5py or numpy
+    script = (
+        "import sys\n"
+        "from B07nxs2txt.__main__ import main\n"
+        f"main([{str(tmp_path)!r}, '-q'])\n"
+        "print(sorted({'h5py', 'numpy'} & set(sys.modules)))\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", script], text=True)
+    assert output.splitlines()[-1] == "[]"
@@ -0,0 +1,125 @@
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from B07nxs2txt import ConversionOptions, _utils, convert_file
+from B07nxs2txt._utils import ScanType
+
+
+@pytest.mark.parametrize("layout_new", [True, False])
+def test_convert_nexafs(make_nxs, layout_new):
+    path = make_nxs("b07-1.nxs", "NEXAFS", layout_new, points=3)
+
+    result = convert_file(str(path))
+
+    assert result.error is None
+    assert result.main_node_new is layout_new
+    assert result.scan_type == ScanType.NEXAFS
+    assert result.outputs == [str(path.parent / "b07-1_NEXAFS.dat")]
+    assert (path.parent / "b07-1_NEXAFS.dat").read_bytes() == (
+        b"pgm_energy\tca15b\r\n500\t500\r\n505\t505\r\n510\t510\r\n"
+    )
+
+
+@pytest.mark.parametrize("layout_new", [True, False])
+def test_convert_xps_regions(make_nxs, layout_new):
+    path = make_nxs("b07-2.nxs", "XPS", layout_new, regions=("Survey", "C1s"))
+
+    result = convert_file(str(path), ConversionOptions(titles_off=True))
+
+    assert result.scan_type == ScanType.XPS
+    assert [p.split("/")[-1] for p in result.outputs] == [
+        "b07-2_Survey_XPS.dat",
+        "b07-2_C1s_XPS.dat",
+    ]
+    first_line = (path.parent / "b07-2_C1s_XPS.dat").read_text().splitlines()[0]
+    assert first_line.split("\t")[0] == "100"
+
+
+def test_convert_external_links(make_nxs):
+    path = make_nxs("b07-1.nxs", "NEXAFS", points=4)
+    with h5py.File(path.parent / "ca15b-1.h5", "w") as f:
+        f["padding"] = np.zeros(256)
+        f["data"] = np.linspace(7.0, 8.0, 4)
+    with h5py.File(path, "a") as f:
+        del f["entry/instrument/ca15b/value"]
+        f["entry/instrument/ca15b/value"] = h5py.ExternalLink("ca15b-1.h5", "/data")
+    # An analyser region stored in another file, as is
+    xps = make_nxs("b07-2.nxs", "XPS", regions=("Survey", "C1s"))
+    convert_file(str(xps))
+    expected = (xps.parent / "b07-2_C1s_XPS.dat").read_bytes()
+    xps.rename(xps.parent / "regions.h5")
+    xps = make_nxs("b07-2.nxs", "XPS", regions=("Survey", "C1s"))
+    with h5py.File(xps, "a") as f:
+        del f["entry/instrument/C1s"]
+        f["entry/instrument/C1s"] = h5py.ExternalLink(
+            "regions.h5", "/entry/instrument/C1s"
+        )
+
+    result = convert_file(str(path))
+
+    assert result.error is None
+    lines = (path.parent / "b07-1_NEXAFS.dat").read_text().splitlines()
+    assert lines[0] == "pgm_energy\tca15b"
+    ca15b = [float(line.split("\t")[1]) for line in lines[1:]]
+    np.testing.assert_allclose(ca15b, np.linspace(7.0, 8.0, 4))
+
+    result = convert_file(str(xps))
+
+    assert result.error is None
+    assert (xps.parent / "b07-2_C1s_XPS.dat").read_bytes() == expected
+
+
+def test_convert_output_dir(make_nxs, tmp_path):
+    path = make_nxs("b07-3.nxs", "XY_DATA")
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+
+    result = convert_file(str(path), ConversionOptions(output_dir=str(output_dir)))
+
+    assert result.outputs == [str(output_dir / "b07-3_XY.dat")]
+
+
+def test_convert_unreadable_file(tmp_path):
+    path = tmp_path / "broken.nxs"
+    path.write_text("not hdf5")
+
+    result = convert_file(str(path))
+
+    assert result.main_node_new is None
+    assert result.error is not None
+
+
+def test_cli_converts_folder(make_nxs):
+    make_nxs("b07-4.nxs", "NEXAFS", True)
+    path = make_nxs("b07-5.nxs", "XY_DATA", False)
+
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(path.parent)]
+    output = subprocess.check_output(cmd).decode()
+
+    assert "NUMBER OF PROCESSED NEW FILES: 1" in output
+    assert "NUMBER OF PROCESSED OLD FILES: 1" in output
+    assert (path.parent / "b07-4_NEXAFS.dat").exists()
+    assert (path.parent / "b07-5_XY.dat").exists()
+
+
+@pytest.mark.parametrize("small_file_size", [0, 1 << 30])
+def test_convert_opens_file_once(make_nxs, monkeypatch, small_file_size):
+    path = make_nxs("b07-6.nxs", "XPS", regions=("Survey", "C1s"))
+    opened = []
+    file_class = h5py.File
+
+    def counting_file(*args, **kwargs):
+        opened.append(kwargs["driver"])
+        return file_class(*args, **kwargs)
+
+    monkeypatch.setattr(_utils, "SMALL_FILE_SIZE", small_file_size)
+    monkeypatch.setattr(h5py, "File", counting_file)
+
+    result = convert_file(str(path))
+
+    assert len(result.outputs) == 2
+    assert opened == ["core" if small_file_size else "sec2"]
@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from B07nxs2txt._discover import (
+    Selection,
+    iter_nxs_files,
+    parse_scan_ranges,
+    parse_shard,
+)
+
+
+@pytest.fixture
+def visit(tmp_path):
+    for name in [
+        "b07-1.nxs",
+        "b07-2.nxs",
+        "notes.txt",
+        "sample1/b07-10.nxs",
+        "sample1/b07-11.nxs",
+        "sample1/processed/b07-10_reduced.nxs",
+        "sample2/deep/b07-20.nxs",
+    ]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    return tmp_path
+
+
+def found(folder, selection=None, recursive=True):
+    paths = iter_nxs_files(str(folder), selection, recursive)
+    return [os.path.relpath(path, folder) for path in paths]
+
+
+def test_iter_nxs_files(visit):
+    assert found(visit, recursive=False) == ["b07-1.nxs", "b07-2.nxs"]
+    assert found(visit) == [
+        "b07-1.nxs",
+        "b07-2.nxs",
+        "sample1/b07-10.nxs",
+        "sample1/b07-11.nxs",
+        "sample1/processed/b07-10_reduced.nxs",
+        "sample2/deep/b07-20.nxs",
+    ]
+    selection = Selection(exclude=("processed", "b07-2.*"))
+    assert "sample1/processed/b07-10_reduced.nxs" not in found(visit, selection)
+    assert "b07-2.nxs" not in found(visit, selection)
+    selection = Selection(include=("sample1/*",), scans=parse_scan_ranges("2-10"))
+    assert found(visit, selection) == [
+        "sample1/b07-10.nxs",
+        "sample1/processed/b07-10_reduced.nxs",
+    ]
+
+
+def test_shards_split_the_files(visit):
+    everything = found(visit)
+    shards = [found(visit, Selection(shard=(i, 3))) for i in (1, 2, 3)]
+    assert sorted(sum(shards, [])) == sorted(everything)
+    assert shards == [found(visit, Selection(shard=(i, 3))) for i in (1, 2, 3)]
+
+
+def test_parse_arguments():
+    assert parse_scan_ranges("100-200, 305") == (range(100, 201), range(305, 306))
+    assert parse_shard("2/4") == (2, 4)
+    with pytest.raises(ValueError, match="Invalid scan range"):
+        parse_scan_ranges("100-")
+    with pytest.raises(ValueError, match="1 <= i <= N"):
+        parse_shard("0/4")
+
+
+def test_cli_recursive(make_nxs, tmp_path):
+    make_nxs("b07-1.nxs", "NEXAFS")
+    (tmp_path / "sub").mkdir()
+    make_nxs("b07-2.nxs", "XY_DATA").rename(tmp_path / "sub" / "b07-2.nxs")
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(tmp_path), "-r"]
+
+    output = subprocess.check_output(cmd + ["--scans", "2"], text=True)
+    assert "NUMBER OF PROCESSED NEW FILES: 1" in output
+    assert (tmp_path / "sub" / "b07-2_XY.dat").exists()
+    assert not (tmp_path / "b07-1_NEXAFS.dat").exists()
+
+    output = subprocess.check_output(cmd, text=True)
+    assert "NUMBER OF PROCESSED NEW FILES: 1" in output
+    assert "NUMBER OF UP TO DATE FILES SKIPPED: 1" in output
+    assert (tmp_path / "b07-1_NEXAFS.dat").exists()
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+from B07nxs2txt import ConversionOptions, open_folder
+from B07nxs2txt._folder import TableCache
+from B07nxs2txt._utils import ExportedTable, ScanType
+
+
+def test_open_folder(make_nxs, tmp_path):
+    make_nxs("b07-1.nxs", "NEXAFS", points=3)
+    make_nxs("b07-2.nxs", "XPS", False, points=4, regions=("Survey", "C1s"))
+    (tmp_path / "b07-3.nxs").write_bytes(b"not hdf5")
+
+    with open_folder(str(tmp_path), ConversionOptions(sweeps="sum")) as folder:
+        assert folder.numbers() == [1, 2, 3]
+        assert folder[3].scan_type is None
+        assert folder.scans("XPS") == [folder[2]]
+        assert folder[1].scan_type is ScanType.NEXAFS
+
+        nexafs = folder[1].arrays()
+        np.testing.assert_array_equal(nexafs["pgm_energy"], [500.0, 505.0, 510.0])
+        survey = folder[2].arrays(region="C1s")
+        assert list(survey) == ["binding_energy", "intensity", "sweeps_sum"]
+        np.testing.assert_allclose(survey["sweeps_sum"], survey["intensity"])
+        with pytest.raises(KeyError, match="No table"):
+            folder[2].table(region="Au4f")
+
+        # Read once, until the file changes
+        assert folder[2].tables is folder[2].tables
+        tables = folder[2].tables
+        os.utime(folder[2].file_path, ns=(0, 0))
+        assert folder[2].tables is not tables
+    # Nothing was written
+    assert sorted(os.listdir(tmp_path)) == ["b07-1.nxs", "b07-2.nxs", "b07-3.nxs"]
+
+
+def test_table_cache():
+    def tables(rows):
+        return [ExportedTable("t", "XY", None, ["x"], [np.zeros(rows)])]
+
+    cache = TableCache(max_bytes=100)
+    cache.put(("a",), tables(5))  # 40 bytes
+    cache.put(("b",), tables(5))
+    assert cache.get(("a",)) is not None
+    cache.put(("c",), tables(5))
+    # The least recently used table is dropped
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) is not None
+    assert cache.nbytes == 80
+    cache.put(("d",), tables(20))  # larger than the cache
+    assert cache.get(("d",)) is None
@@ -0,0 +1,67 @@
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from B07nxs2txt._images import iter_blocks, parse_angle_roi, reduce_image
+
+
+@pytest.mark.parametrize(
+    "shape, chunks", [((5, 4, 6), (2, 4, 6)), ((5, 4, 6), (1, 1, 3)), ((7, 9), (2, 4))]
+)
+def test_blocks_tile_whole_chunks(shape, chunks):
+    covered = np.zeros(shape, dtype=int)
+    for selection in iter_blocks(shape, chunks, block_values=20):
+        block = covered[selection]
+        assert block.size <= max(20, np.prod(chunks))
+        # Blocks start on chunk boundaries
+        assert all(s.start % c == 0 for s, c in zip(selection, chunks, strict=True))
+        block += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"chunks": (1, 2, 8)}, {"chunks": (2, 4, 8), "compression": "gzip"}],
+)
+def test_reduce_image(tmp_path, options):
+    images = np.arange(3 * 4 * 8, dtype=np.int32).reshape(3, 4, 8)
+    with h5py.File(tmp_path / "images.h5", "w") as f:
+        f.create_dataset("image_data", data=images, **options)
+    with h5py.File(tmp_path / "images.h5") as f:
+        reduced = reduce_image(f["image_data"], angle_roi=(1, 3), block_values=16)
+    np.testing.assert_array_equal(reduced.energy_angle_map, images.sum(axis=0))
+    np.testing.assert_array_equal(reduced.spectrum, images[:, 1:3].sum(axis=(0, 1)))
+    assert reduced.images == 3
+
+
+def test_parse_angle_roi():
+    assert parse_angle_roi("100:900") == (100, 900)
+    with pytest.raises(ValueError, match="expected START:STOP"):
+        parse_angle_roi("100")
+    with pytest.raises(ValueError, match="0 <= START < STOP"):
+        parse_angle_roi("9:1")
+
+
+def test_cli_images(make_nxs):
+    path = make_nxs("b07-1.nxs", "XPS", points=5)
+    images = np.ones((2, 3, 5))
+    with h5py.File(path, "a") as f:
+        region = f["entry/instrument/Survey"]
+        region.create_dataset("image_data", data=images, chunks=(1, 3, 5))
+        region["angles"] = np.array([[-1.0, 0.0, 1.0]])
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(path.parent), "--images"]
+    subprocess.check_call(cmd + ["--angle_roi", "1:3"])
+
+    spectrum = path.parent / "b07-1_Survey_ANGLEINT.dat"
+    assert np.loadtxt(spectrum, skiprows=1)[:, 1].tolist() == [4.0] * 5
+    energy_angle_map = (path.parent / "b07-1_Survey_MAP.dat").read_text()
+    assert energy_angle_map.splitlines()[0].split("\t") == [
+        "binding_energy",
+        "angle_-1",
+        "angle_0",
+        "angle_1",
+    ]
+    assert (path.parent / "b07-1_Survey_XPS.dat").exists()
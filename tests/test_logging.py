@@ -0,0 +1,52 @@
+import io
+import subprocess
+import sys
+
+from B07nxs2txt._logging import Progress, format_duration
+
+
+def test_cli_quiet_and_log_file(make_nxs, tmp_path):
+    path = make_nxs("b07-1.nxs", "XPS", False)
+    make_nxs("b07-2.nxs", "NEXAFS")
+    (tmp_path / "b07-3.nxs").write_bytes(b"not hdf5")
+    log_file = tmp_path / "cuddle.log"
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(path.parent), "-j", "2"]
+
+    default = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    assert f"Converted {path}" in default.stderr
+    assert "determined to be" not in default.stderr
+
+    quiet = subprocess.run(
+        cmd + ["--force", "-q", "--log_file", str(log_file), "--log_level", "DEBUG"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    [warning] = quiet.stderr.splitlines()
+    assert warning.startswith(f"WARNING: Error reading {tmp_path / 'b07-3.nxs'}: ")
+    assert "NUMBER OF PROCESSED NEW FILES: 1" in quiet.stdout
+    # Debug messages logged in the worker processes reach the log file
+    log = log_file.read_text()
+    assert "B07nxs2txt._export: b07-1.nxs determined to be an XPS scan." in log
+    assert f"INFO B07nxs2txt.cli: Converted {path}" in log
+
+
+def test_progress():
+    stream = io.StringIO()
+    progress = Progress(3, stream)
+    progress.update()
+    assert stream.getvalue().startswith("\r[1/3] ")
+    assert stream.getvalue().endswith(" left")
+    progress.clear()
+    progress.update(2)
+    assert stream.getvalue().endswith("files/s")
+    progress.close()
+    assert stream.getvalue().endswith("\r")
+    # Files found while converting - no total
+    assert Progress(None, stream).line() == "[0] 0.0 files/s"
+
+
+def test_format_duration():
+    assert format_duration(5.7) == "5s"
+    assert format_duration(125) == "2m05s"
+    assert format_duration(3 * 3600 + 60) == "3h01m"
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+from B07nxs2txt import converter
+from B07nxs2txt._manifest import Manifest
+from B07nxs2txt._utils import ConversionOptions
+from B07nxs2txt.converter import convert_file
+
+
+def test_manifest_round_trip(make_nxs):
+    path = make_nxs("b07-1.nxs", "NEXAFS")
+    options = ConversionOptions()
+    manifest = Manifest(str(path.parent))
+    assert not manifest.is_up_to_date(str(path), options)
+
+    manifest.record(convert_file(str(path), options, hash_file=True), options)
+    manifest.save()
+
+    reloaded = Manifest(str(path.parent))
+    entry = reloaded.entries["b07-1.nxs"]
+    assert (entry.layout, entry.scan_type) == ("new", "NEXAFS")
+    assert entry.outputs == ["b07-1_NEXAFS.dat"]
+    assert reloaded.is_up_to_date(str(path), options)
+    assert not reloaded.is_up_to_date(str(path), ConversionOptions(titles_off=True))
+    # Options that do not change the outputs do not convert the file again
+    assert reloaded.is_up_to_date(str(path), ConversionOptions(compression_threads=3))
+
+
+def test_manifest_detects_changes(make_nxs):
+    path = make_nxs("b07-1.nxs", "XY_DATA")
+    options = ConversionOptions()
+    manifest = Manifest(str(path.parent))
+    manifest.record(convert_file(str(path), options, hash_file=True), options)
+
+    # Touching the file without changing it keeps it up to date
+    os.utime(path, ns=(0, 0))
+    assert manifest.is_up_to_date(str(path), options)
+
+    (path.parent / "b07-1_XY.dat").unlink()
+    assert not manifest.is_up_to_date(str(path), options)
+
+
+def test_cli_incremental(make_nxs):
+    path = make_nxs("b07-1.nxs", "NEXAFS")
+    make_nxs("b07-2.nxs", "XY_DATA", False)
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(path.parent), "-j", "1"]
+
+    first = subprocess.check_output(cmd).decode()
+    make_nxs("b07-3.nxs", "NEXAFS", False)
+    second = subprocess.check_output(cmd).decode()
+    forced = subprocess.check_output(cmd + ["--force"]).decode()
+
+    assert "NUMBER OF UP TO DATE FILES SKIPPED: 0" in first
+    assert "NUMBER OF UP TO DATE FILES SKIPPED: 2" in second
+    assert "NUMBER OF PROCESSED OLD FILES: 1" in second
+    assert "NUMBER OF PROCESSED NEW FILES: 1" in forced
+    assert "NUMBER OF PROCESSED OLD FILES: 2" in forced
+
+
+def test_manifest_records_file_as_converted(make_nxs):
+    path = make_nxs("b07-1.nxs", "NEXAFS")
+    options = ConversionOptions()
+    result = convert_file(str(path), options, hash_file=True)
+    assert result.size == path.stat().st_size
+
+    # Rewritten after it was converted, before the result is recorded
+    make_nxs("b07-1.nxs", "NEXAFS", points=5)
+    manifest = Manifest(str(path.parent))
+    manifest.record(result, options)
+    assert not manifest.is_up_to_date(str(path), options)
+
+
+def test_manifest_hash_reused_for_unchanged_file(make_nxs, monkeypatch):
+    path = make_nxs("b07-1.nxs", "NEXAFS")
+    options = ConversionOptions()
+    manifest = Manifest(str(path.parent))
+    manifest.record(convert_file(str(path), options, hash_file=True), options)
+    previous = manifest.entry(str(path))
+    hashed = []
+    monkeypatch.setattr(converter, "file_hash", lambda p: hashed.append(p) or "new")
+
+    # Converted again, e.g. with --force, without reading the file to hash it
+    result = convert_file(str(path), options, hash_file=True, previous=previous)
+    assert (result.sha256, hashed) == (previous.sha256, [])
+
+    # Or as it changed
+    make_nxs("b07-1.nxs", "NEXAFS", points=5)
+    result = convert_file(str(path), options, hash_file=True, previous=previous)
+    assert (result.sha256, hashed) == ("new", [str(path)])
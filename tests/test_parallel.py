@@ -0,0 +1,87 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import pytest
+
+from B07nxs2txt import _parallel
+from B07nxs2txt._parallel import WORKER_CRASHED, convert_files
+from B07nxs2txt._utils import ConversionOptions, ConversionResult
+
+
+def test_convert_files_in_pool(make_nxs):
+    paths = [str(make_nxs(f"b07-{i}.nxs", "NEXAFS", i % 2 == 0)) for i in range(5)]
+
+    results = {p: r for p, r, _ in convert_files(paths, ConversionOptions(), 2)}
+
+    assert sorted(results) == paths
+    assert all(len(r.outputs) == 1 for r in results.values())
+    assert [r.main_node_new for r in results.values()].count(True) == 3
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="patching the worker function relies on fork",
+)
+def test_worker_crash_is_isolated(make_nxs, monkeypatch):
+    paths = [str(make_nxs(f"b07-{i}.nxs", "XY_DATA")) for i in range(4)]
+
+    def crash_on_second(file_path, options, *hashing):
+        if file_path == paths[1]:
+            os._exit(1)
+        return ConversionResult(file_path=file_path, outputs=["ok"])
+
+    monkeypatch.setattr(_parallel, "convert_file", crash_on_second)
+
+    results = {p: r for p, r, _ in convert_files(paths, ConversionOptions(), 2)}
+
+    assert sorted(results) == paths
+    assert results[paths[1]].error == WORKER_CRASHED
+    assert all(results[p].outputs == ["ok"] for p in paths if p != paths[1])
+
+
+def test_cli_jobs(make_nxs):
+    for i in range(4):
+        path = make_nxs(f"b07-{i}.nxs", "NEXAFS", i < 3)
+
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(path.parent), "--jobs", "3"]
+    output = subprocess.check_output(cmd).decode()
+
+    assert "NUMBER OF PROCESSED NEW FILES: 3" in output
+    assert "NUMBER OF PROCESSED OLD FILES: 1" in output
+    assert len(list(path.parent.glob("*_NEXAFS.dat"))) == 4
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="patching the worker function relies on fork",
+)
+def test_pool_compresses_with_one_thread(make_nxs, monkeypatch):
+    paths = [str(make_nxs(f"b07-{i}.nxs", "XY_DATA")) for i in range(2)]
+
+    def threads(file_path, options, *hashing):
+        return ConversionResult(file_path, outputs=[options.compression_threads])
+
+    monkeypatch.setattr(_parallel, "convert_file", threads)
+
+    # Unless asked for, as the workers already use every CPU
+    for options, expected in [
+        (ConversionOptions(), 1),
+        (ConversionOptions(compression_threads=3), 3),
+    ]:
+        results = convert_files(paths, options, 2)
+        assert [r.outputs for _, r, _ in results] == [[expected]] * 2
+
+
+def test_files_hashed_for_manifest_only(make_nxs):
+    paths = [str(make_nxs(f"b07-{i}.nxs", "XY_DATA")) for i in range(2)]
+
+    for jobs in (1, 2):
+        results = convert_files(paths, ConversionOptions(), jobs)
+        assert [r.sha256 for _, r, _ in results] == [None, None]
+
+        results = convert_files(
+            paths, ConversionOptions(), jobs, recorded=lambda _: None
+        )
+        assert all(len(r.sha256) == 64 for _, r, _ in results)
@@ -0,0 +1,84 @@
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+from B07nxs2txt import _writers
+from B07nxs2txt._pipeline import (
+    BackgroundWriter,
+    CompressingWriter,
+    prefetched,
+    warm_page_cache,
+)
+from B07nxs2txt._utils import ConversionStats
+
+
+def test_prefetched(tmp_path):
+    paths = []
+    for name in "abc":
+        (tmp_path / name).write_bytes(b"x" * 10)
+        paths.append(str(tmp_path / name))
+    taken = []
+
+    def source():
+        for path in paths:
+            taken.append(path)
+            yield path
+
+    prefetching = prefetched(source(), 1)
+    assert next(prefetching) == paths[0]
+    # One path is taken ahead of the one yielded
+    assert taken == paths[:2]
+    assert list(prefetching) == paths[1:]
+    assert list(prefetched(paths, 0)) == paths
+    assert warm_page_cache(paths[0], bytearray(4)) == 10
+    assert warm_page_cache(str(tmp_path / "missing"), bytearray(4)) == 0
+
+
+def test_background_writer():
+    output = io.StringIO()
+    with BackgroundWriter(output, depth=1) as writer:
+        for block in ["a", "b", "c"]:
+            writer.write(block)
+    assert output.getvalue() == "abc"
+
+    output.close()
+    writer = BackgroundWriter(output)
+    writer.write("lost")
+    with pytest.raises(ValueError, match="closed file"):
+        writer.close()
+
+
+def test_dat_written_in_background(tmp_path, monkeypatch):
+    columns = [np.arange(100.0), np.arange(100.0) / 3]
+    foreground = tmp_path / "foreground.dat"
+    _writers.write_dat(str(foreground), ["a", "b"], columns, False, ConversionStats())
+
+    # Write every table from a thread
+    monkeypatch.setattr(_writers, "CHUNK_VALUES", 10)
+    background = tmp_path / "background.dat"
+    _writers.write_dat(str(background), ["a", "b"], columns, False, ConversionStats())
+    assert background.read_bytes() == foreground.read_bytes()
+
+
+def test_compressing_writer():
+    output = io.BytesIO()
+    with CompressingWriter(output, gzip.compress, threads=2, block_size=4) as writer:
+        for block in ["ab", "cd", "ef", "ghij", "k"]:
+            writer.write(block)
+    # One member per block, read back as a whole
+    assert output.getvalue().count(b"\x1f\x8b\x08") == 3
+    assert gzip.decompress(output.getvalue()) == b"abcdefghijk"
+
+    output = io.BytesIO()
+    CompressingWriter(output, gzip.compress).close()
+    assert gzip.decompress(output.getvalue()) == b""
+
+    def failing(block: bytes) -> bytes:
+        raise OSError("compression failed")
+
+    writer = CompressingWriter(io.BytesIO(), failing, threads=1)
+    writer.write("lost")
+    with pytest.raises(OSError, match="compression failed"):
+        writer.close()
@@ -0,0 +1,90 @@
+import logging
+
+import h5py
+import numpy as np
+import pytest
+
+from B07nxs2txt._fastread import FileMap
+from B07nxs2txt._reader import NEW_LAYOUT, OLD_LAYOUT, ScanReader, detect_layout
+from B07nxs2txt._utils import DatasetColumn, open_nexus
+from B07nxs2txt.converter import convert_file
+
+
+@pytest.mark.parametrize("layout_new", [True, False])
+def test_scan_reader(make_nxs, layout_new):
+    nexafs = make_nxs("b07-1.nxs", "NEXAFS", layout_new, points=5)
+    xps = make_nxs("b07-2.nxs", "XPS", layout_new, regions=("Survey", "C1s"))
+    layout = NEW_LAYOUT if layout_new else OLD_LAYOUT
+
+    with h5py.File(nexafs) as nexus:
+        assert detect_layout(nexus) is layout
+        reader = ScanReader(nexus, layout)
+        assert reader.value_path("ca15b") == (
+            "ca15b/value" if layout_new else "ca15b/ca15b"
+        )
+        column = reader.column("pgm_energy")
+        assert isinstance(column, DatasetColumn)
+        np.testing.assert_array_equal(column[:], np.linspace(500.0, 510.0, 5))
+        assert len(reader.column("missing")) == 0
+
+    with h5py.File(xps) as nexus:
+        reader = ScanReader(nexus, layout)
+        assert sorted(reader.classification_keys()) == (
+            ["analyser"] if layout_new else ["C1s", "Survey", "analyser"]
+        )
+        assert reader.regions() == ["Survey", "C1s"]
+        columns = reader.xps_columns("C1s")
+        titles = ["binding_energy", "intensity", "spectrum_1", "spectrum_2"]
+        assert list(columns) == titles
+        assert all(len(column) == 11 for column in columns.values())
+
+
+def test_no_main_node(tmp_path, caplog):
+    with h5py.File(tmp_path / "empty.nxs", "w") as nexus:
+        assert detect_layout(nexus) is None
+    assert "No main node found" in caplog.text
+
+
+@pytest.mark.parametrize("layout_new", [True, False])
+def test_empty_binding_energy(make_nxs, layout_new, caplog):
+    path = make_nxs("b07-1.nxs", "XPS", layout_new)
+    with h5py.File(path, "r+") as nexus:
+        layout = NEW_LAYOUT if layout_new else OLD_LAYOUT
+        region = nexus[f"{layout.instrument_node}/Survey"]
+        del region["binding_energy"]
+        region.create_dataset("binding_energy", shape=(0,), dtype=float)
+
+    with caplog.at_level(logging.WARNING):
+        result = convert_file(str(path))
+    assert result.error is None
+    assert result.outputs == []
+    assert "Empty binding energy dataset - skipping b07-1.nxs" in caplog.text
+
+
+def test_file_map(tmp_path):
+    path = tmp_path / "datasets.h5"
+    with h5py.File(path, "w") as f:
+        f["contiguous"] = np.arange(6.0).reshape(2, 3)
+        f["big_endian"] = np.arange(4, dtype=">i4")
+        f.create_dataset("chunked", data=np.arange(4.0), chunks=(2,))
+        f.create_dataset("compressed", data=np.arange(4.0), compression="gzip")
+        f["names"] = np.array([b"a", b"b"])
+        f.create_dataset("unwritten", shape=(4,), dtype="f8")
+        f["external"] = h5py.ExternalLink("other.h5", "/data")
+    with h5py.File(tmp_path / "other.h5", "w") as f:
+        f["padding"] = np.zeros(256)
+        f["data"] = np.linspace(7.0, 8.0, 4)
+
+    with open_nexus(str(path)) as nexus:
+        file_map = FileMap(nexus)
+        for name in ["contiguous", "big_endian"]:
+            mapped = file_map.view(nexus[name])
+            np.testing.assert_array_equal(mapped, nexus[name][()])
+            assert not mapped.flags.writeable
+        # Stored in another file, at an offset that means nothing in this one
+        for name in ["chunked", "compressed", "names", "unwritten", "external"]:
+            assert file_map.view(nexus[name]) is None
+        column = DatasetColumn(
+            nexus["contiguous"], 1, file_map.view(nexus["contiguous"])
+        )
+        np.testing.assert_array_equal(column[1:], [4.0, 5.0])
@@ -0,0 +1,75 @@
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from B07nxs2txt._reduce import combine_sweeps, normalise, outlier_sweeps, rebin
+
+
+def test_combine_sweeps():
+    sweeps = np.array([[1.0, 2.0], [1.1, 2.1], [0.9, 1.9], [9.0, 0.0]])
+    assert outlier_sweeps(sweeps, 3.0).tolist() == [False, False, False, True]
+    # Too few sweeps to reject any
+    assert not outlier_sweeps(sweeps[[0, 3]], 3.0).any()
+
+    total, rejected = combine_sweeps(sweeps, "sum")
+    np.testing.assert_allclose(total, [12.0, 6.0])
+    assert not rejected.any()
+    mean, rejected = combine_sweeps(sweeps, "mean", reject_sigma=3.0)
+    np.testing.assert_allclose(mean, [1.0, 2.0])
+    assert rejected.sum() == 1
+    with pytest.raises(ValueError, match="Unknown sweep reduction"):
+        combine_sweeps(sweeps, "median")
+
+
+def test_normalise_and_rebin():
+    normalised = normalise(np.array([2.0, 3.0, 4.0]), np.array([2.0, 0.0]))
+    np.testing.assert_array_equal(normalised, [1.0, np.nan])
+    columns = [np.arange(5.0), np.arange(5)]
+    for column in rebin(columns, 2):
+        np.testing.assert_array_equal(column, [0.5, 2.5, 4.0])
+    assert rebin(columns, 1) is columns
+
+
+def test_cli_reductions(make_nxs):
+    xps = make_nxs("b07-1.nxs", "XPS", points=4, sweeps=4)
+    with h5py.File(xps, "a") as f:
+        f["entry/instrument/Survey/spectrum_4"][0] += 1000.0
+    nexafs = make_nxs("b07-2.nxs", "NEXAFS", points=4)
+    with h5py.File(nexafs, "a") as f:
+        f["entry/instrument/ca11b/value"] = np.full(4, 2.0)
+    folder = str(xps.parent)
+    subprocess.check_call(
+        [sys.executable, "-m", "B07nxs2txt", folder, "--rebin", "2"]
+        + ["--sweeps", "mean", "--reject_sigma", "3", "--normalise", "ca11b"]
+        + ["--format", "dat", "--format", "h5", "--format", "npz"]
+    )
+
+    with open(xps.parent / "b07-1_Survey_XPS.dat") as f:
+        assert f.readline().split() == ["binding_energy", "intensity", "sweeps_mean"]
+        table = np.loadtxt(f)
+    assert table.shape == (2, 3)
+    with h5py.File(xps) as f:
+        region = f["entry/instrument/Survey"]
+        kept = np.concatenate([region[f"spectrum_{n}"] for n in (1, 2, 3)])
+    expected = kept.mean(axis=0).reshape(2, 2).mean(axis=1)
+    np.testing.assert_allclose(table[:, 2], expected, rtol=1e-7)
+
+    with open(xps.parent / "b07-2_NEXAFS.dat") as f:
+        titles = f.readline().split()
+        table = np.loadtxt(f)
+    assert titles == ["pgm_energy", "ca11b", "ca15b_over_ca11b"]
+    energies = np.linspace(500.0, 510.0, 4).reshape(2, 2).mean(axis=1)
+    np.testing.assert_allclose(table[:, 0], energies)
+    np.testing.assert_allclose(table[:, 2], energies / 2.0)
+
+    # One flat dataset or array per column
+    with h5py.File(xps.parent / "b07-2_NEXAFS.h5") as f:
+        assert list(f.attrs["columns"]) == titles
+        assert sorted(f) == sorted(titles)
+        np.testing.assert_allclose(f["ca15b_over_ca11b"][()], energies / 2.0)
+    with np.load(xps.parent / "b07-2_NEXAFS.npz") as archive:
+        assert sorted(archive.files) == sorted(titles)
+        np.testing.assert_allclose(archive["ca15b_over_ca11b"], energies / 2.0)
@@ -0,0 +1,49 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+from B07nxs2txt.converter import convert_file
+
+
+def test_conversion_stats(make_nxs):
+    path = make_nxs("b07-1.nxs", "XPS", points=21, regions=("Survey", "C1s"))
+    result = convert_file(str(path))
+    stats = result.stats
+
+    assert {"open", "index", "classify", "read", "format", "write"} <= set(stats.stages)
+    assert sum(stats.stages.values()) <= stats.seconds
+    assert stats.file_bytes == os.path.getsize(path)
+    assert stats.bytes_written == sum(os.path.getsize(p) for p in result.outputs)
+    # binding energy, intensity and 2 sweeps of float64 for each region
+    assert stats.bytes_read == 2 * 4 * 21 * 8
+    assert stats.rows == 2 * 21
+
+
+def test_cli_report_and_profile(make_nxs, tmp_path):
+    make_nxs("b07-1.nxs", "NEXAFS")
+    make_nxs("b07-2.nxs", "XY_DATA", False, points=5)
+    folder = tmp_path
+    report = tmp_path / "report.jsonl"
+    profiles = tmp_path / "profiles"
+    subprocess.check_call(
+        [sys.executable, "-m", "B07nxs2txt", str(folder), "-j", "2"]
+        + ["--report", str(report), "--profile", "1", "--profile_dir", str(profiles)],
+        stdout=subprocess.DEVNULL,
+    )
+
+    *files, run = [json.loads(line) for line in report.read_text().splitlines()]
+    assert sorted((f["path"], f["scan_type"], f["rows"]) for f in files) == [
+        (str(folder / "b07-1.nxs"), "NEXAFS", 11),
+        (str(folder / "b07-2.nxs"), "XY_DATA", 5),
+    ]
+    assert all("overhead" in f["stages"] for f in files)
+    assert run["record"] == "run"
+    assert (run["files"], run["failed"], run["skipped"]) == (2, 0, 0)
+    assert run["rows"] == {"NEXAFS": 11, "XY_DATA": 5}
+    assert run["bytes_written"] == sum(f["bytes_written"] for f in files)
+
+    [profile] = profiles.iterdir()
+    assert profile.name.startswith("1_b07-")
+    assert pstats.Stats(str(profile)).total_calls > 0
@@ -0,0 +1,81 @@
+import io
+
+import h5py
+import numpy as np
+
+from B07nxs2txt._utils import DatasetColumn, MetadataIndex, format_rows, write_rows
+
+
+def test_format_rows_matches_per_value_formatting():
+    rng = np.random.default_rng(0)
+    columns = [
+        rng.integers(0, 2**64, 1000, dtype=np.uint64).view(np.float64),
+        rng.standard_normal(1000).astype(np.float32),
+        rng.integers(-(10**15), 10**15, 1000),
+        np.resize([np.nan, np.inf, -np.inf, -0.0, 5e-324, 123456789.5], 1000),
+    ]
+    expected = "".join(
+        "\t".join(f"{value:.8g}" for value in row) + "\r\n"
+        for row in zip(*columns, strict=True)
+    )
+
+    assert format_rows(columns) == expected
+
+
+def test_format_rows_truncates_to_shortest_column():
+    assert format_rows([np.arange(3), np.array([0.5, 0.25])]) == "0\t0.5\r\n1\t0.25\r\n"
+    assert format_rows([np.arange(3), np.empty(0)]) == ""
+    assert format_rows([]) == ""
+
+
+def test_write_rows_streams_dataset_chunks(tmp_path):
+    with h5py.File(tmp_path / "data.h5", "w") as f:
+        f["energy"] = np.linspace(0.0, 1.0, 1001)
+        f["spectra"] = np.arange(3003.0).reshape(3, 1001) / 3
+        columns = [DatasetColumn(f["energy"]), DatasetColumn(f["spectra"], 1)]
+        assert len(columns[1]) == 1001
+
+        output = io.StringIO()
+        write_rows(output, columns, chunk_values=64)
+
+        expected = format_rows([f["energy"][:], f["spectra"][1]])
+    assert output.getvalue() == expected
+
+
+def test_metadata_index(tmp_path):
+    with h5py.File(tmp_path / "other.h5", "w") as f:
+        f["value"] = np.arange(3.0)
+    with h5py.File(tmp_path / "data.h5", "w") as f:
+        instrument = f.create_group("instrument", track_order=True)
+        instrument["pgm_energy/value"] = np.arange(5.0)
+        instrument["ca15b/value"] = np.zeros((2, 3), dtype=np.float32)
+        instrument["alias"] = h5py.SoftLink("/instrument/pgm_energy")
+        instrument["missing"] = h5py.SoftLink("/nowhere")
+        instrument["external"] = h5py.ExternalLink("other.h5", "/")
+        instrument["unlinked"] = h5py.ExternalLink("nowhere.h5", "/")
+
+        metadata = MetadataIndex(instrument)
+
+        # External links are only followed when asked for
+        assert not [path for path in metadata.nodes if "external" in path]
+        assert metadata.children("external") == ["value"]
+        assert metadata["external/value"].shape == (3,)
+        assert "unlinked" not in metadata
+        assert "unlinked/value" not in metadata
+
+    # Creation order of the members is kept, dangling links are skipped
+    assert metadata.children() == [
+        "pgm_energy",
+        "ca15b",
+        "alias",
+        "missing",
+        "external",
+        "unlinked",
+    ]
+    assert "missing" not in metadata
+    assert metadata.children("alias") == ["value"]
+    assert metadata["pgm_energy/value"].shape == (5,)
+    assert metadata["ca15b/value"].ndim == 2
+    assert metadata["ca15b/value"].dtype == np.float32
+    assert not metadata["ca15b/value"].is_group
+    assert metadata.children("ca15b/value") == []
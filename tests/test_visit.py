@@ -0,0 +1,57 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip("xarray")
+pytest.importorskip("dask")
+
+from B07nxs2txt import open_visit  # noqa: E402
+
+
+def test_open_visit(make_nxs, tmp_path):
+    make_nxs("b07-1.nxs", "NEXAFS", points=3)
+    make_nxs("b07-2.nxs", "XPS")
+    make_nxs("b07-3.nxs", "NEXAFS", False, points=5)
+    make_nxs("b07-4.nxs", "XY_DATA")
+    (tmp_path / "b07-5.nxs").write_bytes(b"not hdf5")
+
+    visit = open_visit(str(tmp_path), "NEXAFS", scans_per_chunk=1)
+    assert visit.sizes == {"scan": 2, "point": 5}
+    assert list(visit.scan) == [1, 3]
+    assert list(visit.data_vars) == ["pgm_energy", "ca15b"]
+    assert visit.ca15b.chunks == ((1, 1), (5,))
+    np.testing.assert_array_equal(
+        visit.pgm_energy.sel(scan=1), [500.0, 505.0, 510.0, np.nan, np.nan]
+    )
+    np.testing.assert_array_equal(
+        visit.ca15b.sel(scan=3), [500.0, 502.5, 505.0, 507.5, 510.0]
+    )
+    np.testing.assert_allclose(visit.ca15b.max("point").compute(), [510.0, 510.0])
+
+    xy = open_visit(str(tmp_path), "XY_DATA")
+    assert list(xy.scan) == [4]
+    assert list(xy.data_vars) == ["sm21b_x", "ca15b"]
+    with pytest.raises(ValueError, match="NEXAFS and XY"):
+        open_visit(str(tmp_path), "XPS")
+
+
+def _bytes_read() -> int:
+    with open("/proc/self/io") as io:
+        return next(int(line.split()[1]) for line in io if line.startswith("rchar"))
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/io"), reason="Linux only")
+def test_open_visit_reads_only_columns(make_nxs, tmp_path):
+    for number in (1, 2):
+        path = make_nxs(f"b07-{number}.nxs", "NEXAFS", points=100)
+        with h5py.File(path, "a") as f:
+            # Not exported, and much larger than the columns
+            f["entry/instrument/detector/data"] = np.ones((1000, 1000))
+    file_size = path.stat().st_size
+
+    before = _bytes_read()
+    visit = open_visit(str(tmp_path), "NEXAFS", scans_per_chunk=1)
+    visit.compute()
+    assert _bytes_read() - before < file_size / 2
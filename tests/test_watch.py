@@ -0,0 +1,148 @@
+import subprocess
+import sys
+import threading
+import time
+
+import h5py
+import pytest
+
+from B07nxs2txt._watch import POLL_INTERVAL, is_complete, watch_folder
+from B07nxs2txt.converter import convert_file
+
+WRITER = """
+import sys, h5py
+with h5py.File(sys.argv[1], "w") as f:
+    print("open", flush=True)
+    sys.stdin.readline()
+    f["entry/end_time"] = "2024-01-01T00:00:00"
+"""
+
+# Appends a point to a NEXAFS scan per line read, without locking the file as
+# on network filesystems, and ends the scan at the end of its input
+APPENDING_WRITER = """
+import sys, h5py
+with h5py.File(sys.argv[1], "w", locking=False) as f:
+    for name in ("pgm_energy", "ca15b"):
+        f.create_dataset(f"entry/instrument/{name}/value", (0,), maxshape=(None,))
+    f["entry/diamond_scan/scan_fields"] = [b"pgm_energy", b"ca15b"]
+    f.flush()
+    print("open", flush=True)
+    for line in sys.stdin:
+        for name in ("pgm_energy", "ca15b"):
+            values = f[f"entry/instrument/{name}/value"]
+            values.resize((len(values) + 1,))
+            values[-1] = float(line)
+        f.flush()
+        print("point", flush=True)
+    f["entry/end_time"] = "2024-01-01T00:00:00"
+"""
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_is_complete(tmp_path):
+    path = tmp_path / "b07-1.nxs"
+    # The writer holds the HDF5 file lock until it closes the file
+    writer = subprocess.Popen(
+        [sys.executable, "-c", WRITER, str(path)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    assert writer.stdout.readline() == b"open\n"
+    assert not is_complete(str(path))
+    writer.communicate(b"\n")
+    assert is_complete(str(path))
+    (tmp_path / "partial.nxs").write_bytes(b"\x89HDF\r\n")
+    assert not is_complete(str(tmp_path / "partial.nxs"))
+    # Converted once settled, so that its error is reported
+    assert is_complete(str(tmp_path / "partial.nxs"), quiet_for=60.0)
+
+    # Without an end time, once unchanged for long enough
+    with h5py.File(tmp_path / "other.nxs", "w"):
+        pass
+    assert not is_complete(str(tmp_path / "other.nxs"), quiet_for=1.0)
+    assert is_complete(str(tmp_path / "other.nxs"), quiet_for=60.0)
+
+
+def test_watch_waits_for_end_of_scan(tmp_path):
+    converted = []
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=watch_folder,
+        args=(str(tmp_path), converted.append, lambda p: p in converted, True, stop),
+    )
+    watcher.start()
+    path = tmp_path / "b07-1.nxs"
+    writer = subprocess.Popen(
+        [sys.executable, "-c", APPENDING_WRITER, str(path)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        assert writer.stdout.readline() == b"open\n"
+        # Points further apart than the polling interval
+        for point in range(4):
+            writer.stdin.write(f"{500 + point}\n".encode())
+            writer.stdin.flush()
+            assert writer.stdout.readline() == b"point\n"
+            time.sleep(2 * POLL_INTERVAL)
+        assert converted == []
+        writer.communicate()
+        assert wait_for(lambda: converted == [str(path)])
+    finally:
+        stop.set()
+        watcher.join()
+        writer.kill()
+
+
+def test_watch_converts_corrupt_file_once_settled(tmp_path):
+    converted = []
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=watch_folder,
+        args=(str(tmp_path), converted.append, lambda p: False, True, stop),
+        kwargs={"settle_time": 4 * POLL_INTERVAL},
+    )
+    watcher.start()
+    path = tmp_path / "b07-1.nxs"
+    try:
+        path.write_bytes(b"\x89HDF\r\n")  # truncated, never to be finished
+        assert wait_for(lambda: converted == [str(path)])
+        # Rather than retried for as long as the folder is watched
+        time.sleep(8 * POLL_INTERVAL)
+        assert converted == [str(path)]
+    finally:
+        stop.set()
+        watcher.join()
+
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_watch_converts_new_files(make_nxs, tmp_path, polling):
+    converted = []
+
+    def convert(file_path):
+        converted.append(file_path)
+        convert_file(file_path)
+
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=watch_folder,
+        args=(str(tmp_path), convert, lambda p: p in converted, polling, stop),
+    )
+    watcher.start()
+    try:
+        path = make_nxs("b07-1.nxs", "NEXAFS")
+        assert wait_for((tmp_path / "b07-1_NEXAFS.dat").exists)
+        make_nxs("b07-2.nxs", "XY_DATA")
+        assert wait_for((tmp_path / "b07-2_XY.dat").exists)
+    finally:
+        stop.set()
+        watcher.join()
+    assert converted == [str(path), str(tmp_path / "b07-2.nxs")]
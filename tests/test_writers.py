@@ -0,0 +1,117 @@
+import gzip
+import subprocess
+import sys
+
+import h5py
+import numpy as np
+import pytest
+
+from B07nxs2txt._utils import OUTPUT_FORMATS, ConversionOptions, DatasetColumn
+from B07nxs2txt._writers import WRITERS, write_table
+
+TITLES = ["energy", "ca1", "ca1"]
+
+
+@pytest.fixture
+def columns(tmp_path):
+    with h5py.File(tmp_path / "source.h5", "w") as f:
+        f["spectrum"] = np.arange(12, dtype=np.float32).reshape(2, 6)
+    source = h5py.File(tmp_path / "source.h5", "r")
+    yield [
+        np.linspace(100.0, 101.0, 5),
+        DatasetColumn(source["spectrum"], 0),
+        np.arange(7, dtype=np.int32),
+    ]
+    source.close()
+
+
+EXPECTED = {
+    "energy": np.linspace(100.0, 101.0, 5),
+    "ca1": np.arange(5, dtype=np.float32),
+    "ca1_1": np.arange(5, dtype=np.int32),
+}
+
+
+def check_columns(read):
+    for name, values in EXPECTED.items():
+        assert read[name].dtype == values.dtype
+        np.testing.assert_array_equal(read[name], values)
+
+
+@pytest.mark.parametrize("output_format", ["npy", "npz", "h5"])
+def test_binary_formats_round_trip(tmp_path, columns, output_format):
+    options = ConversionOptions(formats=(output_format,))
+    [output] = write_table(str(tmp_path / "out"), TITLES, columns, options)
+    assert output == str(tmp_path / f"out.{output_format}")
+
+    if output_format == "npy":
+        array = np.load(output, mmap_mode="r")
+        assert array.dtype.names == tuple(EXPECTED)
+        check_columns(array)
+    elif output_format == "npz":
+        with np.load(output) as archive:
+            check_columns(archive)
+    else:
+        with h5py.File(output, "r") as f:
+            assert list(f.attrs["columns"]) == list(EXPECTED)
+            check_columns({name: f[name][()] for name in EXPECTED})
+
+
+def test_parquet_round_trip(tmp_path, columns):
+    pq = pytest.importorskip("pyarrow.parquet")
+    options = ConversionOptions(formats=("parquet",))
+    [output] = write_table(str(tmp_path / "out"), TITLES, columns, options)
+
+    table = pq.read_table(output)
+    assert table.column_names == list(EXPECTED)
+    check_columns({name: table[name].to_numpy() for name in EXPECTED})
+
+
+def test_compressed_dat(tmp_path, columns):
+    options = ConversionOptions(
+        formats=("dat", "dat.gz"), compression_level=1, compression_threads=2
+    )
+    dat, dat_gz = write_table(str(tmp_path / "out"), TITLES, columns, options)
+    assert dat_gz == str(tmp_path / "out.dat.gz")
+    text = (tmp_path / "out.dat").read_bytes()
+    assert gzip.decompress((tmp_path / "out.dat.gz").read_bytes()) == text
+    values = np.loadtxt(dat_gz, skiprows=1)
+    np.testing.assert_array_equal(values[:, 0], EXPECTED["energy"])
+
+    zstandard = pytest.importorskip("zstandard")
+    options = ConversionOptions(formats=("dat.zst",))
+    [dat_zst] = write_table(str(tmp_path / "out"), TITLES, columns, options)
+    with open(dat_zst, "rb") as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        assert reader.read() == text
+
+
+def test_output_formats():
+    # Offered by the CLI without importing the writers
+    assert tuple(WRITERS) == OUTPUT_FORMATS
+
+
+def test_several_formats(tmp_path, columns):
+    options = ConversionOptions(formats=("dat", "npz"))
+    outputs = write_table(str(tmp_path / "out"), TITLES, columns, options)
+    assert outputs == [str(tmp_path / "out.dat"), str(tmp_path / "out.npz")]
+    assert (tmp_path / "out.dat").read_bytes().startswith(b"energy\tca1\tca1\r\n")
+
+
+def test_cli_format(make_nxs):
+    path = make_nxs("b07-1.nxs", "NEXAFS")
+    cmd = [sys.executable, "-m", "B07nxs2txt", str(path.parent), "-j", "1"]
+    subprocess.check_call(cmd + ["--format", "npz"], stdout=subprocess.DEVNULL)
+    assert not (path.parent / "b07-1_NEXAFS.dat").exists()
+    assert (path.parent / "b07-1_NEXAFS.npz").exists()
+
+    # Adding a format converts the file again rather than skipping it
+    output = subprocess.check_output(
+        cmd + ["--format", "npz", "--format", "dat"]
+    ).decode()
+    assert "NUMBER OF UP TO DATE FILES SKIPPED: 0" in output
+    assert (path.parent / "b07-1_NEXAFS.dat").exists()
+    output = subprocess.check_output(
+        cmd + ["--format", "npz", "--format", "dat"]
+    ).decode()
+    assert "NUMBER OF UP TO DATE FILES SKIPPED: 1" in output